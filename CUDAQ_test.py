@@ -1,16 +1,84 @@
 #!/usr/bin/env python3
 # quantum_data_processor.py - Process quantum simulation data and generate visualizations
+#
+# Subcommands (heavy modules are imported only by the subcommand that needs them):
+#   stats     - statistics only (text or --format json); numpy only, no matplotlib
+#   plot      - statistics plus the scaling plot (default when no subcommand is given); imports matplotlib
+#   benchmark - reproducible qubit sweep (qubit_benchmark.py; one subprocess per point, resumable results)
+#   startup   - startup time of `stats --format json` with an -X importtime breakdown, checked against a budget
+# stats and plot read benchmark results with --results (bundled sample data otherwise).
 
 import argparse
+import json
 import logging
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.interpolate import interp1d
 import os
 import time
 from datetime import datetime
 import sys
 
+COMMANDS = ('stats', 'plot', 'benchmark', 'startup')
+# Startup budget (seconds) for `stats --format json` and the packages it must not import
+STARTUP_BUDGET_S = 0.5
+STATS_FORBIDDEN_MODULES = ('matplotlib', 'scipy', 'pandas', 'cudaq')
+# Result columns that can be plotted (see qubit_benchmark.RESULT_FIELDS)
+TIME_METRICS = ('execute_median_s', 'execute_p95_s', 'execute_min_s', 'compile_s', 'first_execute_s')
+
+# Sample data (seconds per run, CUDA-Q TensorNet on a standard PC), used when no --results file is given
+SAMPLE_DATA = [
+    (15, 1.1619),
+    (20, 1.5478),
+    (25, 13.3674),
+    (30, 14.7032),
+    (35, 15.4942),
+    (40, 22.5259),
+    (45, 29.9186),
+    (50, 38.2380),
+    (55, 39.3430),
+    (60, 34.7131),
+    (65, 44.5665),
+    (70, 45.2972),
+    (75, 66.2575),
+    (100, 100.2035),
+    (105, 97.2727),
+    (110, 114.7073),
+    (115, 121.1994),
+    (120, 119.1005),
+    (125, 135.8521),
+    (130, 137.0796),
+    (135, 154.6344),
+    (140, 154.9358),
+    (145, 177.2134),
+    (150, 172.9061),
+    (155, 177.3675),
+    (160, 205.8219),
+    (165, 202.7780),
+    (170, 227.8775),
+    (175, 246.0370),
+    (180, 245.0758),
+    (185, 265.7693),
+    (190, 268.5873),
+    (195, 305.8181),
+    (200, 308.9299),
+    (300, 570.8864),
+    (350, 828.6885),
+    (400, 1111.2337),
+    (450, 1380.9539),
+    (500, 1675.3307),
+    (550, 1942.1153),
+    (600, 2154.4481),
+    (650, 2524.4808),
+    (700, 2923.8830),
+    (750, 3515.5221),
+    (800, 4145.7131),
+    (850, 4673.0538),
+    (900, 5220.9250),
+    (950, 5893.7584),
+    (1000, 6480.2444),
+    (1050, 7120.5210),
+    (1100, 7619.0218)
+]
+
 def setup_logging(log_level):
     """Configure logging with specified log level"""
     log_format = '%(asctime)s - %(levelname)s - %(message)s'
@@ -28,89 +96,91 @@ def get_timestamp():
     """Generate a timestamp string in YYYYMMDD_HHMMSS format"""
     return datetime.now().strftime("%Y%m%d_%H%M%S")
 
-def parse_arguments():
+def parse_arguments(argv=None):
     """Parse and validate command line arguments"""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Backwards compatible: no subcommand means `plot`
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ('-h', '--help')):
+        argv = ['plot'] + argv
+
     parser = argparse.ArgumentParser(description='Process quantum simulation data and generate visualizations')
-    parser.add_argument('--output-dir', type=str, default='output', 
-                        help='Directory to save output files (default: output)')
-    parser.add_argument('--plot-title', type=str, default='CUDA-Q TensorNet Backend: Scaling to 1100 Qubits',
-                        help='Title for the generated plot')
-    parser.add_argument('--log-level', type=str, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+    subparsers = parser.add_subparsers(dest='command', metavar='{stats,plot,benchmark,startup}')
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--log-level', type=str, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                         default='INFO', help='Set the logging level')
-    parser.add_argument('--show-inset', action='store_true', 
-                        help='Enable the inset subplot for small qubit counts')
-    parser.add_argument('--dpi', type=int, default=300,
-                        help='DPI for saved images (default: 300)')
-    parser.add_argument('--fig-width', type=float, default=14,
-                        help='Figure width in inches (default: 14)')
-    parser.add_argument('--fig-height', type=float, default=10,
-                        help='Figure height in inches (default: 10)')
-    
-    return parser.parse_args()
 
-def load_data():
-    """Load sample quantum simulation data"""
-    logging.info("Loading quantum simulation data")
-    
-    data = [
-        (15, 1.1619),
-        (20, 1.5478),
-        (25, 13.3674),
-        (30, 14.7032),
-        (35, 15.4942),
-        (40, 22.5259),
-        (45, 29.9186),
-        (50, 38.2380),
-        (55, 39.3430),
-        (60, 34.7131),
-        (65, 44.5665),
-        (70, 45.2972),
-        (75, 66.2575),
-        (100, 100.2035),
-        (105, 97.2727),
-        (110, 114.7073),
-        (115, 121.1994),
-        (120, 119.1005),
-        (125, 135.8521),
-        (130, 137.0796),
-        (135, 154.6344),
-        (140, 154.9358),
-        (145, 177.2134),
-        (150, 172.9061),
-        (155, 177.3675),
-        (160, 205.8219),
-        (165, 202.7780),
-        (170, 227.8775),
-        (175, 246.0370),
-        (180, 245.0758),
-        (185, 265.7693),
-        (190, 268.5873),
-        (195, 305.8181),
-        (200, 308.9299),
-        (300, 570.8864),
-        (350, 828.6885),
-        (400, 1111.2337),
-        (450, 1380.9539),
-        (500, 1675.3307),
-        (550, 1942.1153),
-        (600, 2154.4481),
-        (650, 2524.4808),
-        (700, 2923.8830),
-        (750, 3515.5221),
-        (800, 4145.7131),
-        (850, 4673.0538),
-        (900, 5220.9250),
-        (950, 5893.7584),
-        (1000, 6480.2444),
-        (1050, 7120.5210),
-        (1100, 7619.0218)
-    ]
+    data_source = argparse.ArgumentParser(add_help=False)
+    data_source.add_argument('--results', type=str, default=None,
+                             help='Benchmark result file (.json or .csv) from the benchmark subcommand '
+                                  '(default: bundled sample data)')
+    data_source.add_argument('--metric', choices=TIME_METRICS, default='execute_median_s',
+                             help='Result column used as the time (default: execute_median_s)')
+
+    stats_parser = subparsers.add_parser('stats', parents=[common, data_source],
+                                         help='Print statistics only (does not import matplotlib)')
+    stats_parser.add_argument('--format', choices=['text', 'json'], default='text', help='Output format')
+
+    plot_parser = subparsers.add_parser('plot', parents=[common, data_source], help='Generate the scaling plot and statistics')
+    plot_parser.add_argument('--output-dir', type=str, default='output', 
+                             help='Directory to save output files (default: output)')
+    plot_parser.add_argument('--plot-title', type=str, default='CUDA-Q TensorNet Backend: Scaling to 1100 Qubits',
+                             help='Title for the generated plot')
+    plot_parser.add_argument('--show-inset', action='store_true', 
+                             help='Enable the inset subplot for small qubit counts')
+    plot_parser.add_argument('--dpi', type=int, default=300,
+                             help='DPI for saved images (default: 300)')
+    plot_parser.add_argument('--fig-width', type=float, default=14,
+                             help='Figure width in inches (default: 14)')
+    plot_parser.add_argument('--fig-height', type=float, default=10,
+                             help='Figure height in inches (default: 10)')
+
+    bench_parser = subparsers.add_parser('benchmark', parents=[common],
+                                         help='Run the qubit sweep (one subprocess per point, resumable results)')
+    if argv[0] == 'benchmark':
+        # Only the benchmark subcommand loads the runner and its options
+        from qubit_benchmark import add_sweep_arguments
+        add_sweep_arguments(bench_parser)
+
+    startup_parser = subparsers.add_parser('startup', parents=[common],
+                                           help='Measure startup time of `stats --format json`')
+    startup_parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_S,
+                                help=f'Startup time budget in seconds (default: {STARTUP_BUDGET_S})')
+    startup_parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs (default: 5)')
+    startup_parser.add_argument('--top', type=int, default=10, help='Number of packages in the import breakdown')
+    startup_parser.add_argument('--format', choices=['text', 'json'], default='text', help='Output format')
+    
+    return parser.parse_args(argv)
+
+def load_data(results_path=None, metric='execute_median_s'):
+    """
+    Load (qubits, seconds) points from a qubit_benchmark result file (.json or .csv; successful points only),
+    or the bundled sample data when no results file is given
+    """
+    if results_path is None:
+        logging.info("Loading sample quantum simulation data")
+        data = list(SAMPLE_DATA)
+    else:
+        from qubit_benchmark import read_results
+
+        logging.info(f"Loading benchmark results from {results_path} ({metric})")
+        points = [p for p in read_results(results_path) if p["status"] == "ok" and p.get(metric) is not None]
+        if not points:
+            raise ValueError(f"No successful benchmark points in {results_path}")
+        data = [(p["qubits"], p[metric]) for p in points]
     
     qubits, times = zip(*data)
     return np.array(qubits), np.array(times), data
 
+def fit_polynomial(qubits, times):
+    """Quadratic fit of qubit count as a function of execution time"""
+    logging.info("Calculating polynomial fit")
+    return np.poly1d(np.polyfit(times, qubits, 2))
+
 def create_visualization(qubits, times, data, args):
     """Create visualization of quantum simulation data"""
+    import matplotlib.pyplot as plt
+
     logging.info("Creating visualization")
     
     plt.figure(figsize=(args.fig_width, args.fig_height))
@@ -175,8 +245,7 @@ def create_visualization(qubits, times, data, args):
     # Calculate polynomial fit
     current_step += 1
     logging.info(f"Progress: {current_step}/{total_steps} - Calculating polynomial fit")
-    z = np.polyfit(times, qubits, 2)
-    p = np.poly1d(z)
+    p = fit_polynomial(qubits, times)
     
     # Create points for the fitted curve
     x_fit = np.linspace(0, max(times)*1.1, 1000)
@@ -214,12 +283,12 @@ def calculate_statistics(qubits, times, data, p):
     stats = {}
     stats["max_qubits"] = max(qubits)
     
-    # Find time to simulate 1000 qubits
-    idx_1000 = qubits.tolist().index(1000)
-    stats["time_1000_qubits"] = times[idx_1000]/60  # in minutes
+    # Find time to simulate 1000 qubits (None when the sweep did not reach it)
+    qubit_list = qubits.tolist()
+    stats["time_1000_qubits"] = times[qubit_list.index(1000)]/60 if 1000 in qubit_list else None  # in minutes
     
-    # Calculate time ratios
-    special_points = [100, 500, 1000, 1100]
+    # Calculate time ratios between the special points present in the data
+    special_points = [q for q in [100, 500, 1000, 1100] if q in qubit_list]
     scaling_ratios = []
     
     for i in range(len(special_points)-1):
@@ -252,6 +321,47 @@ def calculate_statistics(qubits, times, data, p):
     
     return stats
 
+def format_statistics(stats):
+    """Render statistics as the plain-text report"""
+    lines = [
+        "QUANTUM SIMULATION STATISTICS",
+        "============================",
+        "",
+        f"Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        "",
+        "Key Statistics:",
+        f"Maximum qubit count: {stats['max_qubits']} qubits",
+        (f"Time to simulate 1000 qubits: {stats['time_1000_qubits']:.2f} minutes"
+         if stats['time_1000_qubits'] is not None else "Time to simulate 1000 qubits: not measured"),
+        "",
+        "Time increase ratios:",
+    ]
+    for q1, q2, qbit_ratio, time_ratio in stats["scaling_ratios"]:
+        lines.append(f"From {q1} to {q2} qubits ({qbit_ratio:.1f}x qubits): Time increased by {time_ratio:.2f}x")
+    
+    lines += ["", "Qubit scaling estimates:"]
+    for minutes, qubits, extrapolated in stats["time_estimates"]:
+        if extrapolated:
+            lines.append(f"{minutes} minutes: ~{qubits} qubits (extrapolated)")
+        else:
+            lines.append(f"{minutes} minutes: ~{qubits} qubits")
+    return "\n".join(lines) + "\n"
+
+def statistics_to_json(stats):
+    """Statistics as a JSON-serialisable dict (NumPy scalars converted to Python types)"""
+    return {
+        "max_qubits": int(stats["max_qubits"]),
+        "time_1000_qubits_min": None if stats["time_1000_qubits"] is None else float(stats["time_1000_qubits"]),
+        "scaling_ratios": [
+            {"from_qubits": int(q1), "to_qubits": int(q2), "qubit_ratio": float(qr), "time_ratio": float(tr)}
+            for q1, q2, qr, tr in stats["scaling_ratios"]
+        ],
+        "time_estimates": [
+            {"minutes": minutes, "qubits": int(qubits), "extrapolated": extrapolated}
+            for minutes, qubits, extrapolated in stats["time_estimates"]
+        ],
+    }
+
 def save_outputs(plt, stats, args):
     """Save visualization and statistics to output directory"""
     timestamp = get_timestamp()
@@ -269,148 +379,86 @@ def save_outputs(plt, stats, args):
     logging.info(f"Saving statistics to {stats_path}")
     
     with open(stats_path, 'w') as f:
-        f.write("QUANTUM SIMULATION STATISTICS\n")
-        f.write("============================\n\n")
-        
-        f.write(f"Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-        
-        f.write("Key Statistics:\n")
-        f.write(f"Maximum qubit count: {stats['max_qubits']} qubits\n")
-        f.write(f"Time to simulate 1000 qubits: {stats['time_1000_qubits']:.2f} minutes\n\n")
-        
-        f.write("Time increase ratios:\n")
-        for q1, q2, qbit_ratio, time_ratio in stats["scaling_ratios"]:
-            f.write(f"From {q1} to {q2} qubits ({qbit_ratio:.1f}x qubits): Time increased by {time_ratio:.2f}x\n")
-        
-        f.write("\nQubit scaling estimates:\n")
-        for minutes, qubits, extrapolated in stats["time_estimates"]:
-            if extrapolated:
-                f.write(f"{minutes} minutes: ~{qubits} qubits (extrapolated)\n")
-            else:
-                f.write(f"{minutes} minutes: ~{qubits} qubits\n")
+        f.write(format_statistics(stats))
     
     return plot_path, stats_path
 
-def main():
+def run_stats(args):
+    """stats subcommand: numbers only, no plotting libraries"""
+    qubits, times, data = load_data(args.results, args.metric)
+    stats = calculate_statistics(qubits, times, data, fit_polynomial(qubits, times))
+    if args.format == 'json':
+        json.dump(statistics_to_json(stats), sys.stdout, indent=2)
+        print()
+    else:
+        print(format_statistics(stats), end="")
+    return 0
+
+def run_plot(args):
+    """plot subcommand: plot and statistics saved to the output directory"""
+    # Ensure output directory exists
+    ensure_output_dir(args.output_dir)
+    
+    # Load data
+    qubits, times, data = load_data(args.results, args.metric)
+    
+    # Create visualization
+    plt_obj, poly_fit = create_visualization(qubits, times, data, args)
+    
+    # Calculate statistics
+    stats = calculate_statistics(qubits, times, data, poly_fit)
+    
+    # Save outputs
+    plot_path, stats_path = save_outputs(plt_obj, stats, args)
+    
+    logging.info(f"Generated files:")
+    logging.info(f"  - Plot: {plot_path}")
+    logging.info(f"  - Statistics: {stats_path}")
+    return 0
+
+def run_benchmark(args):
+    """benchmark subcommand: see qubit_benchmark.py (only this subcommand imports the backend, e.g. cudaq)"""
+    from qubit_benchmark import sweep_from_args
+    return sweep_from_args(args)
+
+def run_startup(args):
+    """startup subcommand: startup time and import breakdown of `stats --format json`"""
+    from startup_benchmark import measure_startup, print_report, python_command
+
+    command = python_command(os.path.abspath(__file__), 'stats', '--format', 'json', '--log-level', 'WARNING')
+    report = measure_startup(command, repeat=args.repeat, budget=args.budget, forbidden=STATS_FORBIDDEN_MODULES,
+                             top=args.top)
+    if args.format == 'json':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+    return 0 if report['passed'] else 1
+
+def main(argv=None):
     """Main function to process data and generate outputs"""
     start_time = time.time()
     
     # Parse command line arguments
-    args = parse_arguments()
+    args = parse_arguments(argv)
     
     # Setup logging
     logger = setup_logging(getattr(logging, args.log_level))
-    logger.info("Starting quantum data processing")
+    logger.info(f"Starting quantum data processing ({args.command})")
     
+    handlers = {'stats': run_stats, 'plot': run_plot, 'benchmark': run_benchmark, 'startup': run_startup}
     try:
-        # Ensure output directory exists
-        ensure_output_dir(args.output_dir)
-        
-        # Load data
-        qubits, times, data = load_data()
-        
-        # Create visualization
-        plt_obj, poly_fit = create_visualization(qubits, times, data, args)
-        
-        # Calculate statistics
-        stats = calculate_statistics(qubits, times, data, poly_fit)
-        
-        # Save outputs
-        plot_path, stats_path = save_outputs(plt_obj, stats, args)
+        result = handlers[args.command](args)
         
         # Report success
         elapsed_time = time.time() - start_time
         logger.info(f"Processing completed successfully in {elapsed_time:.2f} seconds")
-        logger.info(f"Generated files:")
-        logger.info(f"  - Plot: {plot_path}")
-        logger.info(f"  - Statistics: {stats_path}")
-        
-        return 0
+        return result
         
     except Exception as e:
         logger.error(f"Error during processing: {str(e)}", exc_info=True)
         return 1
 
+
 if __name__ == "__main__":
     sys.exit(main())
-
-
-import sys
-import cudaq
-import time
-
-def test_tensornet(qubits):
-    """測試 TensorNet 後端對特定量子比特數的性能"""
-    try:
-        # 設置 TensorNet 後端
-        cudaq.set_target("tensornet")
-
-        # 創建測試電路
-        @cudaq.kernel
-        def circuit():
-            q = cudaq.qvector(qubits)
-            h(q[0])
-            for i in range(1, qubits):
-                x.ctrl(q[0], q[i])
-            mz(q)
-
-        # 記錄起始時間
-        start_time = time.time()
-
-        # 執行測試
-        result = cudaq.sample(circuit)
-
-        # 記錄結束時間
-        end_time = time.time()
-        exec_time = end_time - start_time
-
-        return {
-            "success": True,
-            "exec_time": exec_time,
-            "result": str(result)
-        }
-
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e)
-        }
-
-# 定義量子比特範圍
-start_qubits = 100
-max_qubits = 200
-step = 5
-
-# 顯示測試信息
-print("\n===== CUDA-Q TensorNet 後端擴展性測試 =====")
-print(f"測試範圍: {start_qubits} 到 {max_qubits} 量子比特，步長 {step}")
-
-# 顯示表格標題
-print("\n{:<10} | {:<15} | {:<20}".format(
-    "量子比特數", "執行時間(秒)", "結果"
-))
-print("-" * 50)
-
-# 循環測試不同的量子比特數
-for qubits in range(start_qubits, max_qubits + 1, step):
-    print(f"測試 {qubits} 量子比特...", end="", flush=True)
-
-    # 運行測試
-    result = test_tensornet(qubits)
-
-    if result["success"]:
-        print(f" 成功! 時間: {result['exec_time']:.4f}秒")
-        print("{:<10} | {:<15} | {:<20}".format(
-            qubits,
-            f"{result['exec_time']:.4f}",
-            result['result'][:17] + "..." if len(result['result']) > 20 else result['result']
-        ))
-    else:
-        print(f" 失敗! 錯誤: {result['error']}")
-        print("{:<10} | {:<15} | {:<20}".format(
-            qubits,
-            "失敗",
-            f"錯誤: {str(result['error'])[:17]}..."
-        ))
-
-print("\n測試完成!")
@@ -1,166 +1,446 @@
-import socket
 import time
 import argparse
 import multiprocessing
-import struct
 import os
-import dpkt
+import signal
+
+from loopback_harness import LoopbackError, run_loopback_test
+from metrics_export import METRICS_FORMATS, MetricsExporter
+from lidar_packet import PARTITION_UNITS, aligned_count, partition_corpus
+from compiled_corpus import open_corpus
+from scenario_runner import SWEEP_PROFILES, run_sweep
+from replay_timing import ReplaySchedule, parse_replay_timing, wait_until
+from send_targets import FanoutScheduler, SendTarget, parse_target
+from sender_stats import BYTES, SEND_ERRORS, PacingHistograms, WorkerCounters
+from shared_corpus import SharedPacketCorpus
+from pcap_stream import PcapStream
+from rate_governor import GovernorController, RateGovernor
+from synthetic_source import SYNTHETIC_ECHOES, SYNTHETIC_SCENES, SyntheticLidarSource
+from udp_send_engine import (RETRYABLE_ERRNOS, SEND_BACKENDS, create_sender, create_socket,
+                             run_benchmark)
+
+def positive_float(text):
+    """大於 0 的秒數 (argparse 型別)"""
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的數值 '{text}'")
+    if not value > 0:
+        raise argparse.ArgumentTypeError(f"必須大於 0: '{text}'")
+    return value
 
 # 設定參數
 parser = argparse.ArgumentParser(description="PCAP File UDP Packet Sender")
-parser.add_argument("--mbps", type=float, default=150.0, help="目標傳輸速率 (MB/s)")
+parser.add_argument("--mbps", type=float, default=150.0, help="目標傳輸速率 (MB/s)，未指定速率的 --target 沿用此值")
+parser.add_argument("--target", type=parse_target, action="append", dest="targets",
+                    metavar="IP:PORT[@MB/s][,echo=1st|2nd][,type=upper|lower]",
+                    help="發送目標，可重複指定以同時餵給多個接收端 (預設 192.168.48.20:7000)")
 parser.add_argument("--processes", type=int, default=8, help="使用多少個獨立進程 (CPU 核心)")
-parser.add_argument("--pcap", type=str, default="input/bu25_no6_20250319.pcap", help="PCAP 檔案路徑")
+parser.add_argument("--pcap", type=str, default="input/bu25_no6_20250319.pcap", help="PCAP 檔案或編譯語料 (compiled_corpus.py 產生) 路徑")
+parser.add_argument("--rebuild-index", action="store_true", help="忽略既有的索引旁路檔並重新建立")
+parser.add_argument("--stream", action="store_true",
+                    help="以背景預讀串流讀取 PCAP / PCAPNG (不建立索引、記憶體用量固定，立即開始發送)；"
+                         "--partition lines / frames 時各進程分到檔案中互不重疊的一段")
+parser.add_argument("--shared-memory", action="store_true",
+                    help="將封包負載壓緊複製到單一共享記憶體區塊，所有進程共用")
+parser.add_argument("--partition", choices=PARTITION_UNITS, default="none",
+                    help="工作分割: none (每個進程送完整語料), lines / frames (各進程分到互不重疊的連續掃描線 / 幀)")
+parser.add_argument("--backend", choices=SEND_BACKENDS, default="sendto",
+                    help="發送後端: sendto (逐封包), sendmmsg (批次系統呼叫), gso (UDP GSO)")
+parser.add_argument("--no-governor", action="store_true",
+                    help="停用所有進程共用的閉迴路速率調節器，改為各進程各自以 1/N 速率排程")
+parser.add_argument("--batch-size", type=int, default=64, help="sendmmsg / gso 每次系統呼叫的封包數")
+parser.add_argument("--benchmark", action="store_true", help="在迴路介面上測試各發送後端後結束")
+parser.add_argument("--benchmark-seconds", type=float, default=3.0, help="每個後端的基準測試秒數")
+parser.add_argument("--loopback-test", action="store_true",
+                    help="在 127.0.0.1 上啟動替身接收端，量測各目標速率下的遺失、亂序、重複與延遲後結束")
+parser.add_argument("--loopback-rates", type=str, default="10,50,100,150",
+                    help="迴路測試的目標速率清單 (MB/s，以逗號分隔)")
+parser.add_argument("--loopback-seconds", type=float, default=3.0, help="迴路測試每個速率的秒數")
+parser.add_argument("--sweep", choices=SWEEP_PROFILES,
+                    help="在迴路介面上執行飽和掃描 (ramp 線性斜坡 / step 階梯 / burst 週期突發)，找到拐點後結束")
+parser.add_argument("--sweep-start", type=float, default=10.0, help="掃描起始速率 (MB/s，burst 為峰值)")
+parser.add_argument("--sweep-stop", type=float, default=300.0, help="掃描上限速率 (MB/s)")
+parser.add_argument("--sweep-step", type=float, default=10.0, help="每步增加的速率 (MB/s)")
+parser.add_argument("--sweep-seconds", type=float, default=3.0, help="每步的秒數")
+parser.add_argument("--loss-threshold", type=float, default=0.1, help="視為拐點的遺失率門檻 (%%)")
+parser.add_argument("--burst-period", type=float, default=0.1, help="burst 模式的週期 (秒)")
+parser.add_argument("--burst-duty", type=float, default=0.5, help="burst 模式中以峰值發送的時間比例")
+parser.add_argument("--burst-base", type=float, default=0.2, help="burst 模式非突發期間的速率 (峰值的比例)")
+parser.add_argument("--output", type=str, default="output", help="掃描結果與指標時間序列的輸出資料夾")
+parser.add_argument("--metrics-port", type=int, default=None,
+                    help="在 127.0.0.1 的此埠提供 Prometheus 格式的 /metrics 端點")
+parser.add_argument("--metrics-file", choices=METRICS_FORMATS, default=None,
+                    help="將每次取樣寫入 output 資料夾下帶時間戳的 CSV / JSONL 檔")
+parser.add_argument("--metrics-interval", type=positive_float, default=1.0, help="指標取樣間隔 (秒，可小於 1)")
+parser.add_argument("--synthetic", choices=SYNTHETIC_SCENES,
+                    help="不讀取 PCAP，改以合成封包串流發送 (sphere 球面 / room 房間 / random 隨機場景)")
+parser.add_argument("--synthetic-echo", choices=list(SYNTHETIC_ECHOES), default="dual", help="合成封包的回波組成")
+parser.add_argument("--synthetic-range", type=float, default=2000.0, help="合成場景的特徵距離 (距離原始值)")
+parser.add_argument("--synthetic-noise", type=float, default=0.0, help="距離的高斯雜訊標準差 (距離原始值)")
+parser.add_argument("--synthetic-dropout", type=float, default=0.0, help="遺失點 (距離 0) 的比例")
+parser.add_argument("--synthetic-invalid", type=float, default=0.0, help="魔數錯誤的無效封包比例")
+parser.add_argument("--replay-timing", type=parse_replay_timing, default=False, metavar="original|xN|max",
+                    help="依 PCAP 時間戳重播 (original 原速, xN N 倍速, max 不限速)，啟用時忽略 --mbps")
 args = parser.parse_args()
 
 # 設備的 IP 和埠 (目標 Android 設備)
 TARGET_IP = "192.168.48.20"
 TARGET_PORT = 7000
 
-# 共享變數，用來統計傳輸速率
-total_bytes_sent = multiprocessing.Value("L", 0)  # 64-bit 整數
-running = multiprocessing.Value("b", True)  # 共享布林值，用來控制程序終止
+# 未指定 --target 時使用上述預設目標
+targets = args.targets or [SendTarget(TARGET_IP, TARGET_PORT)]
+
+# 共享布林值，用來控制程序終止 (RawValue 不帶鎖，熱路徑讀取不會產生 futex 競爭)
+running = multiprocessing.RawValue("b", True)
 
 # 計算目標速率
 BYTES_PER_MB = 1024 * 1024
-target_rate_bps = args.mbps * BYTES_PER_MB  # 轉成 Bytes
+target_rates_bps = [(target.mbps or args.mbps) * BYTES_PER_MB for target in targets]  # 轉成 Bytes
+
+def create_synthetic_source(seed=0, first_line=0):
+    """依命令列參數建立合成封包串流來源"""
+    return SyntheticLidarSource(args.synthetic, args.synthetic_echo, scale=args.synthetic_range,
+                                noise=args.synthetic_noise, dropout=args.synthetic_dropout,
+                                invalid=args.synthetic_invalid, first_line=first_line, seed=seed)
 
-def read_pcap_packets(pcap_file):
-    """讀取 PCAP 檔案中的封包內容"""
-    packets = []
+def create_stream_source(process_id, verbose=True):
+    """依命令列參數建立串流 PCAP 來源；分割工作時各進程只讀取檔案中屬於自己的一段"""
+    start_byte, end_byte = 0, None
+    if args.partition != "none":
+        size = os.path.getsize(args.pcap)
+        start_byte = size * process_id // args.processes
+        end_byte = size * (process_id + 1) // args.processes
+    return PcapStream(args.pcap, start_byte, end_byte, verbose=verbose)
+
+def send_packets(process_id, counters, lag_histograms, governor, pcap_packets, partition):
+    """子進程依各目標的速率發送 PCAP 檔案中的 UDP 封包，並將統計資訊回報給主進程"""
+    if args.synthetic:
+        # 每個目標各自一個合成串流 (互不干擾的方位角進度)，各進程從不同的方位角開始
+        pcap_packets = [create_synthetic_source(seed=process_id * len(targets) + t,
+                                                first_line=process_id * 997)
+                        for t in range(len(targets))]
+    elif args.stream:
+        # 每個目標各自一個串流讀取 (各自的預讀執行緒與批次緩衝區)
+        pcap_packets = [create_stream_source(process_id, verbose=t == 0) for t in range(len(targets))]
+    if args.synthetic or args.stream:
+        # 串流來源每批整批發送並對齊掃描線，由排程器在換批時重新計算
+        partition = None
+        first_packet, end_packet = 0, len(pcap_packets[0])
+    else:
+        first_packet, end_packet, line_ends = partition
+    if end_packet <= first_packet:
+        print(f"進程 {process_id}: 沒有分配到封包可發送")
+        return
+    
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # 由主進程統一處理 Ctrl+C
+    
+    # 每個目標一個 socket 與發送後端，由同一個排程迴圈輪流驅動；
+    # 各目標的速率由共用令牌桶分配 (未啟用時由所有進程平分)
+    rates = [rate / args.processes for rate in target_rates_bps]
+    scheduler = FanoutScheduler(pcap_packets, targets, partition, rates, args.backend, args.batch_size, governor)
+    
+    # 本進程每個目標專屬的計數器槽位，無需加鎖
+    slots = [counters.slot(process_id * len(targets) + t) for t in range(len(targets))]
+    
+    if args.synthetic:
+        print(f"進程 {process_id}: 合成封包串流 (場景 {args.synthetic}, 回波 {args.synthetic_echo}), 每批 {end_packet} 個封包")
+    elif args.stream:
+        stream = pcap_packets[0]
+        print(f"進程 {process_id}: 串流讀取 {args.pcap} 字節範圍 [{stream.start_byte}, {stream.end_byte or os.path.getsize(args.pcap)})")
+    else:
+        print(f"進程 {process_id}: 平均封包大小 {pcap_packets.avg_packet_size:.2f} 字節, 封包範圍 [{first_packet}, {end_packet})")
+    for line in scheduler.describe():
+        print(f"進程 {process_id}:   → {line}")
+    
+    def on_wrap(target):
+        # 如果已經發送完所有封包，打印一條消息並從頭開始
+        print(f"進程 {process_id}: {target.label} 已發送完所有封包，從頭開始發送")
     
     try:
-        with open(pcap_file, 'rb') as f:
-            pcap = dpkt.pcap.Reader(f)
-            for ts, buf in pcap:
-                # 取得乙太網路封包
-                eth = dpkt.ethernet.Ethernet(buf)
-                
-                # 確保是 IP 封包
-                if isinstance(eth.data, dpkt.ip.IP):
-                    ip = eth.data
-                    
-                    # 確保是 UDP 封包
-                    if isinstance(ip.data, dpkt.udp.UDP):
-                        udp = ip.data
-                        
-                        # 取得 UDP 封包內容
-                        payload = bytes(udp.data)
-                        if payload:  # 確保不為空
-                            packets.append(payload)
-    except Exception as e:
-        print(f"讀取 PCAP 檔案時出錯: {e}")
-        return []
-    
-    print(f"從 PCAP 檔案讀取了 {len(packets)} 個封包")
-    return packets
+        scheduler.run(running, slots, on_wrap, lag_histograms, process_id)
+    finally:
+        scheduler.close()
+        if args.stream:
+            for source in pcap_packets:
+                source.close()
+            pcap_packets[0].report()
 
-def send_packets(process_id, shared_bytes, pcap_packets):
-    """子進程發送 PCAP 檔案中的 UDP 封包，並將統計資訊回報給主進程"""
-    if not pcap_packets:
-        print("沒有封包可發送")
+def replay_packets(process_id, counters, lag_histograms, pcap_packets, partition):
+    """子進程依 PCAP 時間戳重播封包，並記錄每個封包相對預定時刻的延遲"""
+    first_packet, end_packet, line_ends = partition
+    if end_packet <= first_packet:
+        print(f"進程 {process_id}: 沒有分配到封包可發送")
         return
     
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind(("0.0.0.0", 0))
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)  # 增加發送緩衝區
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # 由主進程統一處理 Ctrl+C
+    sock = create_socket(sndbuf=4 * 1024 * 1024)
+    sender = create_sender(args.backend, sock, pcap_packets, targets[0].address, args.batch_size)
     
-    local_bytes_sent = 0
-    packet_index = 0
-    total_packets = len(pcap_packets)
+    stats = counters.slot(process_id * len(targets))
+    packet_index = first_packet
     
-    # 計算每個封包的平均大小用於控制速率
-    avg_packet_size = sum(len(p) for p in pcap_packets) / total_packets
-    packets_per_second = target_rate_bps / (avg_packet_size * args.processes)
-    packet_interval = 1.0 / packets_per_second
+    multiplier = args.replay_timing
+    schedule = ReplaySchedule(pcap_packets.timestamps_ns, multiplier) if multiplier else None
+    if schedule is not None:
+        print(f"進程 {process_id}: 依時間戳重播, 倍率 x{multiplier:g}, 每輪 {schedule.period:.3f} 秒, 後端 {sender.name}")
+    else:
+        print(f"進程 {process_id}: 不限速重播, 後端 {sender.name}")
     
-    print(f"進程 {process_id}: 平均封包大小 {avg_packet_size:.2f} 字節, 間隔 {packet_interval * 1_000_000:.2f} µs")
+    # 各進程的時刻都相對於整份語料的第一個封包，分割模式下合起來就是原始的時間序列
+    start_time = time.perf_counter()
+    loop_start = start_time  # 本輪重播的起點
     
     while running.value:
-        start_time = time.perf_counter()
-        
-        # 取得當前要發送的封包
-        packet = pcap_packets[packet_index]
-        packet_size = len(packet)
+        count = aligned_count(line_ends, packet_index, min(sender.batch_size, end_packet - packet_index))
         
-        # 發送封包
-        sock.sendto(packet, (TARGET_IP, TARGET_PORT))
-        local_bytes_sent += packet_size
+        if schedule is not None:
+            # 等到下一個封包的預定時刻，並把同時到期的封包合併成一批
+            if not wait_until(loop_start + schedule.offsets[packet_index]):
+                stats.add_pacing_overrun()
+            send_time = time.perf_counter()
+            count = schedule.due_count(packet_index, send_time - loop_start, count)
+            count = aligned_count(line_ends, packet_index, count)
         
-        # 更新總計數
-        with shared_bytes.get_lock():
-            shared_bytes.value += packet_size
+        try:
+            sent_packets, packet_size = sender.send(packet_index, count)
+        except OSError as e:
+            if e.errno not in RETRYABLE_ERRNOS:
+                raise
+            stats.add_send_error()
+            continue
         
-        # 移到下一個封包，如果到達結尾則重新開始
-        packet_index = (packet_index + 1) % total_packets
-        
-        # 如果已經發送完所有封包，打印一條消息並從頭開始
-        if packet_index == 0:
-            print(f"進程 {process_id}: 已發送完所有封包，從頭開始發送")
+        stats.add_sent(sent_packets, packet_size)
+        if schedule is not None:
+            deadlines = loop_start + schedule.offsets[packet_index:packet_index + sent_packets]
+            lag_histograms.record(process_id, send_time - deadlines)
         
-        # 控制發送間隔，確保不超過目標速率
-        elapsed_time = time.perf_counter() - start_time
-        sleep_time = max(0, packet_interval - elapsed_time)
-        time.sleep(sleep_time)
+        # 移到下一個封包，如果到達結尾則從頭開始下一輪
+        packet_index += sent_packets
+        if packet_index >= end_packet:
+            packet_index = first_packet
+            print(f"進程 {process_id}: 已重播完所有封包，從頭開始發送")
+            loop_start = loop_start + schedule.period if schedule is not None else time.perf_counter()
 
-def monitor_speed(shared_bytes):
-    """主進程監測傳輸速率"""
+def report_replay_lateness(lag_histograms):
+    """列印時序誤差 (lateness) 的分佈 (固定速率模式以批次、重播模式以封包為單位)"""
+    total = int(lag_histograms.counts().sum())
+    result = lag_histograms.percentiles([50, 90, 99, 99.9, 100])
+    if result is None:
+        print("⏱️ 沒有時序誤差樣本")
+        return
+    p50, p90, p99, p999, worst = result
+    print(f"⏱️ 時序誤差 (共 {total} 個樣本): p50 {p50:.0f} µs, p90 {p90:.0f} µs, "
+          f"p99 {p99:.0f} µs, p99.9 {p999:.0f} µs, 最大 ≥{worst:.0f} µs")
+    for worker_id in range(lag_histograms.num_workers):
+        worker = lag_histograms.percentiles([50, 99], worker_id)
+        if worker is not None:
+            print(f"   進程 {worker_id}: p50 {worker[0]:.0f} µs, p99 {worker[1]:.0f} µs")
+
+def monitor_speed(counters, lag_histograms, governor):
+    """主進程監測傳輸速率 (不加鎖地加總各進程的計數器槽位)，並依設定輸出指標"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    exporter = None
+    if args.metrics_port is not None or args.metrics_file:
+        exporter = MetricsExporter(counters, lag_histograms, args.processes, [t.label for t in targets],
+                                   port=args.metrics_port, series_format=args.metrics_file, output_dir=args.output)
+        if exporter.address is not None:
+            print(f"📊 Prometheus 指標: http://{exporter.address[0]}:{exporter.address[1]}/metrics")
+        if exporter.series_path is not None:
+            print(f"📊 指標時間序列: {exporter.series_path} (每 {args.metrics_interval:g} 秒)")
     start_time = time.perf_counter()
+    last_time = start_time
+    next_print = start_time + 1
     last_bytes = 0
+    last_packets = 0
+    last_target_bytes = [0] * len(targets)
 
     while running.value:
-        time.sleep(1)  # 每秒更新一次
+        if exporter is None:
+            time.sleep(1)  # 每秒更新一次
+        else:
+            # 依取樣間隔更新指標，終端機輸出仍維持每秒一次
+            time.sleep(args.metrics_interval)
+            exporter.sample()
+            if time.perf_counter() < next_print:
+                continue
         current_time = time.perf_counter()
+        next_print = current_time + 1
         elapsed_time = current_time - start_time
+        # 兩次輸出的實際間隔 (取樣間隔不整除 1 秒或睡眠延遲時不一定剛好 1 秒)
+        interval = current_time - last_time
+        last_time = current_time
+        
+        totals = counters.totals()
+        current_bytes = totals["bytes"]
+        bytes_since_last = current_bytes - last_bytes
+        mbps_actual = bytes_since_last / (1024 * 1024) / interval  # 當前 MB/s
+        mbps_avg = (current_bytes / (1024 * 1024)) / elapsed_time  # 平均 MB/s
+        pps_actual = (totals["packets"] - last_packets) / interval
+        
+        print(f"📡 總計已發送: {current_bytes/(1024*1024):.2f} MB, 當前速率: {mbps_actual:.2f} MB/s, "
+              f"平均速率: {mbps_avg:.2f} MB/s, {pps_actual:.0f} pkt/s, "
+              f"發送錯誤: {totals['send_errors']}, 節拍落後: {totals['pacing_overruns']}"
+              + (f", 補充速率 x{governor.rate(0) / governor.target_rate(0):.3f}"
+                 if governor is not None and len(targets) == 1 else ""))
+        last_bytes = current_bytes
+        last_packets = totals["packets"]
         
-        with shared_bytes.get_lock():
-            current_bytes = shared_bytes.value
-            bytes_since_last = current_bytes - last_bytes
-            mbps_actual = (bytes_since_last / (1024 * 1024))  # 每秒 MB
-            mbps_avg = (current_bytes / (1024 * 1024)) / elapsed_time  # 平均 MB/s
-            
-            print(f"📡 總計已發送: {current_bytes/(1024*1024):.2f} MB, 當前速率: {mbps_actual:.2f} MB/s, 平均速率: {mbps_avg:.2f} MB/s")
-            last_bytes = current_bytes
+        # 多目標時逐一列出各目標的速率 (槽位依 進程 × 目標 排列)
+        if len(targets) > 1:
+            per_target = counters.snapshot().reshape(args.processes, len(targets), -1).sum(axis=0)
+            for t, target in enumerate(targets):
+                target_bytes = int(per_target[t, BYTES])
+                print(f"   ↳ {target.label}: 當前 {(target_bytes - last_target_bytes[t]) / BYTES_PER_MB / interval:.2f} MB/s "
+                      f"(目標 {target_rates_bps[t] / BYTES_PER_MB:.2f}), 平均 {target_bytes / BYTES_PER_MB / elapsed_time:.2f} MB/s, "
+                      f"發送錯誤: {int(per_target[t, SEND_ERRORS])}"
+                      + (f", 補充速率 x{governor.rate(t) / governor.target_rate(t):.3f}" if governor is not None else ""))
+                last_target_bytes[t] = target_bytes
+    
+    if exporter is not None:
+        exporter.sample()
+        exporter.close()
 
 if __name__ == "__main__":
-    pcap_file = args.pcap
+    if args.synthetic:
+        if args.replay_timing is not False:
+            print("錯誤：合成封包串流不支援依時間戳重播")
+            exit(1)
+        pcap_packets = create_synthetic_source()
+        print(f"🧪 使用合成封包串流: 場景 {args.synthetic}, 回波 {args.synthetic_echo}, 每批 {len(pcap_packets)} 個封包")
+    else:
+        pcap_file = args.pcap
+        
+        # 檢查檔案是否存在
+        if not os.path.exists(pcap_file):
+            print(f"錯誤：找不到 PCAP 檔案 '{pcap_file}'")
+            exit(1)
+        if args.stream and args.replay_timing is not False:
+            print("錯誤：串流讀取不支援依時間戳重播")
+            exit(1)
+        
+        print(f"⚡ 讀取 PCAP 檔案: {pcap_file}")
+        try:
+            if args.stream:
+                # 只讀第一批確認格式；基準 / 迴路測試直接使用這個串流
+                pcap_packets = PcapStream(pcap_file)
+            else:
+                pcap_packets = open_corpus(pcap_file, rebuild=args.rebuild_index)
+        except (OSError, ValueError) as e:
+            print(f"讀取 PCAP 檔案時出錯: {e}")
+            exit(1)
+        if args.stream:
+            print(f"📼 串流讀取: 第一批 {len(pcap_packets)} 個封包，其餘由背景執行緒預讀")
+        else:
+            print(f"從 PCAP 檔案讀取了 {len(pcap_packets)} 個封包")
+        
+        if len(pcap_packets) == 0:
+            print("錯誤：PCAP 檔案中沒有找到有效的 UDP 封包")
+            exit(1)
     
-    # 檢查檔案是否存在
-    if not os.path.exists(pcap_file):
-        print(f"錯誤：找不到 PCAP 檔案 '{pcap_file}'")
-        exit(1)
+    if args.shared_memory and not (args.synthetic or args.stream):
+        pcap_corpus = pcap_packets
+        pcap_packets = SharedPacketCorpus.from_corpus(pcap_corpus)
+        pcap_corpus.close()
+        print(f"🧠 已將 {pcap_packets.total_bytes / BYTES_PER_MB:.2f} MB 負載載入共享記憶體")
+    
+    if args.benchmark:
+        run_benchmark(pcap_packets, duration=args.benchmark_seconds, batch_size=args.batch_size)
+        pcap_packets.close()
+        exit(0)
     
-    print(f"⚡ 讀取 PCAP 檔案: {pcap_file}")
-    pcap_packets = read_pcap_packets(pcap_file)
+    if args.loopback_test:
+        rates = [float(rate) for rate in args.loopback_rates.split(",") if rate.strip()]
+        try:
+            run_loopback_test(pcap_packets, rates, args.loopback_seconds, TARGET_PORT, args.backend, args.batch_size)
+        except LoopbackError as e:
+            print(f"❌ 迴路測試中止: {e}")
+            pcap_packets.close()
+            exit(1)
+        pcap_packets.close()
+        exit(0)
     
-    if not pcap_packets:
-        print("錯誤：PCAP 檔案中沒有找到有效的 UDP 封包")
+    if args.sweep:
+        run_sweep(pcap_packets, args.sweep, args.sweep_start, args.sweep_stop, args.sweep_step,
+                  args.sweep_seconds, TARGET_PORT, args.backend, args.batch_size,
+                  loss_threshold=args.loss_threshold, output_dir=args.output,
+                  burst_base=args.burst_base, burst_period=args.burst_period, burst_duty=args.burst_duty)
+        pcap_packets.close()
+        exit(0)
+    
+    if args.replay_timing is not False and len(targets) > 1:
+        print("錯誤：依時間戳重播時只支援單一 --target")
+        pcap_packets.close()
         exit(1)
     
-    print(f"⚡ 開始發送 PCAP 封包到 {TARGET_IP}:{TARGET_PORT}")
-    print(f"📦 目標速率: {args.mbps} MB/s")
+    for target in targets:
+        print(f"⚡ 開始發送 PCAP 封包到 {target.label}")
+    if args.replay_timing is False:
+        for target, rate in zip(targets, target_rates_bps):
+            print(f"📦 {target.label} 目標速率: {rate / BYTES_PER_MB:g} MB/s")
+    elif args.replay_timing is None:
+        print("📦 依 PCAP 順序不限速重播")
+    else:
+        print(f"📦 依 PCAP 時間戳重播, 倍率 x{args.replay_timing:g}")
     print(f"🖥️ 使用 {args.processes} 個獨立 CPU 進程發送封包")
-    print(f"🔄 設定為循環發送模式: 發送完所有封包後將從頭開始")
+    print("🔄 設定為循環發送模式: 發送完所有封包後將從頭開始")
+    
+    # 分配各進程負責的封包範圍
+    streaming = args.synthetic or args.stream
+    partitions = partition_corpus(pcap_packets, args.processes, "none" if streaming else args.partition)
+    if args.partition != "none" and not streaming:
+        shares = ", ".join(f"{hi - lo}" for lo, hi, _ in partitions)
+        print(f"🧩 依{'掃描線' if args.partition == 'lines' else '幀'}分割工作，各進程封包數: {shares}")
+    
+    if args.stream:
+        pcap_packets.close()  # 各進程自行開啟串流，主進程不再預讀
+    
+    # 每個進程的每個目標一個快取行對齊的計數器槽位
+    counters = WorkerCounters(args.processes * len(targets))
+    lag_histograms = PacingHistograms(args.processes)
+    
+    # 所有進程共用的令牌桶 (每個目標一個)，由主進程的回授控制器調整補充速率
+    governor = None
+    if args.replay_timing is False and not args.no_governor:
+        governor = RateGovernor(target_rates_bps)
+        print("🎛️ 啟用共用速率調節器: 各目標的總速率由所有進程共同維持")
     
     # 啟動發送封包的子進程
     processes = []
     for i in range(args.processes):
-        p = multiprocessing.Process(target=send_packets, args=(i, total_bytes_sent, pcap_packets))
+        if args.replay_timing is False:
+            p = multiprocessing.Process(target=send_packets, args=(i, counters, lag_histograms, governor, pcap_packets, partitions[i]))
+        else:
+            p = multiprocessing.Process(target=replay_packets, args=(i, counters, lag_histograms, pcap_packets, partitions[i]))
         p.daemon = True
         p.start()
         processes.append(p)
     
     # 啟動監測速率的進程
-    monitor = multiprocessing.Process(target=monitor_speed, args=(total_bytes_sent,))
+    monitor = multiprocessing.Process(target=monitor_speed, args=(counters, lag_histograms, governor))
     monitor.daemon = True
     monitor.start()
     
+    # 回授控制器在子進程都啟動後才開始 (背景執行緒不隨 fork 複製)
+    controller = GovernorController(governor, counters, args.processes).start() if governor is not None else None
+    
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         print("\n🛑 停止發送")
         running.value = False
-        for p in processes:
-            p.terminate()
-        monitor.terminate()
\ No newline at end of file
+        if controller is not None:
+            controller.stop()
+        for p in processes + [monitor]:
+            p.join(timeout=2)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        if args.replay_timing is not None:
+            report_replay_lateness(lag_histograms)
+        counters.close()
+        lag_histograms.close()
+        if governor is not None:
+            governor.close()
+        pcap_packets.close()
\ No newline at end of file
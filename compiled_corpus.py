@@ -0,0 +1,175 @@
+"""
+預先過濾的緊密封包語料 (compiled corpus)
+
+將 PCAP 中符合接收端標頭規則 (長度 816、魔數、上 / 下半部類型) 且通過
+回波 / 類型過濾的封包，一次性寫成固定跨步的二進位檔:
+
+    [64 字節標頭][N x 816 字節負載][N 個 int64 時間戳]
+
+發送端直接 mmap 這個檔案，封包 i 位於 i * 816，不需要逐封包查長度或判斷；
+介面與 PcapCorpus 相同，可直接交給 UDP_test.py 等工具 (--pcap 指向編譯檔即可)。
+
+用法: python compiled_corpus.py --input input/xxx.pcap --echo-mode 1st
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from lidar_packet import PACKET_SIZE, packet_matrix, valid_packets
+from pcap_index import PcapCorpus
+
+COMPILED_SUFFIX = ".lidarpkt"
+COMPILED_MAGIC = b"LIDARPK1"
+# magic, 封包數, 跨步, 回波過濾, 類型過濾
+COMPILED_HEADER = struct.Struct("<8sQQ8s8s24x")
+ECHO_MODES = ("all", "1st", "2nd")
+PACKET_TYPES = ("all", "upper", "lower")
+
+# 每次寫入的封包數 (約 13MB)
+WRITE_CHUNK = 16384
+
+
+def is_compiled(path):
+    """判斷檔案是否為編譯後的語料"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(COMPILED_MAGIC)) == COMPILED_MAGIC
+    except OSError:
+        return False
+
+
+def compile_corpus(corpus, output_file, echo_mode="all", packet_type="all"):
+    """
+    將語料中有效且符合過濾條件的封包寫成固定跨步的編譯檔。
+    回傳寫入的封包數。
+    """
+    keep = np.flatnonzero(valid_packets(corpus, echo_mode, packet_type))
+    timestamps = np.asarray(corpus.timestamps_ns)[keep].astype("<i8")
+
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(COMPILED_HEADER.pack(COMPILED_MAGIC, len(keep), PACKET_SIZE,
+                                     echo_mode.encode(), packet_type.encode()))
+        for lo in range(0, len(keep), WRITE_CHUNK):
+            matrix, _ = packet_matrix(corpus, keep[lo:lo + WRITE_CHUNK])
+            f.write(np.ascontiguousarray(matrix).tobytes())
+        f.write(timestamps.tobytes())
+    os.replace(tmp_file, output_file)
+    return len(keep)
+
+
+class CompiledCorpus:
+    """
+    以 mmap 映射的編譯語料，所有封包等長等距。
+
+    除了一般語料的介面外，另提供 packet_stride 與 packets (N, 816) 視圖，
+    發送後端可據此省去逐封包的位移 / 長度查詢。物件 pickle 時只傳遞路徑。
+    """
+
+    def __init__(self, path, verbose=True):
+        self.path = path
+        self._verbose = verbose
+        self._open()
+
+    def _open(self):
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < COMPILED_HEADER.size:
+            raise ValueError(f"編譯語料檔過短: {self.path}")
+        magic, count, stride, echo_mode, packet_type = COMPILED_HEADER.unpack_from(self._mm, 0)
+        if magic != COMPILED_MAGIC:
+            raise ValueError(f"不是編譯語料檔: {self.path}")
+        payload_bytes = count * stride
+        if len(self._mm) != COMPILED_HEADER.size + payload_bytes + count * 8:
+            raise ValueError(f"編譯語料檔大小不符 (可能未寫完): {self.path}")
+
+        self.packet_stride = stride
+        self.echo_mode = echo_mode.rstrip(b"\0").decode()
+        self.packet_type = packet_type.rstrip(b"\0").decode()
+        self._count = count
+        self.data = np.frombuffer(self._mm, dtype=np.uint8, count=payload_bytes, offset=COMPILED_HEADER.size)
+        self.packets = self.data.reshape(count, stride)
+        self.timestamps_ns = np.frombuffer(self._mm, dtype="<i8", count=count,
+                                           offset=COMPILED_HEADER.size + payload_bytes)
+        self.offsets = np.arange(count, dtype=np.uint64) * np.uint64(stride)
+        self.lengths = np.full(count, stride, dtype=np.uint32)
+        self._view = memoryview(self._mm)[COMPILED_HEADER.size:COMPILED_HEADER.size + payload_bytes]
+        if self._verbose:
+            print(f"📦 載入編譯語料: {self.path} ({count} 個封包, 回波 {self.echo_mode}, 類型 {self.packet_type})")
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        offset = int(i) * self.packet_stride
+        return self._view[offset:offset + self.packet_stride]
+
+    @property
+    def base_address(self):
+        """負載區起始位址 (供 sendmmsg 等需要原始指標的呼叫使用)"""
+        return self.data.ctypes.data
+
+    @property
+    def total_bytes(self):
+        """所有負載的總字節數"""
+        return self._count * self.packet_stride
+
+    @property
+    def avg_packet_size(self):
+        """負載的平均大小 (固定為跨步)"""
+        return float(self.packet_stride) if self._count else 0.0
+
+    def close(self):
+        """釋放 mmap"""
+        self.data = self.packets = self.offsets = self.lengths = self.timestamps_ns = None
+        self._view.release()
+        self._mm.close()
+
+    def __getstate__(self):
+        return {"path": self.path, "verbose": False}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._verbose = state["verbose"]
+        self._open()
+
+
+def open_corpus(path, rebuild=False, verbose=True):
+    """依檔案內容開啟編譯語料或 PCAP 語料"""
+    if is_compiled(path):
+        return CompiledCorpus(path, verbose=verbose)
+    return PcapCorpus(path, rebuild=rebuild, verbose=verbose)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="將 PCAP 編譯成預先過濾、固定跨步的封包語料")
+    parser.add_argument("--input", type=str, default="input/bu25_no6_20250319.pcap", help="輸入 PCAP 檔案路徑")
+    parser.add_argument("--output", type=str, default=None,
+                        help=f"輸出檔案路徑 (預設: 輸入檔名加上 {COMPILED_SUFFIX})")
+    parser.add_argument("--echo-mode", choices=ECHO_MODES, default="all", help="保留的回波 (all / 1st / 2nd)")
+    parser.add_argument("--type", dest="packet_type", choices=PACKET_TYPES, default="all",
+                        help="保留的封包類型 (all / upper / lower)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"錯誤：找不到 PCAP 檔案 '{args.input}'")
+        return 1
+    output_file = args.output or os.path.splitext(args.input)[0] + COMPILED_SUFFIX
+
+    corpus = PcapCorpus(args.input)
+    try:
+        count = compile_corpus(corpus, output_file, args.echo_mode, args.packet_type)
+    finally:
+        total = len(corpus)
+        corpus.close()
+    print(f"✅ 已編譯 {count}/{total} 個封包 (捨棄 {total - count} 個) → {output_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
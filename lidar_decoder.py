@@ -0,0 +1,265 @@
+"""
+LiDAR 封包的 NumPy 向量化解碼器
+
+與 udp_receiver_node.cpp 的 parse_udp_packet() 採用相同規則:
+檢查標頭魔數、讀取上 / 下半部類型與回波序號、以 lookup_table 換算方位角，
+並將每個封包 260 個點的強度與半徑轉為 x / y / z。
+
+LidarDecoder.decode() 一次處理 (N, 816) 的 uint8 陣列，仰角的 sin / cos 與
+方位角表皆預先計算，整個流程沒有逐點的 Python 迴圈。
+另附純 Python 的參考實作與基準測試 (python lidar_decoder.py --help)。
+"""
+
+import argparse
+import math
+import os
+import re
+import time
+
+import numpy as np
+
+from lidar_packet import (ECHO_1ST, ECHO_2ND, HEADER_MAGIC, PACKET_LOWER, PACKET_SIZE,
+                          PACKET_UPPER, POINT_START_OFFSET, POINTS_PER_PACKET,
+                          RETURN_SEQ_OFFSET, AZIMUTH_OFFSET)
+
+# LiDAR參數常量 (與接收端相同)
+ELEVATION_START_UPPER = 12.975
+ELEVATION_START_LOWER = -0.025
+ELEVATION_STEP = -0.05
+
+ECHO_MODES = ("all", "1st", "2nd")
+DECODE_CHUNK = 512  # 每段處理的封包數
+RECEIVER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "udp_receiver_node.cpp")
+
+# 輸出點的欄位，前五欄與 PointCloud2 訊息相同
+POINT_DTYPE = np.dtype([
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("z", "<f4"),
+    ("intensity", "<f4"),
+    ("echo_num", "<f4"),
+    ("azimuth", "<f4"),
+    ("elevation", "<f4"),
+    ("packet", "<u4"),   # 輸入陣列中的封包列號
+    ("upper", "u1"),     # 1 = 上半部, 0 = 下半部
+])
+
+
+def load_lookup_table(source=RECEIVER_SOURCE):
+    """
+    從接收端原始碼解析編碼器 lookup_table，確保兩邊永遠使用同一份表。
+    """
+    with open(source, encoding="utf-8") as f:
+        text = f.read()
+    match = re.search(r"lookup_table\[\]\s*=\s*\{([^}]*)\}", text)
+    if match is None:
+        raise ValueError(f"在 {source} 中找不到 lookup_table")
+    values = [value for value in match.group(1).split(",") if value.strip()]
+    return np.array(values, dtype=np.int16)
+
+
+class LidarDecoder:
+    """
+    預先計算三角函數表的批次解碼器。
+
+    接收端以整數除法計算方位角 (lookup_table[raw] / 100，向零截斷為整數度)，
+    integer_azimuth=True (預設) 時完全比照；設為 False 則保留 0.01 度的精度。
+    """
+
+    def __init__(self, lookup_table=None, integer_azimuth=True):
+        if lookup_table is None:
+            lookup_table = load_lookup_table()
+        table = np.asarray(lookup_table, dtype=np.int32)
+        if integer_azimuth:
+            self.azimuth_table = np.trunc(table / 100).astype(np.float32)
+        else:
+            self.azimuth_table = (table / 100).astype(np.float32)
+        rad = np.deg2rad(self.azimuth_table.astype(np.float64))
+        self.sin_azimuth = np.sin(rad).astype(np.float32)
+        self.cos_azimuth = np.cos(rad).astype(np.float32)
+
+        # 仰角表: 第 0 列為下半部，第 1 列為上半部
+        steps = np.arange(POINTS_PER_PACKET) * ELEVATION_STEP
+        self.elevation = np.stack([ELEVATION_START_LOWER + steps,
+                                   ELEVATION_START_UPPER + steps]).astype(np.float32)
+        rad = np.deg2rad(self.elevation.astype(np.float64))
+        self.sin_elevation = np.sin(rad).astype(np.float32)
+        self.cos_elevation = np.cos(rad).astype(np.float32)
+
+    def valid_mask(self, packets, echo_mode="all"):
+        """依接收端規則判斷哪些封包會被解碼"""
+        return self._classify(packets, echo_mode)[0]
+
+    def _classify(self, packets, echo_mode):
+        magic = np.frombuffer(HEADER_MAGIC, dtype=np.uint8)
+        return_seq = packets[:, RETURN_SEQ_OFFSET]
+        packet_type = return_seq & 0xF0
+        echo_num = return_seq & 0x0F
+        azimuth_raw = (packets[:, AZIMUTH_OFFSET + 1].astype(np.int32) << 8) | packets[:, AZIMUTH_OFFSET]
+
+        valid = np.all(packets[:, :4] == magic, axis=1)
+        valid &= (packet_type == PACKET_UPPER) | (packet_type == PACKET_LOWER)
+        valid &= azimuth_raw < len(self.azimuth_table)
+        if echo_mode == "1st":
+            valid &= echo_num == ECHO_1ST
+        elif echo_mode == "2nd":
+            valid &= echo_num == ECHO_2ND
+        return valid, packet_type, echo_num, azimuth_raw
+
+    def decode(self, packets, echo_mode="all", out=None):
+        """
+        解碼 (N, 816) uint8 陣列，回傳 POINT_DTYPE 結構化陣列
+        (每個有效封包 260 個點，依封包順序排列)。
+        """
+        packets = np.asarray(packets, dtype=np.uint8)
+        if packets.ndim != 2 or packets.shape[1] != PACKET_SIZE:
+            raise ValueError(f"輸入必須是 (N, {PACKET_SIZE}) 的 uint8 陣列")
+
+        valid, packet_type, echo_num, azimuth_raw = self._classify(packets, echo_mode)
+        rows = np.flatnonzero(valid)
+        count = len(rows) * POINTS_PER_PACKET
+        if out is None:
+            out = np.empty(count, dtype=POINT_DTYPE)
+        elif len(out) < count:
+            raise ValueError("輸出陣列空間不足")
+        else:
+            out = out[:count]
+        view = out.reshape(len(rows), POINTS_PER_PACKET)
+
+        # 分段處理，讓中間陣列留在 CPU 快取中
+        for lo in range(0, len(rows), DECODE_CHUNK):
+            chunk = rows[lo:lo + DECODE_CHUNK]
+            self._decode_rows(packets, chunk, packet_type[chunk], echo_num[chunk],
+                              azimuth_raw[chunk], view[lo:lo + DECODE_CHUNK])
+        return out
+
+    def _decode_rows(self, packets, rows, packet_type, echo_num, azimuth_raw, view):
+        upper = (packet_type == PACKET_UPPER).astype(np.intp)
+        points = packets[rows, POINT_START_OFFSET:POINT_START_OFFSET + POINTS_PER_PACKET * 3]
+        points = points.reshape(len(rows), POINTS_PER_PACKET, 3)
+        radius = points[:, :, 1].astype(np.float32)
+        radius += points[:, :, 2].astype(np.float32) * 256.0
+
+        # 水平距離 r*cos(el) 與高度 r*sin(el)
+        horizontal = radius * self.cos_elevation[upper]
+
+        # 與接收端相同: X 與 Y 互換 (y = cos(az), x = sin(az))
+        view["x"] = horizontal * self.sin_azimuth[azimuth_raw][:, None]
+        view["y"] = horizontal * self.cos_azimuth[azimuth_raw][:, None]
+        view["z"] = radius * self.sin_elevation[upper]
+        view["intensity"] = points[:, :, 0]
+        view["echo_num"] = echo_num[:, None]
+        view["azimuth"] = self.azimuth_table[azimuth_raw][:, None]
+        view["elevation"] = self.elevation[upper]
+        view["packet"] = rows[:, None]
+        view["upper"] = upper[:, None]
+
+
+def decode_packet_reference(packet, lookup_table, echo_mode="all"):
+    """
+    純 Python 參考實作 (逐點計算，與 parse_udp_packet() 逐行對應)。
+    回傳 [(x, y, z, intensity, echo_num), ...]；無效封包回傳空清單。
+    """
+    if len(packet) != PACKET_SIZE or bytes(packet[:4]) != HEADER_MAGIC:
+        return []
+    return_seq = packet[RETURN_SEQ_OFFSET]
+    packet_type = return_seq & 0xF0
+    echo_num = return_seq & 0x0F
+    if (echo_mode == "1st" and echo_num != ECHO_1ST) or (echo_mode == "2nd" and echo_num != ECHO_2ND):
+        return []
+    if packet_type not in (PACKET_UPPER, PACKET_LOWER):
+        return []
+
+    azimuth_raw = (packet[AZIMUTH_OFFSET + 1] << 8) | packet[AZIMUTH_OFFSET]
+    if azimuth_raw >= len(lookup_table):
+        return []
+    azimuth = float(math.trunc(int(lookup_table[azimuth_raw]) / 100))
+    rad_azimuth = math.radians(azimuth)
+    cos_azimuth = math.cos(rad_azimuth)
+    sin_azimuth = math.sin(rad_azimuth)
+    elevation_start = ELEVATION_START_UPPER if packet_type == PACKET_UPPER else ELEVATION_START_LOWER
+
+    points = []
+    for i in range(POINTS_PER_PACKET):
+        offset = POINT_START_OFFSET + i * 3
+        intensity = packet[offset]
+        radius = (packet[offset + 2] << 8) | packet[offset + 1]
+        rad_elevation = math.radians(elevation_start + i * ELEVATION_STEP)
+        cos_elevation = math.cos(rad_elevation)
+        points.append((radius * cos_elevation * sin_azimuth,
+                       radius * cos_elevation * cos_azimuth,
+                       radius * math.sin(rad_elevation),
+                       float(intensity),
+                       float(echo_num)))
+    return points
+
+
+def random_packets(count, lookup_size, seed=0):
+    """產生隨機但格式正確的封包 (僅供基準測試使用)"""
+    rng = np.random.default_rng(seed)
+    packets = rng.integers(0, 256, size=(count, PACKET_SIZE), dtype=np.uint8)
+    packets[:, :4] = np.frombuffer(HEADER_MAGIC, dtype=np.uint8)
+    upper = np.arange(count) % 2 == 0
+    packets[:, RETURN_SEQ_OFFSET] = np.where(upper, PACKET_UPPER, PACKET_LOWER) | ECHO_1ST
+    azimuth = rng.integers(0, lookup_size, size=count)
+    packets[:, AZIMUTH_OFFSET] = azimuth & 0xFF
+    packets[:, AZIMUTH_OFFSET + 1] = azimuth >> 8
+    return packets
+
+
+def run_benchmark(packets, decoder, lookup_table, echo_mode="all", reference_packets=200, repeats=5):
+    """比較向量化解碼與純 Python 參考實作的速度，並驗證結果一致"""
+    out = np.empty(len(packets) * POINTS_PER_PACKET, dtype=POINT_DTYPE)
+    decoder.decode(packets, echo_mode, out=out)  # 暖身
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        points = decoder.decode(packets, echo_mode, out=out)
+        timings.append(time.perf_counter() - start)
+    vectorized = len(points) / min(timings)
+
+    sample = packets[:reference_packets]
+    start = time.perf_counter()
+    reference = [p for row in sample for p in decode_packet_reference(row.tobytes(), lookup_table, echo_mode)]
+    reference_rate = len(reference) / (time.perf_counter() - start)
+
+    expected = np.array(reference, dtype=np.float64).reshape(-1, 5)
+    got = decoder.decode(sample, echo_mode)
+    actual = np.stack([got["x"], got["y"], got["z"], got["intensity"], got["echo_num"]], axis=1)
+    max_error = float(np.max(np.abs(actual - expected))) if len(expected) else 0.0
+
+    print(f"📦 封包數: {len(packets)}, 點數: {len(points)}")
+    print(f"⚡ 向量化解碼: {vectorized / 1e6:.1f} M 點/秒 (最佳 {min(timings) * 1000:.1f} ms)")
+    print(f"🐢 純 Python 參考: {reference_rate / 1e6:.3f} M 點/秒")
+    print(f"🚀 加速倍數: {vectorized / reference_rate:.0f}x, 最大座標誤差: {max_error:.4f}")
+    return vectorized, reference_rate, max_error
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LiDAR 封包向量化解碼器基準測試")
+    parser.add_argument("--pcap", type=str, default=None, help="從 PCAP 讀取封包 (未指定時使用隨機封包)")
+    parser.add_argument("--packets", type=int, default=100_000, help="隨機封包數量")
+    parser.add_argument("--echo-mode", choices=ECHO_MODES, default="all", help="回波選擇模式")
+    args = parser.parse_args()
+
+    lookup_table = load_lookup_table()
+    decoder = LidarDecoder(lookup_table)
+
+    if args.pcap:
+        from lidar_packet import packet_matrix
+        from pcap_index import PcapCorpus
+        corpus = PcapCorpus(args.pcap)
+        packets, _ = packet_matrix(corpus)
+        packets = np.ascontiguousarray(packets)
+    else:
+        packets = random_packets(args.packets, len(lookup_table))
+
+    if not len(packets):
+        print("錯誤：沒有可解碼的封包")
+        return 1
+    run_benchmark(packets, decoder, lookup_table, args.echo_mode)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
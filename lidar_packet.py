@@ -0,0 +1,189 @@
+"""
+LiDAR UDP 封包格式
+
+常數與 udp_receiver_node.cpp 保持一致，並提供以 NumPy 批次擷取標頭欄位、
+依接收端規則 (上半部 + 下半部 = 一條掃描線，LINES_PER_FRAME 條線 = 一幀)
+切分掃描線 / 幀，以及將語料分配給多個發送進程的工具。
+"""
+
+import numpy as np
+
+# 數據包格式常量 (與接收端相同)
+HEADER_SIZE = 32
+DATA_SIZE = 784  # 260 points * 3 bytes per point (含 4 字節的線標頭)
+PACKET_SIZE = 816  # HEADER_SIZE + DATA_SIZE
+POINTS_PER_PACKET = 260
+TOTAL_POINTS_PER_LINE = 520  # 上下半部總點數
+HEADER_MAGIC = bytes([0x55, 0xAA, 0x5A, 0xA5])
+DATA_START_OFFSET = 32
+RETURN_SEQ_OFFSET = DATA_START_OFFSET + 1
+AZIMUTH_OFFSET = DATA_START_OFFSET + 2
+POINT_START_OFFSET = DATA_START_OFFSET + 4
+
+# 每幀包含的掃描線數量
+LINES_PER_FRAME = 1990
+
+# 數據包類型與回波
+PACKET_UPPER = 0x10
+PACKET_LOWER = 0x20
+ECHO_1ST = 0x01
+ECHO_2ND = 0x02
+
+# 工作分割單位
+PARTITION_UNITS = ("none", "lines", "frames")
+
+
+def gather_header_byte(corpus, offset):
+    """取出每個封包位移 offset 處的單一字節 (長度不足的封包回傳 0)"""
+    lengths = np.asarray(corpus.lengths)
+    result = np.zeros(len(lengths), dtype=np.uint8)
+    ok = lengths > offset
+    positions = np.asarray(corpus.offsets)[ok].astype(np.int64) + offset
+    result[ok] = corpus.data[positions]
+    return result
+
+
+def packet_types(corpus):
+    """每個封包的類型 (PACKET_UPPER / PACKET_LOWER / 其他值代表無效)"""
+    return gather_header_byte(corpus, RETURN_SEQ_OFFSET) & 0xF0
+
+
+def valid_packets(corpus, echo_mode="all", packet_type="all", azimuth_limit=None):
+    """
+    依接收端的標頭規則判斷每個封包是否有效，回傳布林遮罩:
+    長度為 PACKET_SIZE、魔數正確、類型為上 / 下半部，並符合回波 (all / 1st / 2nd)
+    與類型 (all / upper / lower) 過濾；azimuth_limit 為方位角查找表的長度。
+    """
+    valid = np.asarray(corpus.lengths) == PACKET_SIZE
+    for i, magic_byte in enumerate(HEADER_MAGIC):
+        valid &= gather_header_byte(corpus, i) == magic_byte
+
+    return_seq = gather_header_byte(corpus, RETURN_SEQ_OFFSET)
+    types = return_seq & 0xF0
+    echo_num = return_seq & 0x0F
+    valid &= (types == PACKET_UPPER) | (types == PACKET_LOWER)
+    if packet_type == "upper":
+        valid &= types == PACKET_UPPER
+    elif packet_type == "lower":
+        valid &= types == PACKET_LOWER
+    if echo_mode == "1st":
+        valid &= echo_num == ECHO_1ST
+    elif echo_mode == "2nd":
+        valid &= echo_num == ECHO_2ND
+    if azimuth_limit is not None:
+        azimuth_raw = (gather_header_byte(corpus, AZIMUTH_OFFSET + 1).astype(np.int32) << 8
+                       | gather_header_byte(corpus, AZIMUTH_OFFSET))
+        valid &= azimuth_raw < azimuth_limit
+    return valid
+
+
+def line_ends(types, include_partial=True):
+    """
+    依接收端的配對規則計算每條掃描線的結束位置 (不含)。
+
+    接收端在同時收到上半部與下半部後完成一條線並重設狀態；
+    類型無效的封包不影響狀態，歸入目前這條線。
+    include_partial 為 True 時，最後一條未完成的線也以語料結尾作為結束位置。
+    """
+    # 只看有效事件 (上 / 下半部)，同類型連續出現的一段稱為一個 run。
+    # 一條線在遇到與其起點不同類型的事件時結束，因此線只會在 run 的開頭結束:
+    # 前一個 run 長度 > 1 時，進入此 run 時必有一條線未完成 → 此處結束；
+    # 前一個 run 長度為 1 時，是否結束與前一個 run 的開頭相反 (該事件可能剛結束上一條線)。
+    # 第一個 run 的開頭只開始一條線。
+    types = np.asarray(types)
+    events = np.flatnonzero((types == PACKET_UPPER) | (types == PACKET_LOWER))
+    event_types = types[events]
+    run_starts = np.flatnonzero(np.concatenate([[True], event_types[1:] != event_types[:-1]])) if len(events) else events
+    run_lengths = np.diff(np.append(run_starts, len(events)))
+    # 每個 run 往前最近一個「錨點」(第一個 run，或前一個 run 長度 > 1 的 run)，之後的結束狀態交替
+    k = np.arange(len(run_starts))
+    anchor = np.maximum.accumulate(np.where((k == 0) | (np.roll(run_lengths, 1) > 1), k, 0))
+    is_end = (anchor != 0) ^ ((k - anchor) & 1).astype(bool)
+    ends = events[run_starts[is_end]].astype(np.int64) + 1
+
+    if include_partial and (not len(ends) or ends[-1] != len(types)):
+        ends = np.append(ends, len(types))
+    return ends
+
+
+def unit_ends(ends, unit):
+    """由掃描線結束位置換算以掃描線或幀為單位的結束位置 (不含)"""
+    if unit == "frames":
+        frame_ends = ends[LINES_PER_FRAME - 1::LINES_PER_FRAME]
+        if not len(frame_ends) or frame_ends[-1] != ends[-1]:
+            frame_ends = np.append(frame_ends, ends[-1])
+        return frame_ends
+    return ends
+
+
+def partition_corpus(corpus, num_workers, unit):
+    """
+    將語料切成 num_workers 段互不重疊、連續且對齊單位邊界的範圍。
+
+    回傳 [(起點, 終點, 該段內的掃描線結束位置), ...]。
+    各段依封包數盡量平均；單位數少於進程數時，多出的進程分到空範圍。
+    unit 為 "none" 時每個進程都拿到整份語料 (原始行為)，不計算掃描線。
+    """
+    total = len(corpus)
+    if unit == "none":
+        return [(0, total, None)] * num_workers
+
+    lines = line_ends(packet_types(corpus))
+    units = unit_ends(lines, unit)
+    targets = np.arange(1, num_workers + 1) * total / num_workers
+    cut_idx = np.searchsorted(units, targets, side="left").clip(0, len(units) - 1)
+    cuts = np.concatenate([[0], units[cut_idx]])
+    cuts = np.maximum.accumulate(cuts)
+    cuts[-1] = total
+
+    partitions = []
+    for lo, hi in zip(cuts[:-1], cuts[1:]):
+        own_lines = lines[(lines > lo) & (lines <= hi)]
+        partitions.append((int(lo), int(hi), own_lines))
+    return partitions
+
+
+def aligned_count(ends, start, limit):
+    """
+    從 start 起最多 limit 個封包，且結束於掃描線邊界的封包數。
+    若單一掃描線就超過 limit，只能回傳 limit (該線會被拆成多次發送)。
+    ends 為 None 時不做對齊。
+    """
+    if ends is None:
+        return limit
+    i = int(np.searchsorted(ends, start + limit, side="right")) - 1
+    if i >= 0 and ends[i] > start:
+        return int(ends[i] - start)
+    return limit
+
+
+def packet_matrix(corpus, indices=None):
+    """
+    將語料中長度為 PACKET_SIZE 的封包組成 (N, PACKET_SIZE) 的 uint8 陣列。
+
+    回傳 (陣列, 對應的語料索引)。若封包在緩衝區中等距排列 (固定記錄長度的 PCAP
+    或共享記憶體語料)，直接回傳唯讀的跨步視圖而不複製。
+    """
+    lengths = np.asarray(corpus.lengths)
+    if indices is None:
+        indices = np.arange(len(lengths))
+    indices = np.asarray(indices, dtype=np.int64)
+    indices = indices[lengths[indices] == PACKET_SIZE]
+    if not len(indices):
+        return np.empty((0, PACKET_SIZE), dtype=np.uint8), indices
+
+    offsets = np.asarray(corpus.offsets)[indices].astype(np.int64)
+    strides = np.diff(offsets)
+    if len(offsets) == 1 or (strides[0] >= PACKET_SIZE and np.all(strides == strides[0])):
+        stride = int(strides[0]) if len(offsets) > 1 else PACKET_SIZE
+        matrix = np.lib.stride_tricks.as_strided(
+            corpus.data[int(offsets[0]):], shape=(len(indices), PACKET_SIZE),
+            strides=(stride, 1), writeable=False)
+        return matrix, indices
+
+    # 不等距時分段收集，避免一次建立 N x PACKET_SIZE 的索引陣列
+    matrix = np.empty((len(indices), PACKET_SIZE), dtype=np.uint8)
+    columns = np.arange(PACKET_SIZE)
+    for lo in range(0, len(indices), 4096):
+        matrix[lo:lo + 4096] = corpus.data[offsets[lo:lo + 4096, None] + columns]
+    return matrix, indices
@@ -0,0 +1,292 @@
+"""
+迴路 (loopback) 端到端遺失 / 延遲測試
+
+在 127.0.0.1 上啟動一個 Python 接收端作為 ROS 節點的替身，發送端在每個封包的
+32 字節標頭複本中寫入序號與發送時間 (不改動魔數與點資料)，接收端據此統計:
+
+- 遺失 (並以 /proc/net/snmp 區分核心接收緩衝區溢出與其他原因)
+- 亂序、重複
+- 單向延遲百分位數
+
+每個目標速率為一個測試步驟，可由 UDP_test.py 或其他情境腳本呼叫。
+"""
+
+import multiprocessing
+import queue
+import socket
+import struct
+import time
+
+import numpy as np
+
+from lidar_packet import HEADER_SIZE
+from replay_timing import wait_until
+from udp_send_engine import RETRYABLE_ERRNOS, create_sender, create_socket
+
+# 標籤位於標頭第 16-31 字節: 序號 (u64) + 發送時間 (CLOCK_MONOTONIC 奈秒, u64)
+TAG_OFFSET = 16
+TAG = struct.Struct("<QQ")
+
+BYTES_PER_MB = 1024 * 1024
+RECV_BUFFER_SIZE = 8 * 1024 * 1024  # 與接收節點相同的 8MB 接收緩衝區
+# 等待替身接收端就緒、以及發送結束後等待其回報統計的時間上限 (秒)
+RECEIVER_START_TIMEOUT = 5.0
+RESULT_TIMEOUT_MARGIN = 10.0
+
+
+def read_udp_snmp():
+    """讀取 /proc/net/snmp 的 UDP 計數 (無法讀取時回傳空字典)"""
+    try:
+        with open("/proc/net/snmp") as f:
+            rows = [line.split() for line in f if line.startswith("Udp:")]
+    except OSError:
+        return {}
+    if len(rows) < 2:
+        return {}
+    return dict(zip(rows[0][1:], map(int, rows[1][1:])))
+
+
+class LoopbackError(RuntimeError):
+    """替身接收端無法啟動 (如埠已被占用) 或沒有在時限內回報統計"""
+
+
+class TaggedBatch:
+    """
+    可寫入的暫存批次，介面與封包語料相同，可直接交給發送後端。
+    每批將語料中的封包複製進來並蓋上序號與時間戳。
+    """
+
+    def __init__(self, corpus, batch_size):
+        self.corpus = corpus
+        self.batch_size = batch_size
+        self.stride = -(-int(np.max(corpus.lengths)) // 64) * 64
+        self.data = np.zeros(batch_size * self.stride, dtype=np.uint8)
+        self.offsets = np.arange(batch_size, dtype=np.uint64) * np.uint64(self.stride)
+        self.lengths = np.zeros(batch_size, dtype=np.uint32)
+        self.timestamps_ns = np.zeros(batch_size, dtype=np.int64)
+        self._view = memoryview(self.data)
+        self._tags = np.ndarray(shape=(batch_size, 2), dtype="<u8", buffer=self.data,
+                                offset=TAG_OFFSET, strides=(self.stride, 8))
+
+    def load(self, indices, first_seq):
+        """載入 corpus[indices] 並蓋上連續序號 (發送時間稍後由 stamp() 寫入)"""
+        view = self._view
+        for slot, i in enumerate(indices):
+            packet = self.corpus[int(i)]
+            dst = slot * self.stride
+            view[dst:dst + len(packet)] = packet
+        count = len(indices)
+        self.lengths[:count] = np.asarray(self.corpus.lengths)[indices]
+        self._tags[:count, 0] = np.arange(first_seq, first_seq + count, dtype=np.uint64)
+
+    def stamp(self, count, send_ns):
+        """寫入發送時間"""
+        self._tags[:count, 1] = send_ns
+
+    def __len__(self):
+        return self.batch_size
+
+    def __getitem__(self, i):
+        offset = int(self.offsets[i])
+        return self._view[offset:offset + int(self.lengths[i])]
+
+    @property
+    def base_address(self):
+        return self.data.ctypes.data
+
+
+def receiver_process(port, ready, stop, result_queue):
+    """替身接收端: 收到停止訊號且緩衝區清空後回報統計；無法綁定時改回報 {"error": 訊息}"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+    try:
+        sock.bind(("127.0.0.1", port))
+    except OSError as e:
+        sock.close()
+        result_queue.put({"error": f"替身接收端無法綁定 127.0.0.1:{port}: {e}"})
+        return
+    sock.settimeout(0.05)
+
+    buffer = bytearray(65536)
+    seen = np.zeros(1 << 20, dtype=np.uint8)
+    latencies = []
+    received = duplicates = reordered = untagged = 0
+    max_seq = -1
+
+    ready.set()
+    while True:
+        try:
+            nbytes = sock.recv_into(buffer)
+        except socket.timeout:
+            if stop.is_set():
+                break
+            continue
+        recv_ns = time.monotonic_ns()
+        if nbytes < HEADER_SIZE:
+            untagged += 1
+            continue
+
+        seq, send_ns = TAG.unpack_from(buffer, TAG_OFFSET)
+        received += 1
+        latencies.append(recv_ns - send_ns)
+        if seq >= len(seen):
+            seen = np.concatenate([seen, np.zeros(max(len(seen), seq + 1 - len(seen)), dtype=np.uint8)])
+        if seen[seq]:
+            duplicates += 1
+            continue
+        seen[seq] = 1
+        if seq < max_seq:
+            reordered += 1
+        else:
+            max_seq = seq
+
+    sock.close()
+    result_queue.put({
+        "received": received,
+        "unique": int(np.count_nonzero(seen)),
+        "duplicates": duplicates,
+        "reordered": reordered,
+        "untagged": untagged,
+        "latencies_ns": np.asarray(latencies, dtype=np.int64),
+    })
+
+
+def _receiver_failed(receiver, result_queue, default_message):
+    """停止替身接收端並拋出 LoopbackError (訊息優先採用接收端回報的錯誤)"""
+    message = default_message
+    try:
+        reported = result_queue.get(timeout=1.0)
+        message = reported.get("error", message)
+    except queue.Empty:
+        pass
+    if receiver.is_alive():
+        receiver.terminate()
+    receiver.join()
+    raise LoopbackError(message)
+
+
+def run_rate_step(corpus, rate_mbps, duration, port, backend="sendmmsg", batch_size=64, drain=0.5, pacing=None):
+    """
+    以指定速率向替身接收端發送 duration 秒，回傳此步驟的統計字典。
+    速率以絕對時間表控制 (依已送出的字節數計算下一批的時刻)；
+    pacing 可替換為提供 time_for(已送出字節數) -> 相對秒數 的負載曲線 (如突發)，
+    此時 rate_mbps 僅作為紀錄用的平均目標速率。
+    替身接收端無法啟動 (如埠已被占用) 或沒有回報統計時拋出 LoopbackError，不會無限等待。
+    """
+    eligible = np.flatnonzero(np.asarray(corpus.lengths) >= HEADER_SIZE)
+    if not len(eligible):
+        raise ValueError("語料中沒有長度足以加上標籤的封包")
+
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    result_queue = multiprocessing.Queue()
+    receiver = multiprocessing.Process(target=receiver_process, args=(port, ready, stop, result_queue))
+    receiver.daemon = True
+    receiver.start()
+    start_deadline = time.monotonic() + RECEIVER_START_TIMEOUT
+    while not ready.wait(0.05):
+        if not receiver.is_alive():
+            _receiver_failed(receiver, result_queue, f"替身接收端 (127.0.0.1:{port}) 啟動失敗")
+        if time.monotonic() > start_deadline:
+            _receiver_failed(receiver, result_queue,
+                             f"替身接收端 (127.0.0.1:{port}) 在 {RECEIVER_START_TIMEOUT:g} 秒內未就緒")
+
+    sock = create_socket()
+    batch = TaggedBatch(corpus, batch_size)
+    sender = create_sender(backend, sock, batch, ("127.0.0.1", port), batch_size)
+    rate_bps = rate_mbps * BYTES_PER_MB
+    time_for = pacing.time_for if pacing is not None else (lambda nbytes: nbytes / rate_bps)
+    snmp_before = read_udp_snmp()
+
+    sent_packets = sent_bytes = send_errors = 0
+    position = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    try:
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            count = min(sender.batch_size, len(eligible) - position)
+            batch.load(eligible[position:position + count], sent_packets)
+            wait_until(start + time_for(sent_bytes))
+
+            # 後端可能只送出部分封包；剩下的保留在暫存批次開頭重送
+            done = 0
+            while done < count:
+                batch.stamp(count, time.monotonic_ns())
+                try:
+                    n, nbytes = sender.send(done, count - done)
+                except OSError as e:
+                    if e.errno not in RETRYABLE_ERRNOS:
+                        raise
+                    send_errors += 1
+                    continue
+                done += n
+                sent_bytes += nbytes
+            sent_packets += count
+            position = (position + count) % len(eligible)
+        elapsed = time.perf_counter() - start
+    finally:
+        sock.close()
+
+    time.sleep(drain)
+    stop.set()
+    try:
+        stats = result_queue.get(timeout=duration + drain + RESULT_TIMEOUT_MARGIN)
+    except queue.Empty:
+        _receiver_failed(receiver, result_queue, f"替身接收端 (127.0.0.1:{port}) 沒有回報統計")
+    receiver.join()
+    snmp_after = read_udp_snmp()
+
+    latencies_us = stats.pop("latencies_ns") / 1000.0
+    if len(latencies_us):
+        p50, p99, p999 = np.percentile(latencies_us, [50, 99, 99.9])
+        latency_max = float(latencies_us.max())
+    else:
+        p50 = p99 = p999 = latency_max = float("nan")
+
+    lost = sent_packets - stats["unique"]
+    return {
+        "target_mbps": rate_mbps,
+        "achieved_mbps": sent_bytes / elapsed / BYTES_PER_MB,
+        "sent": sent_packets,
+        **stats,
+        "lost": lost,
+        "loss_percent": lost / sent_packets * 100 if sent_packets else 0.0,
+        "kernel_rcvbuf_drops": (snmp_after.get("RcvbufErrors", 0) - snmp_before.get("RcvbufErrors", 0)),
+        "send_errors": send_errors,
+        "latency_p50_us": float(p50),
+        "latency_p99_us": float(p99),
+        "latency_p999_us": float(p999),
+        "latency_max_us": latency_max,
+    }
+
+
+def print_step(result):
+    """列印單一步驟的結果列"""
+    print("{:>8.1f} | {:>8.1f} | {:>9} | {:>8} | {:>7.3f} | {:>8} | {:>6} | {:>6} | {:>9.0f} | {:>9.0f} | {:>9.0f}".format(
+        result["target_mbps"], result["achieved_mbps"], result["sent"], result["lost"],
+        result["loss_percent"], result["kernel_rcvbuf_drops"], result["reordered"],
+        result["duplicates"], result["latency_p50_us"], result["latency_p99_us"],
+        result["latency_p999_us"]))
+
+
+def print_header():
+    """列印結果表頭"""
+    print("{:>8} | {:>8} | {:>9} | {:>8} | {:>7} | {:>8} | {:>6} | {:>6} | {:>9} | {:>9} | {:>9}".format(
+        "目標MB/s", "實際MB/s", "已送出", "遺失", "遺失%", "核心丟棄", "亂序", "重複",
+        "p50 µs", "p99 µs", "p99.9 µs"))
+    print("-" * 118)
+
+
+def run_loopback_test(corpus, rates, duration, port, backend="sendmmsg", batch_size=64):
+    """對每個目標速率執行一個步驟並列印結果表"""
+    print(f"\n🔁 迴路端到端測試: 127.0.0.1:{port}, 每步 {duration:.1f} 秒, 後端 {backend}")
+    print_header()
+    results = []
+    for rate in rates:
+        result = run_rate_step(corpus, rate, duration, port, backend, batch_size)
+        print_step(result)
+        results.append(result)
+    return results
@@ -0,0 +1,191 @@
+"""
+發送端即時指標輸出
+
+在監測進程中定期 (可小於一秒) 對共享記憶體中的計數器與節拍延遲直方圖取快照，
+換算每個進程 / 目標與總計的 packets/s、MB/s，並輸出到:
+
+- Prometheus 文字格式的本機 HTTP 端點 (背景執行緒提供 /metrics)
+- output/ 下帶時間戳的 CSV 或 JSONL 時間序列
+
+所有計算都在監測進程內完成，發送進程只負責寫入各自的計數器槽位。
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from sender_stats import COUNTER_FIELDS, LAG_BUCKET_EDGES_US
+
+BYTES_PER_MB = 1024 * 1024
+METRICS_FORMATS = ("csv", "jsonl")
+SERIES_FIELDS = ("time", "elapsed_s", "worker", "target", "packets", "bytes", "packets_per_s", "mb_per_s",
+                 "send_errors", "pacing_overruns", "lag_p50_us", "lag_p99_us")
+
+# Prometheus 直方圖只輸出部分區間邊界 (µs)，避免每個進程數百條時間序列
+PROMETHEUS_LAG_EDGES_US = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000, 100000)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.exporter.prometheus_text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 不在終端機輸出每次抓取的紀錄
+
+
+class MetricsExporter:
+    """
+    由監測進程週期性呼叫 sample()。
+
+    counters 的槽位依 [進程][目標] 排列 (每個進程 len(targets) 個槽位)，
+    lag_histograms 每個進程一列；port 為 None 時不啟動 HTTP 端點，
+    series_format 為 None 時不寫檔。
+    """
+
+    def __init__(self, counters, lag_histograms, num_workers, target_labels, port=None, host="127.0.0.1",
+                 series_format=None, output_dir="output"):
+        self.counters = counters
+        self.lag_histograms = lag_histograms
+        self.num_workers = num_workers
+        self.target_labels = list(target_labels)
+        self.prometheus_text = ""
+        self.series_path = None
+        self.start_time = time.perf_counter()
+        self._last_time = self.start_time
+        self._last = np.zeros((num_workers, len(self.target_labels), len(COUNTER_FIELDS)), dtype=np.uint64)
+
+        self._server = None
+        if port is not None:
+            self._server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            self._server.daemon_threads = True
+            self._server.exporter = self
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+        self._series_file = self._writer = None
+        if series_format is not None:
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.series_path = os.path.join(output_dir, f"{timestamp}_metrics.{series_format}")
+            self._series_file = open(self.series_path, "w", newline="")
+            if series_format == "csv":
+                self._writer = csv.DictWriter(self._series_file, fieldnames=SERIES_FIELDS)
+                self._writer.writeheader()
+
+    @property
+    def address(self):
+        """HTTP 端點的 (主機, 埠)，未啟動時為 None"""
+        return self._server.server_address if self._server is not None else None
+
+    def sample(self):
+        """
+        取一次快照並更新輸出，回傳總計列 (字典)。
+        速率以與上一次快照的差值除以實際經過時間計算。
+        """
+        now = time.perf_counter()
+        interval = max(now - self._last_time, 1e-9)
+        snapshot = self.counters.snapshot().reshape(self.num_workers, len(self.target_labels), -1)
+        delta = snapshot - self._last
+        self._last, self._last_time = snapshot, now
+
+        rows = []
+        wall = datetime.now().isoformat(timespec="milliseconds")
+        elapsed = now - self.start_time
+
+        def row(worker, target, current, change, lag):
+            return {
+                "time": wall,
+                "elapsed_s": round(elapsed, 3),
+                "worker": worker,
+                "target": target,
+                "packets": int(current[1]),
+                "bytes": int(current[0]),
+                "packets_per_s": round(float(change[1]) / interval, 1),
+                "mb_per_s": round(float(change[0]) / BYTES_PER_MB / interval, 3),
+                "send_errors": int(current[2]),
+                "pacing_overruns": int(current[3]),
+                "lag_p50_us": None if lag is None else float(lag[0]),
+                "lag_p99_us": None if lag is None else float(lag[1]),
+            }
+
+        for worker in range(self.num_workers):
+            lag = self.lag_histograms.percentiles([50, 99], worker)
+            for t, label in enumerate(self.target_labels):
+                rows.append(row(worker, label, snapshot[worker, t], delta[worker, t], lag if t == 0 else None))
+        total = row("total", "all", snapshot.sum(axis=(0, 1)), delta.sum(axis=(0, 1)),
+                    self.lag_histograms.percentiles([50, 99]))
+        rows.append(total)
+
+        if self._series_file is not None:
+            if self._writer is not None:
+                self._writer.writerows(rows)
+            else:
+                self._series_file.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows))
+            self._series_file.flush()
+        if self._server is not None:
+            self.prometheus_text = self._render_prometheus(snapshot, rows)
+        return total
+
+    def _render_prometheus(self, snapshot, rows):
+        """產生 Prometheus 文字格式 (計數器為累計值，速率為最近一次取樣的值)"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{{{labels}}} {value}" for labels, value in samples)
+
+        def labels(worker, target):
+            return f'worker="{worker}",target="{target}"'
+
+        cells = [(w, t, label) for w in range(self.num_workers) for t, label in enumerate(self.target_labels)]
+        for i, (field, help_text) in enumerate((("bytes", "已送出的字節數"), ("packets", "已送出的封包數"),
+                                                 ("send_errors", "暫時性發送錯誤次數"),
+                                                 ("pacing_overruns", "節拍落後次數"))):
+            metric(f"udp_sender_{field}_total", "counter", help_text,
+                   [(labels(w, label), int(snapshot[w, t, i])) for w, t, label in cells])
+
+        per_cell = [r for r in rows if r["worker"] != "total"]
+        metric("udp_sender_packets_per_second", "gauge", "最近一次取樣的封包速率",
+               [(labels(r["worker"], r["target"]), r["packets_per_s"]) for r in per_cell])
+        metric("udp_sender_megabytes_per_second", "gauge", "最近一次取樣的 MB/s",
+               [(labels(r["worker"], r["target"]), r["mb_per_s"]) for r in per_cell])
+
+        # 節拍延遲直方圖 (累計區間，單位秒)
+        name = "udp_sender_pacing_lag_seconds"
+        lines.append(f"# HELP {name} 實際發送時刻相對預定時刻的延遲")
+        lines.append(f"# TYPE {name} histogram")
+        bucket_index = np.searchsorted(LAG_BUCKET_EDGES_US, PROMETHEUS_LAG_EDGES_US, side="left")
+        for worker in range(self.num_workers):
+            counts = self.lag_histograms.counts(worker)
+            cumulative = np.cumsum(counts)
+            total = int(cumulative[-1])
+            for edge, index in zip(PROMETHEUS_LAG_EDGES_US, bucket_index):
+                below = int(cumulative[index - 1]) if index > 0 else 0
+                lines.append(f'{name}_bucket{{worker="{worker}",le="{edge / 1e6:g}"}} {below}')
+            lines.append(f'{name}_bucket{{worker="{worker}",le="+Inf"}} {total}')
+            lag_sum = float((counts * LAG_BUCKET_EDGES_US).sum()) / 1e6
+            lines.append(f'{name}_sum{{worker="{worker}"}} {lag_sum:.6f}')
+            lines.append(f'{name}_count{{worker="{worker}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._series_file is not None:
+            self._series_file.close()
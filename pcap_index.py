@@ -0,0 +1,297 @@
+"""
+PCAP 封包索引載入器
+
+以 mmap 映射 PCAP 檔案，並為其中的 UDP 負載建立精簡的
+位移 / 長度 / 時間戳索引 (NumPy 陣列，而非 Python 物件)。
+索引會以旁路檔 (<pcap>.idx) 保存，第二次執行時直接 mmap 載入，
+負載位元組在真正送出之前都不會被複製。
+"""
+
+import mmap
+import os
+import struct
+from array import array
+
+import numpy as np
+
+# PCAP 全域標頭與記錄標頭
+PCAP_GLOBAL_HEADER_SIZE = 24
+PCAP_RECORD_HEADER_SIZE = 16
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+LINKTYPE_ETHERNET = 1
+
+# 乙太網路 / IP / UDP 常數
+ETH_HEADER_SIZE = 14
+ETH_TYPE_IPV4 = 0x0800
+ETH_TYPE_VLAN = 0x8100
+IP_PROTO_UDP = 17
+UDP_HEADER_SIZE = 8
+
+# 索引旁路檔格式: 64 字節標頭 + 緊密排列的索引記錄
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"PCAPIDX1"
+INDEX_HEADER = struct.Struct("<8sQqQ32x")  # magic, 來源檔大小, 來源檔 mtime_ns, 記錄數
+INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"),  # 負載在 PCAP 檔案中的位移
+    ("ts_ns", "<i8"),   # 擷取時間戳 (奈秒)
+    ("length", "<u4"),  # 負載長度
+])
+
+
+def index_path_for(pcap_file):
+    """回傳 PCAP 檔案對應的索引旁路檔路徑"""
+    return pcap_file + INDEX_SUFFIX
+
+
+def _read_global_header(buf):
+    """解析 PCAP 全域標頭，回傳 (位元組序, 時間戳換算倍率)"""
+    if len(buf) < PCAP_GLOBAL_HEADER_SIZE:
+        raise ValueError("檔案過短，不是有效的 PCAP 檔案")
+
+    for endian in ("<", ">"):
+        magic, = struct.unpack_from(endian + "I", buf, 0)
+        if magic == PCAP_MAGIC_USEC:
+            ts_scale = 1000
+            break
+        if magic == PCAP_MAGIC_NSEC:
+            ts_scale = 1
+            break
+    else:
+        raise ValueError("不支援的檔案格式 (僅支援傳統 PCAP)")
+
+    linktype, = struct.unpack_from(endian + "I", buf, 20)
+    if linktype & 0xFFFF != LINKTYPE_ETHERNET:
+        raise ValueError(f"不支援的鏈路層類型: {linktype}")
+
+    return endian, ts_scale
+
+
+def _scan_fixed_stride(buf, endian):
+    """
+    快速路徑: 若所有記錄長度相同 (LiDAR 擷取的常見情況)，
+    直接以跨步視圖一次驗證並取出所有記錄標頭，不需逐筆走訪。
+    """
+    size = len(buf)
+    if size < PCAP_GLOBAL_HEADER_SIZE + PCAP_RECORD_HEADER_SIZE:
+        return None
+
+    caplen, = struct.unpack_from(endian + "I", buf, PCAP_GLOBAL_HEADER_SIZE + 8)
+    stride = PCAP_RECORD_HEADER_SIZE + caplen
+    body = size - PCAP_GLOBAL_HEADER_SIZE
+    if body % stride:
+        return None
+
+    count = body // stride
+    fields = np.ndarray(shape=(count, 4), dtype=endian + "u4", buffer=buf,
+                        offset=PCAP_GLOBAL_HEADER_SIZE, strides=(stride, 4))
+    if not np.all(fields[:, 2] == caplen):
+        return None
+
+    rec_off = (PCAP_GLOBAL_HEADER_SIZE + PCAP_RECORD_HEADER_SIZE
+               + np.arange(count, dtype=np.uint64) * np.uint64(stride))
+    return rec_off, fields[:, 2].astype(np.uint32), fields[:, 0].copy(), fields[:, 1].copy()
+
+
+def _scan_records(buf, endian):
+    """逐筆走訪記錄標頭，只收集位移、長度與時間戳"""
+    record = struct.Struct(endian + "IIII")
+    size = len(buf)
+    rec_off = array("Q")
+    caplens = array("I")
+    secs = array("I")
+    fracs = array("I")
+
+    pos = PCAP_GLOBAL_HEADER_SIZE
+    while pos + PCAP_RECORD_HEADER_SIZE <= size:
+        sec, frac, caplen, _ = record.unpack_from(buf, pos)
+        data_start = pos + PCAP_RECORD_HEADER_SIZE
+        if data_start + caplen > size:
+            print(f"⚠️ PCAP 檔案在位移 {pos} 處被截斷，忽略最後一筆記錄")
+            break
+        rec_off.append(data_start)
+        caplens.append(caplen)
+        secs.append(sec)
+        fracs.append(frac)
+        pos = data_start + caplen
+
+    return (np.frombuffer(rec_off, dtype=np.uint64),
+            np.frombuffer(caplens, dtype=np.uint32),
+            np.frombuffer(secs, dtype=np.uint32),
+            np.frombuffer(fracs, dtype=np.uint32))
+
+
+def _locate_udp_payloads(buf, rec_off, caplens):
+    """
+    以向量化方式解析乙太網路 / IPv4 / UDP 標頭，
+    回傳 (有效記錄的遮罩索引, 負載位移, 負載長度)。
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    rec_off = rec_off.astype(np.int64)
+    caplens = caplens.astype(np.int64)
+    ends = rec_off + caplens
+    keep = np.flatnonzero(caplens >= ETH_HEADER_SIZE + 20 + UDP_HEADER_SIZE)
+    start = rec_off[keep]
+
+    # 乙太網路類型 (支援單層 VLAN 標籤)
+    eth_type = (data[start + 12].astype(np.int64) << 8) | data[start + 13]
+    l3 = start + ETH_HEADER_SIZE
+    vlan = eth_type == ETH_TYPE_VLAN
+    if vlan.any():
+        eth_type[vlan] = (data[start[vlan] + 16].astype(np.int64) << 8) | data[start[vlan] + 17]
+        l3[vlan] += 4
+    sel = (eth_type == ETH_TYPE_IPV4) & (l3 + 20 + UDP_HEADER_SIZE <= ends[keep])
+    keep, l3 = keep[sel], l3[sel]
+
+    # IPv4 標頭: 版本、標頭長度、協定與分片
+    ver_ihl = data[l3]
+    ihl = (ver_ihl & 0x0F).astype(np.int64) * 4
+    ip_len = (data[l3 + 2].astype(np.int64) << 8) | data[l3 + 3]
+    frag = ((data[l3 + 6].astype(np.int64) & 0x3F) << 8) | data[l3 + 7]
+    sel = ((ver_ihl >> 4) == 4) & (ihl >= 20) & (data[l3 + 9] == IP_PROTO_UDP) & (frag == 0)
+    sel &= l3 + ihl + UDP_HEADER_SIZE <= ends[keep]
+    keep, l3, ihl, ip_len = keep[sel], l3[sel], ihl[sel], ip_len[sel]
+
+    # UDP 標頭: 負載長度以 UDP 長度、IP 總長度與擷取長度三者的最小值為準
+    l4 = l3 + ihl
+    udp_len = (data[l4 + 4].astype(np.int64) << 8) | data[l4 + 5]
+    payload_off = l4 + UDP_HEADER_SIZE
+    length = np.minimum(udp_len - UDP_HEADER_SIZE, ip_len - ihl - UDP_HEADER_SIZE)
+    length = np.minimum(length, ends[keep] - payload_off)
+    sel = length > 0  # 確保不為空
+
+    return keep[sel], payload_off[sel], length[sel]
+
+
+def build_index(buf):
+    """為已映射的 PCAP 內容建立 UDP 負載索引"""
+    endian, ts_scale = _read_global_header(buf)
+
+    scanned = _scan_fixed_stride(buf, endian)
+    if scanned is None:
+        scanned = _scan_records(buf, endian)
+    rec_off, caplens, secs, fracs = scanned
+
+    keep, payload_off, length = _locate_udp_payloads(buf, rec_off, caplens)
+
+    index = np.empty(len(keep), dtype=INDEX_DTYPE)
+    index["offset"] = payload_off
+    index["length"] = length
+    index["ts_ns"] = secs[keep].astype(np.int64) * 1_000_000_000 + fracs[keep].astype(np.int64) * ts_scale
+    return index
+
+
+def save_index(index_file, index, source_stat):
+    """將索引寫入旁路檔 (先寫暫存檔再原子替換)"""
+    tmp_file = index_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, source_stat.st_size,
+                                  source_stat.st_mtime_ns, len(index)))
+        index.tofile(f)
+    os.replace(tmp_file, index_file)
+
+
+def load_index(index_file, source_stat):
+    """
+    以 mmap 載入索引旁路檔。
+    若檔案不存在、格式不符或來源檔已變更，回傳 None。
+    """
+    try:
+        with open(index_file, "rb") as f:
+            header = f.read(INDEX_HEADER.size)
+    except OSError:
+        return None
+
+    if len(header) != INDEX_HEADER.size:
+        return None
+    magic, size, mtime_ns, count = INDEX_HEADER.unpack(header)
+    if magic != INDEX_MAGIC or size != source_stat.st_size or mtime_ns != source_stat.st_mtime_ns:
+        return None
+    if os.path.getsize(index_file) != INDEX_HEADER.size + count * INDEX_DTYPE.itemsize:
+        return None
+
+    if count == 0:
+        return np.empty(0, dtype=INDEX_DTYPE)
+    return np.memmap(index_file, dtype=INDEX_DTYPE, mode="r",
+                     offset=INDEX_HEADER.size, shape=(count,))
+
+
+class PcapCorpus:
+    """
+    以 mmap 映射的 PCAP 封包語料。
+
+    `corpus[i]` 回傳第 i 個 UDP 負載的 memoryview (零複製)，
+    可直接交給 socket.sendto()。物件可被 pickle，子進程會重新映射
+    同一份檔案，所有進程共用作業系統的頁面快取。
+    """
+
+    def __init__(self, pcap_file, rebuild=False, verbose=True):
+        self.pcap_file = pcap_file
+        self._rebuild = rebuild
+        self._verbose = verbose
+        self._open()
+
+    def _open(self):
+        source_stat = os.stat(self.pcap_file)
+        with open(self.pcap_file, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        self.data = np.frombuffer(self._mm, dtype=np.uint8)
+
+        index_file = index_path_for(self.pcap_file)
+        index = None if self._rebuild else load_index(index_file, source_stat)
+        if index is None:
+            if self._verbose:
+                print(f"🔍 建立封包索引: {index_file}")
+            index = build_index(self._mm)
+            try:
+                save_index(index_file, index, source_stat)
+            except OSError as e:
+                print(f"⚠️ 無法寫入索引檔 '{index_file}': {e}")
+        elif self._verbose:
+            print(f"📑 載入既有封包索引: {index_file}")
+
+        self.index = index
+        self.offsets = index["offset"]
+        self.lengths = index["length"]
+        self.timestamps_ns = index["ts_ns"]
+        self._rebuild = False
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        offset = int(self.offsets[i])
+        return self._view[offset:offset + int(self.lengths[i])]
+
+    @property
+    def base_address(self):
+        """映射區起始位址 (供 sendmmsg 等需要原始指標的呼叫使用)"""
+        return self.data.ctypes.data
+
+    @property
+    def total_bytes(self):
+        """所有負載的總字節數"""
+        return int(self.lengths.sum(dtype=np.uint64))
+
+    @property
+    def avg_packet_size(self):
+        """負載的平均大小"""
+        return self.total_bytes / len(self) if len(self) else 0.0
+
+    def close(self):
+        """釋放 mmap 與索引"""
+        self.index = self.offsets = self.lengths = self.timestamps_ns = None
+        self.data = None
+        self._view.release()
+        self._mm.close()
+
+    def __getstate__(self):
+        # mmap 無法被 pickle，只傳遞路徑，由子進程自行重新映射
+        return {"pcap_file": self.pcap_file, "verbose": False}
+
+    def __setstate__(self, state):
+        self.pcap_file = state["pcap_file"]
+        self._verbose = state["verbose"]
+        self._rebuild = False
+        self._open()
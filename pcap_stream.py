@@ -0,0 +1,563 @@
+"""
+串流式 PCAP / PCAPNG 封包來源
+
+不建立索引、不映射整個檔案: 背景預讀執行緒以固定大小的區塊讀取擷取檔，
+解析記錄 (傳統 PCAP 或 PCAPNG 的 EPB / SPB)，以向量化方式取出 UDP 負載，
+再填入重複使用的批次緩衝區，經由有界佇列交給發送端。
+
+- 開始發送只需要讀完第一個區塊 (數 MB)，與檔案大小無關
+- 記憶體用量固定: 讀取區塊 + (佇列深度 + 2) 個批次緩衝區
+- 損壞或被截斷的記錄會被回報並跳過，從下一筆看起來有效的記錄重新同步，
+  不會讓整個載入失敗
+- 可指定位元組範圍 (start_byte, end_byte)，讓多個進程各自讀取檔案的一段
+
+PcapStream 的介面與封包語料相同 (對應目前的批次)，送完後呼叫 refill() 換下一批。
+"""
+
+import queue
+import struct
+import threading
+
+import numpy as np
+
+from pcap_index import (LINKTYPE_ETHERNET, PCAP_GLOBAL_HEADER_SIZE, PCAP_MAGIC_NSEC, PCAP_MAGIC_USEC,
+                        PCAP_RECORD_HEADER_SIZE, _locate_udp_payloads)
+
+# PCAPNG 區塊類型
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_OPT_TSRESOL = 9
+
+MAX_RECORD_SIZE = 256 * 1024  # 超過此長度的記錄視為損壞
+CHUNK_BYTES = 8 * 1024 * 1024
+FIRST_READ_BYTES = 256 * 1024
+BATCH_PACKETS = 4096
+BATCH_BYTES = 8 * 1024 * 1024
+QUEUE_DEPTH = 4
+FAST_PATH_MIN_RUN = 64  # 連續等長記錄達此數量才走向量化路徑
+MAX_WARNINGS = 10  # 個別列出的損壞記錄數，之後只累計
+
+
+class StreamBatch:
+    """重複使用的批次緩衝區，介面與封包語料相同"""
+
+    def __init__(self, max_packets=BATCH_PACKETS, max_bytes=BATCH_BYTES):
+        self.data = np.empty(max_bytes, dtype=np.uint8)
+        self._offsets = np.zeros(max_packets, dtype=np.uint64)
+        self._lengths = np.zeros(max_packets, dtype=np.uint32)
+        self._timestamps = np.zeros(max_packets, dtype=np.int64)
+        self._view = memoryview(self.data)
+        self.max_packets = max_packets
+        self.count = 0
+        self.used = 0
+
+    def reset(self):
+        self.count = 0
+        self.used = 0
+
+    def append_run(self, src, payload_off, lengths, ts_ns):
+        """
+        複製一段封包 (src 為區塊緩衝區)，回傳實際放入的數量。
+        等長且等距的一段以單次跨步複製完成，其餘逐封包複製。
+        """
+        fit = min(len(lengths), self.max_packets - self.count)
+        if fit and len(lengths):
+            ends = self.used + np.cumsum(lengths[:fit])
+            fit = int(np.searchsorted(ends, len(self.data), side="right"))
+        if fit == 0:
+            return 0
+
+        lengths = lengths[:fit]
+        payload_off = payload_off[:fit]
+        dst = self.used + np.concatenate([[0], np.cumsum(lengths[:-1])]).astype(np.int64)
+        length = int(lengths[0])
+        strides = np.diff(payload_off)
+        if np.all(lengths == length) and (fit == 1 or np.all(strides == strides[0])):
+            stride = int(strides[0]) if fit > 1 else length
+            source = np.lib.stride_tricks.as_strided(src[int(payload_off[0]):], shape=(fit, length),
+                                                     strides=(stride, 1))
+            self.data[self.used:self.used + fit * length].reshape(fit, length)[:] = source
+        else:
+            view = memoryview(src)
+            for d, s, n in zip(dst.tolist(), payload_off.tolist(), lengths.tolist()):
+                self._view[d:d + n] = view[s:s + n]
+
+        self._offsets[self.count:self.count + fit] = dst
+        self._lengths[self.count:self.count + fit] = lengths
+        self._timestamps[self.count:self.count + fit] = ts_ns[:fit]
+        self.count += fit
+        self.used = int(dst[-1]) + int(lengths[-1])
+        return fit
+
+    @property
+    def offsets(self):
+        return self._offsets[:self.count]
+
+    @property
+    def lengths(self):
+        return self._lengths[:self.count]
+
+    @property
+    def timestamps_ns(self):
+        return self._timestamps[:self.count]
+
+
+class _ClassicPcapParser:
+    """傳統 PCAP 記錄解析 (含向量化的固定長度快速路徑)"""
+
+    def __init__(self, header):
+        for endian in ("<", ">"):
+            magic, = struct.unpack_from(endian + "I", header, 0)
+            if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+                break
+        else:
+            raise ValueError("不是 PCAP 檔案")
+        self.endian = endian
+        self.ts_scale = 1000 if magic == PCAP_MAGIC_USEC else 1
+        self.frac_limit = 1_000_000 if magic == PCAP_MAGIC_USEC else 1_000_000_000
+        linktype, = struct.unpack_from(endian + "I", header, 20)
+        if linktype & 0xFFFF != LINKTYPE_ETHERNET:
+            raise ValueError(f"不支援的鏈路層類型: {linktype}")
+        self.data_start = PCAP_GLOBAL_HEADER_SIZE
+        self._record = struct.Struct(endian + "IIII")
+
+    def _valid_header(self, sec, frac, caplen, origlen):
+        return 0 < caplen <= MAX_RECORD_SIZE and caplen <= origlen and frac < self.frac_limit
+
+    def scan(self, buf, pos, filled):
+        """
+        解析 buf[pos:filled] 中完整的記錄。
+        回傳 (記錄資料位移, 擷取長度, 時間戳, 記錄起點, 下一個位置, 是否遇到損壞)。
+        """
+        rec_off, caplens, ts, starts = [], [], [], []
+        header = PCAP_RECORD_HEADER_SIZE
+
+        # 快速路徑: 等長記錄以跨步視圖一次驗證
+        if pos + header <= filled:
+            first = self._record.unpack_from(buf, pos)
+            stride = header + first[2]
+            count = (filled - pos) // stride if self._valid_header(*first) else 0
+            if count >= FAST_PATH_MIN_RUN and self._uniform(buf, pos, stride, first[2], FAST_PATH_MIN_RUN):
+                fields = np.ndarray(shape=(count, 4), dtype=self.endian + "u4", buffer=buf,
+                                    offset=pos, strides=(stride, 4))
+                ok = (fields[:, 2] == first[2]) & (fields[:, 3] >= first[2]) & (fields[:, 1] < self.frac_limit)
+                run = count if ok.all() else int(np.argmin(ok))
+                if run:
+                    starts_arr = pos + np.arange(run, dtype=np.int64) * stride
+                    ts_arr = (fields[:run, 0].astype(np.int64) * 1_000_000_000
+                              + fields[:run, 1].astype(np.int64) * self.ts_scale)
+                    return (starts_arr + header, np.full(run, first[2], dtype=np.int64), ts_arr,
+                            starts_arr, pos + run * stride, False)
+
+        while pos + header <= filled:
+            sec, frac, caplen, origlen = self._record.unpack_from(buf, pos)
+            if not self._valid_header(sec, frac, caplen, origlen):
+                return self._result(rec_off, caplens, ts, starts, pos, True)
+            if pos + header + caplen > filled:
+                break
+            starts.append(pos)
+            rec_off.append(pos + header)
+            caplens.append(caplen)
+            ts.append(sec * 1_000_000_000 + frac * self.ts_scale)
+            pos += header + caplen
+        return self._result(rec_off, caplens, ts, starts, pos, False)
+
+    def _uniform(self, buf, pos, stride, caplen, count):
+        """前 count 筆記錄是否都等長 (不等長的擷取檔直接走逐筆解析，避免反覆的向量化嘗試)"""
+        fields = np.ndarray(shape=(count, 4), dtype=self.endian + "u4", buffer=buf, offset=pos, strides=(stride, 4))
+        return bool(np.all(fields[:, 2] == caplen))
+
+    @staticmethod
+    def _result(rec_off, caplens, ts, starts, pos, corrupt):
+        return (np.asarray(rec_off, dtype=np.int64), np.asarray(caplens, dtype=np.int64),
+                np.asarray(ts, dtype=np.int64), np.asarray(starts, dtype=np.int64), pos, corrupt)
+
+    def resync(self, buf, pos, filled):
+        """
+        從 pos 之後找下一個有效的記錄起點 (本筆與下一筆的標頭都必須合理)。
+        找不到時回傳 None。
+        """
+        header = PCAP_RECORD_HEADER_SIZE
+        n = filled - pos - 1 - header
+        if n <= 0:
+            return None
+        fields = np.ndarray(shape=(n, 4), dtype=self.endian + "u4", buffer=buf, offset=pos + 1, strides=(1, 4))
+        caplen = fields[:, 2]
+        ok = (caplen > 0) & (caplen <= MAX_RECORD_SIZE) & (caplen <= fields[:, 3]) & (fields[:, 1] < self.frac_limit)
+        for candidate in (pos + 1 + np.flatnonzero(ok)).tolist():
+            following = candidate + header + self._record.unpack_from(buf, candidate)[2]
+            if following + header > filled:
+                return candidate  # 下一筆不在緩衝區內，無法再驗證
+            if self._valid_header(*self._record.unpack_from(buf, following)):
+                return candidate
+        return None
+
+
+class _PcapngParser:
+    """PCAPNG 區塊解析 (SHB / IDB / EPB / SPB，其餘區塊略過)"""
+
+    def __init__(self, header):
+        self.endian = "<"
+        self.interfaces = []  # [(鏈路層類型, 時間戳換算為奈秒的倍率)]
+        self.data_start = 0
+        self.non_ethernet = 0
+        self._last_ts = 0
+        self._set_byte_order(header, 0)
+
+    def _set_byte_order(self, buf, pos):
+        for endian in ("<", ">"):
+            magic, = struct.unpack_from(endian + "I", buf, pos + 8)
+            if magic == PCAPNG_BYTE_ORDER_MAGIC:
+                self.endian = endian
+                return
+        raise ValueError("PCAPNG 區段標頭的位元組序標記無效")
+
+    def _block_ok(self, buf, pos, filled):
+        """檢查 pos 處的區塊長度欄位；回傳 (區塊類型, 總長度) 或 None (損壞)，資料不足時總長度為 0"""
+        block_type, total = struct.unpack_from(self.endian + "II", buf, pos)
+        if block_type == PCAPNG_SHB:
+            # 區段標頭可能改變位元組序
+            for endian in ("<", ">"):
+                if struct.unpack_from(endian + "I", buf, pos + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC:
+                    total, = struct.unpack_from(endian + "I", buf, pos + 4)
+                    break
+        if total < 12 or total % 4 or total > MAX_RECORD_SIZE + 64:
+            return None
+        if pos + total > filled:
+            return block_type, 0
+        trailer, = struct.unpack_from(self.endian + "I", buf, pos + total - 4)
+        if block_type == PCAPNG_SHB:
+            return block_type, total
+        return (block_type, total) if trailer == total else None
+
+    def _parse_idb(self, buf, pos, total):
+        linktype, = struct.unpack_from(self.endian + "H", buf, pos + 8)
+        scale = 1000  # 預設微秒
+        opt = pos + 16
+        while opt + 4 <= pos + total - 4:
+            code, length = struct.unpack_from(self.endian + "HH", buf, opt)
+            if code == 0:
+                break
+            if code == PCAPNG_OPT_TSRESOL and length >= 1:
+                resol = int(buf[opt + 4])
+                units_per_sec = 2 ** (resol & 0x7F) if resol & 0x80 else 10 ** resol
+                scale = 1e9 / units_per_sec
+            opt += 4 + ((length + 3) & ~3)
+        self.interfaces.append((linktype, scale))
+
+    def scan(self, buf, pos, filled):
+        rec_off, caplens, ts, starts = [], [], [], []
+        while pos + 12 <= filled:
+            block = self._block_ok(buf, pos, filled)
+            if block is None:
+                return _ClassicPcapParser._result(rec_off, caplens, ts, starts, pos, True)
+            block_type, total = block
+            if total == 0:
+                break
+
+            if block_type == PCAPNG_SHB:
+                self._set_byte_order(buf, pos)
+                self.interfaces = []
+            elif block_type == PCAPNG_IDB:
+                self._parse_idb(buf, pos, total)
+            elif block_type == PCAPNG_EPB:
+                iface, ts_high, ts_low, caplen = struct.unpack_from(self.endian + "IIII", buf, pos + 8)
+                if iface >= len(self.interfaces) or 28 + caplen > total:
+                    return _ClassicPcapParser._result(rec_off, caplens, ts, starts, pos, True)
+                linktype, scale = self.interfaces[iface]
+                self._last_ts = int(((ts_high << 32) | ts_low) * scale)
+                if linktype == LINKTYPE_ETHERNET:
+                    starts.append(pos)
+                    rec_off.append(pos + 28)
+                    caplens.append(caplen)
+                    ts.append(self._last_ts)
+                else:
+                    self.non_ethernet += 1
+            elif block_type == PCAPNG_SPB:
+                origlen, = struct.unpack_from(self.endian + "I", buf, pos + 8)
+                if self.interfaces and self.interfaces[0][0] == LINKTYPE_ETHERNET:
+                    starts.append(pos)
+                    rec_off.append(pos + 12)
+                    caplens.append(min(origlen, total - 16))
+                    ts.append(self._last_ts)  # SPB 沒有時間戳，沿用前一個
+            pos += total
+        return _ClassicPcapParser._result(rec_off, caplens, ts, starts, pos, False)
+
+    def resync(self, buf, pos, filled):
+        """從 pos 之後找下一個長度欄位前後一致的 EPB / SPB 區塊"""
+        n = filled - pos - 1 - 12
+        if n <= 0:
+            return None
+        fields = np.ndarray(shape=(n, 2), dtype=self.endian + "u4", buffer=buf, offset=pos + 1, strides=(1, 4))
+        ok = ((fields[:, 0] == PCAPNG_EPB) | (fields[:, 0] == PCAPNG_SPB)) & (fields[:, 1] >= 12)
+        ok &= (fields[:, 1] % 4 == 0) & (fields[:, 1] <= MAX_RECORD_SIZE + 64)
+        for candidate in (pos + 1 + np.flatnonzero(ok)).tolist():
+            if self._block_ok(buf, candidate, filled) is not None:
+                return candidate
+        return None
+
+    def read_preamble(self, f, size=1024 * 1024):
+        """先讀檔案開頭的區段 / 介面描述區塊，讓從檔案中段開始的讀取也知道各介面的格式"""
+        head = bytearray(f.read(size))
+        self.scan(head, 0, len(head))
+
+
+def _open_parser(path):
+    """讀取檔頭並建立對應格式的解析器"""
+    with open(path, "rb") as f:
+        header = f.read(PCAP_GLOBAL_HEADER_SIZE)
+        if len(header) < 12:
+            raise ValueError("檔案過短，不是有效的 PCAP / PCAPNG 檔案")
+        if struct.unpack_from("<I", header, 0)[0] == PCAPNG_SHB:
+            parser = _PcapngParser(header)
+            f.seek(0)
+            parser.read_preamble(f)
+            return parser
+    if len(header) < PCAP_GLOBAL_HEADER_SIZE:
+        raise ValueError("檔案過短，不是有效的 PCAP 檔案")
+    return _ClassicPcapParser(header)
+
+
+class PcapStream:
+    """
+    背景預讀的串流封包來源。
+
+    loop=True 時讀到範圍結尾會從頭再讀 (循環發送)；False 時 refill() 在結尾回傳 False。
+    start_byte / end_byte 限定只處理起點落在此範圍內的記錄 (start_byte 之後會自動重新同步)。
+    """
+
+    def __init__(self, path, start_byte=0, end_byte=None, loop=True, batch_packets=BATCH_PACKETS,
+                 batch_bytes=BATCH_BYTES, queue_depth=QUEUE_DEPTH, chunk_bytes=CHUNK_BYTES, verbose=True):
+        self.path = path
+        self.loop = loop
+        self.verbose = verbose
+        self._parser = _open_parser(path)
+        self._chunk_bytes = chunk_bytes
+        self.start_byte = start_byte
+        self.end_byte = end_byte
+        self.stats = {"records": 0, "udp_packets": 0, "corrupt": 0, "skipped_bytes": 0, "truncated": 0, "passes": 0}
+
+        # 批次緩衝區池: free 佇列裝空批次，ready 佇列裝已填好的批次 (皆有界)
+        self._free = queue.Queue()
+        self._ready = queue.Queue(maxsize=queue_depth)
+        for _ in range(queue_depth + 2):
+            self._free.put(StreamBatch(batch_packets, batch_bytes))
+        self._stop = threading.Event()
+        self._delivered = False
+        self._thread = threading.Thread(target=self._prefetch, daemon=True)
+        self._thread.start()
+
+        self._empty = StreamBatch(1, 1)
+        self._current = None
+        if not self.refill():
+            self._current = self._empty  # 沒有任何 UDP 封包
+
+    # ------------------------------------------------------------------
+    # 背景執行緒
+
+    def _warn(self, message):
+        if self.verbose and self.stats["corrupt"] + self.stats["truncated"] <= MAX_WARNINGS:
+            print(f"⚠️ {self.path}: {message}")
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _take_free(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._free.get(timeout=0.1)
+                batch.reset()
+                return batch
+            except queue.Empty:
+                continue
+        return None
+
+    def _prefetch(self):
+        try:
+            self._prefetch_loop()
+        except Exception as e:  # 交給消費端在 refill() 中拋出
+            self._put(e)
+
+    def _prefetch_loop(self):
+        parser = self._parser
+        start_byte, end_byte = self.start_byte, self.end_byte
+        # 不初始化內容 (清零數十 MB 會拖慢第一個批次)
+        buf = np.empty(2 * self._chunk_bytes + MAX_RECORD_SIZE + 64, dtype=np.uint8)
+        batch = self._take_free()
+        first_record = None  # 第一輪同步後的起點，之後的循環直接從這裡開始
+
+        with open(self.path, "rb", buffering=0) as f:
+            while not self._stop.is_set():
+                base = first_record if first_record is not None else max(start_byte, parser.data_start)
+                f.seek(base)
+                filled = pos = 0
+                eof = done = False
+                # 範圍起點不一定落在記錄邊界上，先重新同步
+                syncing = first_record is None and start_byte > parser.data_start
+
+                while not done and not self._stop.is_set():
+                    # 把未處理的尾端移到開頭，再讀入下一個區塊
+                    if pos:
+                        buf[:filled - pos] = buf[pos:filled]
+                        base += pos
+                        filled -= pos
+                        pos = 0
+                    if not eof and filled <= self._chunk_bytes:
+                        # 第一次只讀一小段，盡快交出第一個批次
+                        size = self._chunk_bytes if self._delivered else FIRST_READ_BYTES
+                        n = f.readinto(memoryview(buf)[filled:filled + size])
+                        eof = n == 0
+                        filled += n
+
+                    progress = True
+                    while progress and not done:
+                        if syncing:
+                            found = parser.resync(buf, pos - 1, filled)
+                            skip = found if found is not None else (filled if eof else max(pos, filled - 64))
+                            if first_record is not None:
+                                self.stats["skipped_bytes"] += skip - pos
+                            pos = skip
+                            if found is None:
+                                break
+                            syncing = False
+                        if first_record is None:
+                            if end_byte is not None and base + pos >= end_byte:
+                                done = True
+                                break
+                            first_record = base + pos
+
+                        rec_off, caplens, ts, starts, next_pos, corrupt = parser.scan(buf, pos, filled)
+                        if end_byte is not None:
+                            inside = int(np.count_nonzero(base + starts < end_byte))
+                            if inside < len(starts) or base + next_pos >= end_byte:
+                                rec_off, caplens, ts = rec_off[:inside], caplens[:inside], ts[:inside]
+                                done = True
+                        if len(rec_off):
+                            self.stats["records"] += len(rec_off)
+                            keep, payload_off, length = _locate_udp_payloads(buf, rec_off, caplens)
+                            batch = self._emit(batch, buf, payload_off, length, ts[keep])
+                            if batch is None:
+                                return
+                        progress = next_pos > pos
+                        pos = next_pos
+                        if corrupt and not done:
+                            self.stats["corrupt"] += 1
+                            self._warn(f"位移 {base + pos} 處的記錄損壞，略過並重新同步")
+                            syncing = progress = True
+
+                    if not self._delivered and batch.count:
+                        batch = self._deliver(batch)
+                        if batch is None:
+                            return
+
+                    if eof and not done:
+                        if pos < filled and not syncing:
+                            self.stats["truncated"] += 1
+                            self._warn(f"檔案在位移 {base + pos} 處被截斷，忽略最後 {filled - pos} 字節")
+                        done = True
+
+                self.stats["passes"] += 1
+                if not self.loop or first_record is None:
+                    break
+
+        if batch is not None and batch.count and not self._put(batch):
+            return
+        self._put(None)
+
+    def _emit(self, batch, data, payload_off, length, ts):
+        """將負載依序填入批次，滿了就送進 ready 佇列並取下一個空批次"""
+        self.stats["udp_packets"] += len(length)
+        i = 0
+        while i < len(length):
+            taken = batch.append_run(data, payload_off[i:], length[i:], ts[i:])
+            i += taken
+            if i < len(length) or batch.count == batch.max_packets:
+                if batch.count == 0:
+                    raise ValueError(f"單一封包 ({int(length[i])} 字節) 超過批次緩衝區大小")
+                batch = self._deliver(batch)
+                if batch is None:
+                    return None
+        return batch
+
+    def _deliver(self, batch):
+        """把填好的批次送進 ready 佇列，回傳下一個空批次 (停止時為 None)"""
+        if not self._put(batch):
+            return None
+        self._delivered = True
+        return self._take_free()
+
+    # ------------------------------------------------------------------
+    # 消費端
+
+    def refill(self):
+        """換成下一個批次 (必要時等待預讀)；沒有更多資料時回傳 False"""
+        item = self._ready.get()
+        if isinstance(item, Exception):
+            raise item
+        if item is None:
+            self._ready.put(None)  # 讓之後的呼叫也看到結尾
+            return False
+        if self._current is not None and self._current is not self._empty:
+            self._free.put(self._current)
+        self._current = item
+        return True
+
+    def __len__(self):
+        return self._current.count
+
+    def __getitem__(self, i):
+        offset = int(self._current.offsets[i])
+        return self._current._view[offset:offset + int(self._current.lengths[i])]
+
+    @property
+    def data(self):
+        return self._current.data
+
+    @property
+    def offsets(self):
+        return self._current.offsets
+
+    @property
+    def lengths(self):
+        return self._current.lengths
+
+    @property
+    def timestamps_ns(self):
+        return self._current.timestamps_ns
+
+    @property
+    def base_address(self):
+        return self._current.data.ctypes.data
+
+    @property
+    def total_bytes(self):
+        return self._current.used
+
+    @property
+    def avg_packet_size(self):
+        return self._current.used / self._current.count if self._current.count else 0.0
+
+    def report(self):
+        """列印串流讀取的統計"""
+        s = self.stats
+        print(f"📼 {self.path}: 已讀 {s['records']} 筆記錄 / {s['udp_packets']} 個 UDP 封包 ({s['passes']} 輪), "
+              f"損壞 {s['corrupt']} 處 (跳過 {s['skipped_bytes']} 字節), 截斷 {s['truncated']} 次")
+
+    def close(self):
+        """停止預讀執行緒"""
+        self._stop.set()
+        while True:
+            try:
+                self._ready.get_nowait()
+            except queue.Empty:
+                break
+        self._thread.join(timeout=2)
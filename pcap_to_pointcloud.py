@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# pcap_to_pointcloud.py - 離線將 LiDAR PCAP 擷取檔轉換為逐幀點雲
+
+"""
+離線 PCAP → 點雲轉換器
+
+依照 udp_receiver_node.cpp 的規則組幀:
+- 先依回波模式過濾，類型為上 / 下半部的封包才參與配對
+- 收齊上半部與下半部即完成一條掃描線，LINES_PER_FRAME 條線為一幀
+- 接收端每條線只保留完成配對那個封包的點 (line_points 每包清空)；
+  加上 --all-points 則保留整條線所有封包的點
+
+組幀計畫在主進程以向量化方式一次算出，之後依位元組範圍 (連續的幀區塊)
+分給進程池解碼，各進程直接寫入同一個記憶體映射的 .npy 輸出檔中互不重疊的區段。
+另輸出幀索引檔，下游工具可直接開啟第 k 幀而不必解析其他資料 (見 load_frame())。
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from lidar_decoder import ECHO_MODES, LidarDecoder, load_lookup_table
+from lidar_packet import LINES_PER_FRAME, POINTS_PER_PACKET, line_ends, packet_matrix, packet_types, valid_packets
+from pcap_index import PcapCorpus
+
+# 輸出點格式與 PointCloud2 訊息相同: 5 個 float (x, y, z, intensity, echo_num)
+CLOUD_DTYPE = np.dtype([
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("z", "<f4"),
+    ("intensity", "<f4"),
+    ("echo_num", "<f4"),
+])
+
+# 幀索引: 每幀在點檔中的位置與來源封包範圍
+FRAME_INDEX_DTYPE = np.dtype([
+    ("point_start", "<u8"),
+    ("point_count", "<u8"),
+    ("packet_start", "<u8"),  # 此幀在計畫封包清單中的起點
+    ("packet_count", "<u8"),
+    ("first_packet", "<u8"),  # 語料中的第一個 / 最後一個封包索引
+    ("last_packet", "<u8"),
+    ("ts_start_ns", "<i8"),
+    ("ts_end_ns", "<i8"),
+])
+
+
+def setup_logging(log_level):
+    """設定日誌格式與級別"""
+    log_format = '%(asctime)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=log_level, format=log_format)
+    return logging.getLogger(__name__)
+
+
+def ensure_output_dir(output_dir):
+    """確保輸出資料夾存在"""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        logging.info(f"建立輸出資料夾: {output_dir}")
+    return output_dir
+
+
+def get_timestamp():
+    """產生 YYYYMMDD_HHMMSS 格式的時間戳記"""
+    return datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+def parse_arguments():
+    """解析命令列參數"""
+    parser = argparse.ArgumentParser(description='將 LiDAR PCAP 擷取檔離線轉換為逐幀點雲')
+    parser.add_argument('--input', type=str, default='input/bu25_no6_20250319.pcap',
+                        help='輸入 PCAP 檔案路徑')
+    parser.add_argument('--output', type=str, default='output',
+                        help='輸出資料夾 (預設: output)')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                        help='解碼進程數 (預設: CPU 核心數)')
+    parser.add_argument('--echo-mode', choices=ECHO_MODES, default='all',
+                        help='回波選擇模式 (與接收節點的 echo_mode 參數相同)')
+    parser.add_argument('--all-points', action='store_true',
+                        help='保留整條掃描線所有封包的點 (預設比照接收端只保留完成配對的封包)')
+    parser.add_argument('--ply', action='store_true',
+                        help='另外為每一幀輸出 binary little-endian PLY 檔')
+    parser.add_argument('--max-frames', type=int, default=0,
+                        help='最多轉換的幀數 (0 表示全部)')
+    parser.add_argument('--log-level', type=str, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                        default='INFO', help='日誌級別')
+    return parser.parse_args()
+
+
+def plan_frames(corpus, echo_mode='all', all_points=False, max_frames=0, azimuth_limit=None):
+    """
+    依接收端規則計算組幀計畫 (無法解出任何點的封包不參與配對，與接收端相同)。
+
+    回傳 (frame_packets, frame_index)：frame_packets 為依序排列的語料封包索引，
+    frame_index 的 packet_start / packet_count 指向其中屬於各幀的區段。
+    """
+    total = len(corpus)
+    valid = valid_packets(corpus, echo_mode, azimuth_limit=azimuth_limit)
+    packet_type = packet_types(corpus)
+
+    valid_idx = np.flatnonzero(valid)
+    ends = line_ends(packet_type[valid_idx], include_partial=False)
+    num_frames = len(ends) // LINES_PER_FRAME
+    if max_frames:
+        num_frames = min(num_frames, max_frames)
+    logging.info(f"有效封包 {len(valid_idx)}/{total}, 完整掃描線 {len(ends)}, 完整幀 {num_frames}")
+
+    frame_line_ends = ends[:num_frames * LINES_PER_FRAME].reshape(num_frames, LINES_PER_FRAME)
+    if all_points:
+        # 每幀包含上一幀結束後到本幀最後一條線結束的所有有效封包
+        stops = frame_line_ends[:, -1]
+        starts = np.concatenate([[0], stops[:-1]])
+        frame_packets = valid_idx[:stops[-1]] if num_frames else valid_idx[:0]
+        counts = stops - starts
+    else:
+        # 比照接收端: 每條線只有完成配對的那個封包
+        frame_packets = valid_idx[frame_line_ends.ravel() - 1]
+        starts = np.arange(num_frames) * LINES_PER_FRAME
+        counts = np.full(num_frames, LINES_PER_FRAME)
+
+    frame_index = np.zeros(num_frames, dtype=FRAME_INDEX_DTYPE)
+    frame_index['packet_start'] = starts
+    frame_index['packet_count'] = counts
+    frame_index['point_count'] = counts * POINTS_PER_PACKET
+    frame_index['point_start'] = np.concatenate([[0], np.cumsum(frame_index['point_count'])[:-1]]) if num_frames else []
+    if num_frames:
+        first = frame_packets[starts]
+        last = frame_packets[starts + counts - 1]
+        frame_index['first_packet'] = first
+        frame_index['last_packet'] = last
+        frame_index['ts_start_ns'] = np.asarray(corpus.timestamps_ns)[first]
+        frame_index['ts_end_ns'] = np.asarray(corpus.timestamps_ns)[last]
+    return frame_packets, frame_index
+
+
+def split_tasks(frame_index, num_tasks):
+    """將連續的幀切成點數大致相等的區塊，每個區塊對應擷取檔中連續的位元組範圍"""
+    if not len(frame_index):
+        return []
+    cumulative = np.cumsum(frame_index['point_count'])
+    targets = cumulative[-1] * np.arange(1, num_tasks) / num_tasks
+    cuts = np.unique(np.concatenate([[0], np.searchsorted(cumulative, targets) + 1, [len(frame_index)]]))
+    cuts = cuts[cuts <= len(frame_index)]
+    return [(int(lo), int(hi)) for lo, hi in zip(cuts[:-1], cuts[1:]) if hi > lo]
+
+
+def write_ply(path, points):
+    """輸出 binary little-endian PLY (欄位與點檔相同)"""
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        f"element vertex {len(points)}\n"
+        "property float x\n"
+        "property float y\n"
+        "property float z\n"
+        "property float intensity\n"
+        "property float echo_num\n"
+        "end_header\n"
+    )
+    with open(path, 'wb') as f:
+        f.write(header.encode('ascii'))
+        points.tofile(f)
+
+
+# 進程池工作者的全域狀態 (每個進程初始化一次)
+_worker = {}
+
+
+def _init_worker(pcap_file, points_path, frame_packets, frame_index, echo_mode, ply_prefix):
+    _worker['corpus'] = PcapCorpus(pcap_file, verbose=False)
+    _worker['points'] = np.load(points_path, mmap_mode='r+')
+    _worker['frame_packets'] = frame_packets
+    _worker['frame_index'] = frame_index
+    _worker['decoder'] = LidarDecoder(load_lookup_table())
+    _worker['echo_mode'] = echo_mode
+    _worker['ply_prefix'] = ply_prefix
+
+
+def _convert_frames(task):
+    """解碼一段連續的幀並寫入輸出檔對應的區段"""
+    lo, hi = task
+    frame_index = _worker['frame_index']
+    points = _worker['points']
+    decoder = _worker['decoder']
+
+    for frame in frame_index[lo:hi]:
+        start = int(frame['packet_start'])
+        packets = _worker['frame_packets'][start:start + int(frame['packet_count'])]
+        matrix, _ = packet_matrix(_worker['corpus'], packets)
+        decoded = decoder.decode(matrix, _worker['echo_mode'])
+
+        point_start = int(frame['point_start'])
+        target = points[point_start:point_start + len(decoded)]
+        for field in CLOUD_DTYPE.names:
+            target[field] = decoded[field]
+
+    points.flush()
+    if _worker['ply_prefix']:
+        for k in range(lo, hi):
+            frame = frame_index[k]
+            start = int(frame['point_start'])
+            write_ply(f"{_worker['ply_prefix']}_{k:05d}.ply", points[start:start + int(frame['point_count'])])
+    return hi - lo
+
+
+def load_frame(points_path, index_path, k):
+    """以記憶體映射開啟第 k 幀的點 (不讀取其他幀)"""
+    frame_index = np.load(index_path, mmap_mode='r')
+    points = np.load(points_path, mmap_mode='r')
+    frame = frame_index[k]
+    start = int(frame['point_start'])
+    return points[start:start + int(frame['point_count'])]
+
+
+def convert(args):
+    """執行轉換，回傳 (點檔路徑, 幀索引路徑, 幀數, 點數)"""
+    corpus = PcapCorpus(args.input)
+    frame_packets, frame_index = plan_frames(corpus, args.echo_mode, args.all_points, args.max_frames,
+                                             azimuth_limit=len(load_lookup_table()))
+    corpus.close()
+    if not len(frame_index):
+        raise ValueError("擷取檔中沒有任何完整的幀")
+
+    output_dir = ensure_output_dir(args.output)
+    stem = os.path.splitext(os.path.basename(args.input))[0]
+    prefix = os.path.join(output_dir, f"{get_timestamp()}_{stem}")
+    points_path = f"{prefix}_points.npy"
+    index_path = f"{prefix}_frames.npy"
+    total_points = int(frame_index['point_count'].sum())
+
+    # 預先建立輸出檔，各進程只寫入自己負責的區段
+    points = np.lib.format.open_memmap(points_path, mode='w+', dtype=CLOUD_DTYPE, shape=(total_points,))
+    del points
+    np.save(index_path, frame_index)
+
+    ply_prefix = None
+    if args.ply:
+        ply_dir = ensure_output_dir(f"{prefix}_ply")
+        ply_prefix = os.path.join(ply_dir, 'frame')
+
+    tasks = split_tasks(frame_index, max(1, args.processes) * 4)
+    logging.info(f"以 {args.processes} 個進程轉換 {len(frame_index)} 幀 ({total_points} 點), 共 {len(tasks)} 個區塊")
+
+    done = 0
+    init_args = (args.input, points_path, frame_packets, frame_index, args.echo_mode, ply_prefix)
+    with multiprocessing.Pool(max(1, args.processes), initializer=_init_worker, initargs=init_args) as pool:
+        for converted in pool.imap_unordered(_convert_frames, tasks):
+            done += converted
+            logging.info(f"進度: {done}/{len(frame_index)} 幀 ({done * 100 / len(frame_index):.1f}%)")
+
+    return points_path, index_path, len(frame_index), total_points
+
+
+def main():
+    """主程式"""
+    start_time = time.time()
+    args = parse_arguments()
+    logger = setup_logging(getattr(logging, args.log_level))
+    logger.info(f"開始轉換: {args.input}")
+
+    if not os.path.exists(args.input):
+        logger.error(f"找不到 PCAP 檔案: {args.input}")
+        return 1
+
+    try:
+        points_path, index_path, num_frames, total_points = convert(args)
+    except KeyboardInterrupt:
+        logger.warning("使用者中斷轉換")
+        return 1
+    except Exception as e:
+        logger.error(f"轉換時發生錯誤: {str(e)}", exc_info=True)
+        return 1
+
+    elapsed_time = time.time() - start_time
+    logger.info(f"轉換完成，耗時 {elapsed_time:.2f} 秒 ({total_points / elapsed_time / 1e6:.1f} M 點/秒)")
+    logger.info(f"  - 點檔: {points_path}")
+    logger.info(f"  - 幀索引: {index_path} ({num_frames} 幀)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,462 @@
+"""
+量子模擬後端的可重現基準測試
+
+對每個 (後端, 量子比特數) 測試點啟動一個獨立的子進程 (worker)，在子進程內:
+
+1. setup()   : 載入後端套件、設定 target 與亂數種子 (每個進程一次)
+2. compile() : 建立並編譯 GHZ 電路，計時為 compile_s
+3. warmup 次 : execute() 不計入統計 (第一次的時間另記為 first_execute_s，通常含 JIT)
+4. repeat 次 : execute() 計時，回傳所有執行時間
+
+父進程為每個子進程設定逾時與記憶體上限 (定期讀取 /proc/<pid>/status 的 VmRSS，
+超過即終止；不使用 RLIMIT_AS，GPU 後端初始化時會保留大量虛擬位址)，
+並以執行時間的中位數 / p95 彙整。每完成一個測試點就寫入 JSON (完整資料) 與 CSV (每點一列)，
+重新執行同一個結果檔時略過已完成的測試點，可從中斷處接續。
+
+後端以 register_backend 註冊 (見 Backend)，或以 "模組:類別" 指定外部的後端類別。
+內建: tensornet / tensornet-mps / nvidia / qpp-cpu (CUDA-Q) 與 numpy (純 NumPy 狀態向量，
+不需要 CUDA-Q，用於驗證流程)。
+"""
+
+import argparse
+import csv
+import importlib
+import json
+import os
+import platform
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_BACKEND = "tensornet"
+DEFAULT_WARMUP = 1
+DEFAULT_REPEAT = 5
+DEFAULT_SHOTS = 1000
+DEFAULT_SEED = 1234
+DEFAULT_TIMEOUT_S = 1800.0
+DEFAULT_MEMORY_LIMIT_MB = 16384
+# 子進程記憶體的檢查間隔 (秒)
+POLL_INTERVAL_S = 0.1
+
+RESULT_FIELDS = ["backend", "qubits", "status", "compile_s", "first_execute_s", "execute_median_s", "execute_p95_s",
+                 "execute_min_s", "execute_max_s", "warmup", "repeat", "shots", "peak_rss_mb", "wall_s", "error",
+                 "timestamp"]
+# 結果檔的 config 與目前設定不同時不可接續 (量子比特範圍可以不同)
+CONFIG_KEYS = ["backend", "warmup", "repeat", "shots", "seed"]
+
+BACKENDS = {}
+
+
+def register_backend(cls):
+    """註冊後端類別 (以 cls.name 為鍵)，可作為裝飾器使用"""
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+class Backend:
+    """
+    後端介面。子類別設定 name 並實作 compile() 與 execute()；
+    setup() 在 worker 進程中只呼叫一次，version() 記錄於結果檔以便重現。
+    """
+
+    name = None
+
+    def setup(self, seed):
+        pass
+
+    def version(self):
+        return ""
+
+    def compile(self, qubits):
+        """建立 qubits 個量子比特的 GHZ 電路並編譯，回傳 execute() 使用的物件"""
+        raise NotImplementedError
+
+    def execute(self, kernel, shots):
+        """執行並取樣 shots 次，回傳取樣結果 (只用於確認有實際執行)"""
+        raise NotImplementedError
+
+
+class CudaqBackend(Backend):
+    """CUDA-Q 後端；target 在進程內只設定一次"""
+
+    target = None
+
+    def setup(self, seed):
+        import cudaq
+        self.cudaq = cudaq
+        cudaq.set_target(self.target)
+        cudaq.set_random_seed(seed)
+
+    def version(self):
+        return getattr(self.cudaq, "__version__", "")
+
+    def compile(self, qubits):
+        cudaq = self.cudaq
+
+        @cudaq.kernel
+        def circuit():
+            q = cudaq.qvector(qubits)
+            h(q[0])
+            for i in range(1, qubits):
+                x.ctrl(q[0], q[i])
+            mz(q)
+
+        # 較新的 CUDA-Q 可預先編譯；舊版在第一次執行時才編譯 (計入 first_execute_s)
+        if hasattr(circuit, "compile"):
+            circuit.compile()
+        return circuit
+
+    def execute(self, kernel, shots):
+        return self.cudaq.sample(kernel, shots_count=shots)
+
+
+@register_backend
+class TensornetBackend(CudaqBackend):
+    name = target = "tensornet"
+
+
+@register_backend
+class TensornetMpsBackend(CudaqBackend):
+    name = target = "tensornet-mps"
+
+
+@register_backend
+class NvidiaBackend(CudaqBackend):
+    name = target = "nvidia"
+
+
+@register_backend
+class QppCpuBackend(CudaqBackend):
+    name = target = "qpp-cpu"
+
+
+@register_backend
+class NumpyBackend(Backend):
+    """純 NumPy 狀態向量模擬 (記憶體為 2^n 個 complex128，約 25 個量子比特以內)"""
+
+    name = "numpy"
+
+    def setup(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def version(self):
+        return np.__version__
+
+    def compile(self, qubits):
+        # 閘序列: H(0) 後接 CNOT(0, i)
+        return qubits, [("h", 0)] + [("cx", 0, i) for i in range(1, qubits)]
+
+    def execute(self, kernel, shots):
+        qubits, gates = kernel
+        state = np.zeros((2,) * qubits, dtype=np.complex128)
+        state[(0,) * qubits] = 1
+        for gate in gates:
+            if gate[0] == "h":
+                a, b = np.take(state, 0, axis=gate[1]), np.take(state, 1, axis=gate[1])
+                state = np.stack([(a + b) / np.sqrt(2), (a - b) / np.sqrt(2)], axis=gate[1])
+            else:
+                _, control, target = gate
+                index = [slice(None)] * qubits
+                index[control] = 1
+                sub = state[tuple(index)]
+                axis = target - (target > control)
+                state[tuple(index)] = np.flip(sub, axis=axis).copy()
+        probabilities = np.abs(state.ravel()) ** 2
+        return np.bincount(self.rng.choice(len(probabilities), size=shots, p=probabilities / probabilities.sum()))
+
+
+def load_backend(spec):
+    """依名稱 (已註冊) 或 "模組:類別" 取得後端類別"""
+    if spec in BACKENDS:
+        return BACKENDS[spec]
+    if ":" in spec:
+        module_name, class_name = spec.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)
+    raise ValueError(f"未知的後端: {spec} (可用: {', '.join(sorted(BACKENDS))}，或以 模組:類別 指定)")
+
+
+def run_worker(backend_spec, qubits, warmup, repeat, shots, seed):
+    """在子進程內量測單一測試點，回傳結果字典 (時間單位為秒)"""
+    backend = load_backend(backend_spec)()
+    backend.setup(seed)
+
+    start = time.perf_counter()
+    kernel = backend.compile(qubits)
+    compile_s = time.perf_counter() - start
+
+    first_execute_s = None
+    for i in range(warmup):
+        start = time.perf_counter()
+        backend.execute(kernel, shots)
+        if i == 0:
+            first_execute_s = time.perf_counter() - start
+
+    execute_s = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        backend.execute(kernel, shots)
+        execute_s.append(time.perf_counter() - start)
+
+    return {
+        "compile_s": compile_s,
+        "first_execute_s": first_execute_s,
+        "execute_s": execute_s,
+        "backend_version": backend.version(),
+        # Linux 的 ru_maxrss 單位為 KB
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _rss_mb(pid):
+    """子進程目前的常駐記憶體 (MB)；無法讀取 (非 Linux 或進程已結束) 時為 None"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def run_point(backend_spec, qubits, warmup=DEFAULT_WARMUP, repeat=DEFAULT_REPEAT, shots=DEFAULT_SHOTS,
+              seed=DEFAULT_SEED, timeout=DEFAULT_TIMEOUT_S, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+    """
+    以子進程量測單一測試點，回傳一列結果 (欄位見 RESULT_FIELDS，另含 execute_s 原始時間與 backend_version)。
+    status 為 ok / timeout / memory (超過記憶體上限) / error。
+    """
+    command = [sys.executable, os.path.abspath(__file__), "worker", "--backend", backend_spec,
+               "--qubits", str(qubits), "--warmup", str(warmup), "--repeat", str(repeat), "--shots", str(shots),
+               "--seed", str(seed)]
+    row = {"backend": backend_spec, "qubits": qubits, "status": "error", "warmup": warmup, "repeat": repeat,
+           "shots": shots, "error": "", "timestamp": datetime.now().isoformat(timespec="seconds")}
+
+    # 輸出寫到暫存檔而非管道，輪詢期間不會因管道塞滿而卡住
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        start = time.perf_counter()
+        # 新的進程群組: 逾時或超過記憶體時連同後端產生的子進程一起終止
+        process = subprocess.Popen(command, stdout=out, stderr=err, start_new_session=True)
+        peak_rss = 0.0
+        while process.poll() is None:
+            elapsed = time.perf_counter() - start
+            rss = _rss_mb(process.pid)
+            peak_rss = max(peak_rss, rss or 0.0)
+            if timeout is not None and elapsed > timeout:
+                row["status"], row["error"] = "timeout", f"超過 {timeout:g} 秒"
+            elif memory_limit_mb is not None and rss is not None and rss > memory_limit_mb:
+                row["status"], row["error"] = "memory", f"記憶體 {rss:.0f} MB 超過上限 {memory_limit_mb} MB"
+            else:
+                time.sleep(POLL_INTERVAL_S)
+                continue
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            break
+        row["wall_s"] = time.perf_counter() - start
+        row["peak_rss_mb"] = peak_rss or None
+        if row["status"] in ("timeout", "memory"):
+            return row
+
+        out.seek(0)
+        err.seek(0)
+        stdout = out.read().decode(errors="replace").strip()
+        stderr = err.read().decode(errors="replace").strip()
+
+    if process.returncode != 0 or not stdout:
+        row["error"] = (stderr.splitlines() or [f"結束碼 {process.returncode}"])[-1]
+        return row
+    result = json.loads(stdout.splitlines()[-1])
+    execute_s = np.asarray(result["execute_s"], dtype=np.float64)
+    row.update({
+        "status": "ok",
+        "compile_s": result["compile_s"],
+        "first_execute_s": result["first_execute_s"],
+        "execute_median_s": float(np.median(execute_s)) if len(execute_s) else None,
+        "execute_p95_s": float(np.percentile(execute_s, 95)) if len(execute_s) else None,
+        "execute_min_s": float(execute_s.min()) if len(execute_s) else None,
+        "execute_max_s": float(execute_s.max()) if len(execute_s) else None,
+        "peak_rss_mb": max(result["peak_rss_mb"], row["peak_rss_mb"] or 0.0),
+        "execute_s": result["execute_s"],
+        "backend_version": result["backend_version"],
+    })
+    return row
+
+
+def environment():
+    """結果檔記錄的執行環境"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "hostname": socket.gethostname(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+
+
+def results_paths(output):
+    """結果檔路徑 (副檔名 .json 或 .csv 皆可) 對應的 (JSON 路徑, CSV 路徑)"""
+    base = os.path.splitext(output)[0]
+    return base + ".json", base + ".csv"
+
+
+def read_results(path):
+    """讀取結果檔 (JSON 或 CSV)，回傳測試點列表 (字典，依量子比特數排序)"""
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            points = json.load(f)["points"]
+    else:
+        with open(path, encoding="utf-8", newline="") as f:
+            points = list(csv.DictReader(f))
+        for point in points:
+            point["qubits"] = int(point["qubits"])
+            for key in RESULT_FIELDS:
+                if key.endswith("_s") or key.endswith("_mb"):
+                    point[key] = float(point[key]) if point.get(key) not in (None, "") else None
+    return sorted(points, key=lambda p: (p["backend"], p["qubits"]))
+
+
+def _write_atomic(path, write):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def write_results(output, document):
+    """寫入 JSON (完整資料) 與 CSV (每點一列)；先寫暫存檔再取代，中斷時不會留下半個檔案"""
+    json_path, csv_path = results_paths(output)
+    points = sorted(document["points"], key=lambda p: (p["backend"], p["qubits"]))
+    _write_atomic(json_path, lambda f: json.dump({**document, "points": points}, f, ensure_ascii=False, indent=2))
+
+    def write_csv(f):
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(points)
+    _write_atomic(csv_path, write_csv)
+
+
+def run_sweep(backend_spec, qubit_counts, output, warmup=DEFAULT_WARMUP, repeat=DEFAULT_REPEAT, shots=DEFAULT_SHOTS,
+              seed=DEFAULT_SEED, timeout=DEFAULT_TIMEOUT_S, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB,
+              retry_failed=False, restart=False):
+    """
+    依序量測 qubit_counts 的每個測試點，每完成一點即寫入 output 的 JSON / CSV。
+    output 已存在時接續: 略過已成功的測試點 (retry_failed 為 True 時也重測失敗的點)；
+    設定 (CONFIG_KEYS) 與結果檔不同時拋出 ValueError，restart 為 True 則捨棄舊結果。
+    回傳所有測試點列表。
+    """
+    config = {"backend": backend_spec, "warmup": warmup, "repeat": repeat, "shots": shots, "seed": seed}
+    json_path, _ = results_paths(output)
+    document = {"config": config, "environment": environment(), "points": []}
+    if os.path.exists(json_path) and not restart:
+        with open(json_path, encoding="utf-8") as f:
+            previous = json.load(f)
+        if {k: previous["config"].get(k) for k in CONFIG_KEYS} != config:
+            raise ValueError(f"結果檔 {json_path} 的設定 {previous['config']} 與目前設定 {config} 不同 "
+                             f"(改用其他輸出路徑，或以 --restart 重新量測)")
+        document["points"] = previous["points"]
+        document["environment"] = previous["environment"]
+
+    done = {p["qubits"]: p for p in document["points"]}
+    directory = os.path.dirname(json_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    print(f"\n===== {backend_spec} 基準測試 (warmup {warmup}, repeat {repeat}, shots {shots}) =====")
+    print("{:<10} | {:<8} | {:>10} | {:>12} | {:>12} | {:>10}".format(
+        "量子比特數", "狀態", "編譯(秒)", "執行中位數(秒)", "執行p95(秒)", "記憶體(MB)"))
+    print("-" * 80)
+    for qubits in qubit_counts:
+        previous_point = done.get(qubits)
+        if previous_point is not None and (previous_point["status"] == "ok" or not retry_failed):
+            _print_point(previous_point, suffix=" (已完成，略過)")
+            continue
+        point = run_point(backend_spec, qubits, warmup, repeat, shots, seed, timeout, memory_limit_mb)
+        if point.get("backend_version"):
+            document["environment"]["backend_version"] = point["backend_version"]
+        done[qubits] = point
+        document["points"] = list(done.values())
+        write_results(output, document)
+        _print_point(point)
+    return document["points"]
+
+
+def _print_point(point, suffix=""):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+    status = "✅ " + point["status"] if point["status"] == "ok" else "❌ " + point["status"]
+    print("{:<10} | {:<8} | {:>10} | {:>12} | {:>12} | {:>10}{}".format(
+        point["qubits"], status, fmt(point.get("compile_s"), ".4f"), fmt(point.get("execute_median_s"), ".4f"),
+        fmt(point.get("execute_p95_s"), ".4f"), fmt(point.get("peak_rss_mb"), ".0f"), suffix))
+    if point["status"] != "ok" and point.get("error"):
+        print(f"    {point['error']}")
+
+
+def add_sweep_arguments(parser):
+    """量測設定的命令列參數 (CUDAQ_test.py benchmark 共用)"""
+    parser.add_argument("--backend", type=str, default=DEFAULT_BACKEND,
+                        help=f"後端名稱 ({', '.join(sorted(BACKENDS))}) 或 模組:類別 (預設: {DEFAULT_BACKEND})")
+    parser.add_argument("--start-qubits", type=int, default=100, help="起始量子比特數 (預設: 100)")
+    parser.add_argument("--max-qubits", type=int, default=200, help="最大量子比特數 (預設: 200)")
+    parser.add_argument("--step", type=int, default=5, help="量子比特數步長 (預設: 5)")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help=f"暖身次數 (預設: {DEFAULT_WARMUP})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help=f"計時次數 (預設: {DEFAULT_REPEAT})")
+    parser.add_argument("--shots", type=int, default=DEFAULT_SHOTS, help=f"取樣次數 (預設: {DEFAULT_SHOTS})")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help=f"亂數種子 (預設: {DEFAULT_SEED})")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_S,
+                        help=f"每個測試點的逾時秒數 (預設: {DEFAULT_TIMEOUT_S:g})")
+    parser.add_argument("--memory-limit-mb", type=int, default=DEFAULT_MEMORY_LIMIT_MB,
+                        help=f"每個測試點的記憶體上限 MB (預設: {DEFAULT_MEMORY_LIMIT_MB})")
+    parser.add_argument("--results", type=str, default=None,
+                        help="結果檔路徑 (.json / .csv，兩者都會寫入；預設: output/benchmark_<後端>.json)")
+    parser.add_argument("--retry-failed", action="store_true", help="接續時重測先前失敗 (逾時 / 記憶體) 的測試點")
+    parser.add_argument("--restart", action="store_true", help="捨棄既有結果重新量測")
+
+
+def sweep_from_args(args):
+    """依 add_sweep_arguments() 的參數執行 run_sweep()，回傳結束碼"""
+    output = args.results or os.path.join("output", f"benchmark_{args.backend.replace(':', '_')}.json")
+    qubit_counts = range(args.start_qubits, args.max_qubits + 1, args.step)
+    try:
+        load_backend(args.backend)
+        points = run_sweep(args.backend, qubit_counts, output, warmup=args.warmup, repeat=args.repeat,
+                           shots=args.shots, seed=args.seed, timeout=args.timeout,
+                           memory_limit_mb=args.memory_limit_mb, retry_failed=args.retry_failed, restart=args.restart)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+    json_path, csv_path = results_paths(output)
+    print(f"\n結果: {json_path}, {csv_path}")
+    return 0 if all(p["status"] == "ok" for p in points if p["qubits"] in qubit_counts) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量子模擬後端的可重現基準測試 (每個測試點一個子進程)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_sweep_arguments(subparsers.add_parser("run", help="執行量子比特數掃描"))
+
+    # 內部使用: 由 run_point() 啟動，量測單一測試點並以一行 JSON 輸出
+    worker = subparsers.add_parser("worker")
+    worker.add_argument("--backend", required=True)
+    worker.add_argument("--qubits", type=int, required=True)
+    worker.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    worker.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    worker.add_argument("--shots", type=int, default=DEFAULT_SHOTS)
+    worker.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        result = run_worker(args.backend, args.qubits, args.warmup, args.repeat, args.shots, args.seed)
+        print(json.dumps(result))
+        return 0
+    return sweep_from_args(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
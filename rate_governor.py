@@ -0,0 +1,191 @@
+"""
+所有發送進程共用的閉迴路速率調節器
+
+- RateGovernor      : 位於共享記憶體的令牌桶 (以 GCRA 虛擬時鐘實作)，每個目標一個。
+                      各進程每送出一批就向對應的桶扣款，等到令牌餘額恢復才送下一批，
+                      因此總速率與進程數、封包大小組成無關。
+- GovernorController: 在主進程的背景執行緒中定期讀取共享計數器，
+                      依「應送字節數 - 實際送出字節數」調整各桶的補充速率，
+                      補償桶滿溢出、部分發送、發送錯誤等造成的偏差。
+
+桶的狀態以一把跨進程鎖保護，但各進程不是每批都去拿鎖: 每次拿鎖時先預支一段令牌額度
+(最多 DEFAULT_ALLOWANCE_BYTES，且不超過桶容量)，之後的扣款在本地額度內完成，用完才再拿鎖。
+time.perf_counter() 在 Linux 上為 CLOCK_MONOTONIC，跨進程可直接比較。
+"""
+
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from sender_stats import BYTES
+
+# 每個桶的欄位: 令牌餘額恢復為零的時刻 (GCRA 的 TAT)、目前的補充速率、設定的目標速率
+TAT, RATE, TARGET_RATE = range(3)
+BUCKET_WORDS = 8  # 每個桶佔一條快取行
+
+# 桶容量 (秒): 閒置時最多累積這麼多時間的令牌，之後可以連續送出
+DEFAULT_BURST_S = 0.002
+# 每個進程一次向共享桶預支的令牌額度上限 (字節)；實際額度另受桶容量 (補充速率 x burst_s) 限制
+DEFAULT_ALLOWANCE_BYTES = 256 * 1024
+# 控制器: 取樣間隔、把累積誤差修正回來的時間常數、補充速率相對目標的最大調整幅度
+CONTROL_INTERVAL_S = 0.05
+CONTROL_HORIZON_S = 0.5
+MAX_ADJUST = 0.25
+
+
+class RateGovernor:
+    """
+    每個目標一個共享令牌桶。
+
+    主進程以 RateGovernor(各目標速率) 建立，傳給子進程時只 pickle
+    共享記憶體名稱與鎖，子進程重新附加到同一塊記憶體。
+    """
+
+    def __init__(self, rates_bps, burst_s=DEFAULT_BURST_S, name=None, lock=None,
+                 allowance_bytes=DEFAULT_ALLOWANCE_BYTES):
+        self.num_targets = len(rates_bps)
+        self.burst_s = burst_s
+        self.allowance_bytes = allowance_bytes
+        self._lock = lock if lock is not None else multiprocessing.Lock()
+        size = self.num_targets * BUCKET_WORDS * 8
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+        table = np.frombuffer(self._shm.buf, dtype=np.float64, count=self.num_targets * BUCKET_WORDS)
+        self._table = table.reshape(self.num_targets, BUCKET_WORDS)
+        if self._owner:
+            self._table[:] = 0.0
+            self._table[:, RATE] = self._table[:, TARGET_RATE] = rates_bps
+        # 熱路徑直接操作 Python 的 memoryview，避免 NumPy 純量的額外開銷
+        self._words = self._shm.buf[:size].cast("d")
+        # 本進程預支到的額度: 剩餘字節數、已用到的時刻、預支時的補充速率 (不跨進程共享)
+        self._local_left = [0.0] * self.num_targets
+        self._local_tat = [0.0] * self.num_targets
+        self._local_rate = [1.0] * self.num_targets
+
+    def __reduce__(self):
+        return (self.__class__, (list(self._table[:, TARGET_RATE]), self.burst_s, self._shm.name, self._lock,
+                                 self.allowance_bytes))
+
+    def consume(self, target, nbytes):
+        """
+        從桶中扣除 nbytes 字節的令牌 (可以欠款)，回傳令牌餘額恢復為非負的時刻
+        (time.perf_counter())，呼叫端等到該時刻才送下一批。
+        每個進程最多比時間表超前一批，總速率長期等於補充速率。
+
+        本地額度足夠時不拿鎖，只在預支到的時段內往後推算；不足時才拿鎖，
+        從共享桶一次預支 (不足部分 + 一段額度)，剩下的額度留給之後的批次。
+        """
+        left = self._local_left[target]
+        if left >= nbytes:
+            self._local_left[target] = left - nbytes
+            ready = self._local_tat[target] + nbytes / self._local_rate[target]
+            self._local_tat[target] = ready
+            return ready
+
+        base = target * BUCKET_WORDS
+        words = self._words
+        with self._lock:
+            now = time.perf_counter()
+            rate = words[base + RATE]
+            start = words[base + TAT]
+            if start < now - self.burst_s:
+                start = now - self.burst_s  # 閒置太久: 最多只保留 burst_s 的令牌
+            # 額度不超過桶容量，各進程預支的令牌不會讓突發超過單一桶允許的量
+            allowance = min(self.allowance_bytes, rate * self.burst_s)
+            words[base + TAT] = start + (nbytes - left + allowance) / rate
+        # 先用完舊額度 (時段在 start 之前)，不足的部分從新預支時段的開頭扣
+        ready = start + (nbytes - left) / rate
+        self._local_left[target] = allowance
+        self._local_tat[target] = ready
+        self._local_rate[target] = rate
+        return ready
+
+    def rate(self, target):
+        """目前的補充速率 (bytes/s)"""
+        return float(self._table[target, RATE])
+
+    def target_rate(self, target):
+        """設定的目標速率 (bytes/s)"""
+        return float(self._table[target, TARGET_RATE])
+
+    def set_rate(self, target, rate_bps):
+        """調整補充速率 (由控制器呼叫；單一 float64 寫入不會撕裂，讀取端不需加鎖)"""
+        self._table[target, RATE] = rate_bps
+
+    def close(self):
+        """解除對共享記憶體的附加；建立者同時將其刪除"""
+        self._table = None
+        self._words.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class GovernorController:
+    """
+    回授控制器 (主進程內的背景執行緒)。
+
+    counters 的槽位依 [進程][目標] 排列。從第一個字節送出時開始累計，
+    每次取樣計算 誤差 = 目標速率 x 經過時間 - 實際送出字節數，
+    並把補充速率設為 目標速率 + 誤差 / CONTROL_HORIZON_S (限制在 ±MAX_ADJUST 內)。
+    誤差大到修正幅度無法追回時 (例如發送端已經飽和)，超出的部分不再追討，避免之後長時間超速。
+    """
+
+    def __init__(self, governor, counters, num_workers, interval=CONTROL_INTERVAL_S, horizon=CONTROL_HORIZON_S,
+                 max_adjust=MAX_ADJUST):
+        self.governor = governor
+        self.counters = counters
+        self.num_workers = num_workers
+        self.interval = interval
+        self.horizon = horizon
+        self.max_adjust = max_adjust
+        self._start = [None] * governor.num_targets  # 每個目標的 (起始時刻, 起始字節數)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _sent_bytes(self):
+        snapshot = self.counters.snapshot().reshape(self.num_workers, self.governor.num_targets, -1)
+        return snapshot[:, :, BYTES].sum(axis=0).astype(np.float64)
+
+    def step(self):
+        """取樣一次並更新各桶的補充速率"""
+        now = time.perf_counter()
+        sent = self._sent_bytes()
+        for t in range(self.governor.num_targets):
+            if self._start[t] is None:
+                if sent[t] > 0:
+                    self._start[t] = (now, sent[t])
+                continue
+            target = self.governor.target_rate(t)
+            start_time, start_bytes = self._start[t]
+            error = target * (now - start_time) - (sent[t] - start_bytes)
+
+            limit = target * self.horizon * self.max_adjust
+            if error > limit:
+                # 追不回來的落後不再累積 (相當於積分項的 anti-windup)
+                self._start[t] = (start_time, start_bytes - (error - limit))
+                error = limit
+            elif error < -limit:
+                self._start[t] = (start_time, start_bytes - (error + limit))
+                error = -limit
+            self.governor.set_rate(t, target + error / self.horizon)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.step()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=1)
@@ -0,0 +1,79 @@
+"""
+依 PCAP 時間戳重播的排程工具
+
+- parse_replay_timing(): 解析 --replay-timing 參數 (original / xN / max)
+- ReplaySchedule      : 將擷取時間戳換算為相對發送時刻，支援循環重播
+- wait_until()        : 先 sleep 再忙等 (spin) 的混合等待，維持微秒級精度
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+# 距離目標時刻少於此值時改為忙等，避免 time.sleep() 的排程誤差
+SPIN_THRESHOLD = 200e-6
+
+
+def parse_replay_timing(text):
+    """
+    解析重播速度: "original" 為原速，"x2" / "x0.5" 為倍速，"max" 為不限速。
+    回傳倍率 (float)，不限速時回傳 None。
+    """
+    value = text.strip().lower()
+    if value == "original":
+        return 1.0
+    if value == "max":
+        return None
+    if value.startswith("x"):
+        try:
+            multiplier = float(value[1:])
+        except ValueError:
+            multiplier = 0.0
+        if multiplier > 0:
+            return multiplier
+    raise argparse.ArgumentTypeError(f"無效的重播速度 '{text}' (可用: original, xN, max)")
+
+
+def wait_until(deadline, spin_threshold=SPIN_THRESHOLD):
+    """
+    等待直到 time.perf_counter() 到達 deadline。
+    距離較遠時先 sleep，最後 spin_threshold 內以忙等補足。
+    回傳是否真的有等待 (False 代表呼叫時已經落後)。
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining <= 0:
+        return False
+    if remaining > spin_threshold:
+        time.sleep(remaining - spin_threshold)
+    while time.perf_counter() < deadline:
+        pass
+    return True
+
+
+class ReplaySchedule:
+    """
+    由擷取時間戳計算每個封包相對於重播起點的發送時刻 (秒)。
+
+    時間戳會先強制為單調遞增 (擷取檔偶有亂序)，再除以倍率。
+    循環重播時，每一輪的長度為最後一個封包的時刻加上一個典型封包間隔。
+    """
+
+    def __init__(self, timestamps_ns, multiplier=1.0):
+        ts = np.maximum.accumulate(np.asarray(timestamps_ns, dtype=np.int64))
+        self.offsets = (ts - ts[0]).astype(np.float64) / 1e9 / multiplier
+        gaps = np.diff(self.offsets)
+        typical_gap = float(np.median(gaps)) if len(gaps) else 0.0
+        self.period = float(self.offsets[-1]) + typical_gap
+        self.multiplier = multiplier
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def due_count(self, start, elapsed, limit):
+        """
+        從索引 start 起，計算在相對時刻 elapsed 之前已到期的封包數，
+        至少 1 個 (start 本身)，最多 limit 個。
+        """
+        due = int(np.searchsorted(self.offsets, elapsed, side="right")) - start
+        return max(1, min(due, limit))
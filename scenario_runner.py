@@ -0,0 +1,153 @@
+"""
+飽和掃描情境 (saturation sweep)
+
+在單一工作階段內以遞增的負載測試替身接收端，找出開始遺失封包的拐點:
+
+- ramp  : 線性斜坡，每個量測窗口內速率由 r 平滑升到 r + step
+- step  : 階梯，每階維持固定速率
+- burst : 週期性突發，每個週期先以峰值速率送出 duty 比例的時間，其餘時間降為基礎速率
+
+每一步都透過 loopback_harness.run_rate_step() 量測實際速率與遺失，
+第一次超過遺失門檻或實際速率明顯不足時即停止，並輸出帶時間戳的 CSV
+與最高可持續速率的摘要。
+"""
+
+import csv
+import math
+import os
+from datetime import datetime
+
+import numpy as np
+
+from loopback_harness import LoopbackError, print_header, print_step, run_rate_step
+
+BYTES_PER_MB = 1024 * 1024
+SWEEP_PROFILES = ("ramp", "step", "burst")
+
+
+class ConstantRate:
+    """固定速率"""
+
+    def __init__(self, mbps):
+        self.mean_mbps = mbps
+        self._rate = mbps * BYTES_PER_MB
+
+    def time_for(self, nbytes):
+        return nbytes / self._rate
+
+
+class LinearRamp:
+    """速率在 duration 秒內由 start_mbps 線性增加到 stop_mbps"""
+
+    def __init__(self, start_mbps, stop_mbps, duration):
+        self.mean_mbps = (start_mbps + stop_mbps) / 2
+        self._r0 = start_mbps * BYTES_PER_MB
+        self._accel = (stop_mbps - start_mbps) * BYTES_PER_MB / duration
+
+    def time_for(self, nbytes):
+        # 累積字節數 = r0 * t + accel * t^2 / 2，解出 t
+        if self._accel == 0:
+            return nbytes / self._r0
+        return (math.sqrt(self._r0 * self._r0 + 2 * self._accel * nbytes) - self._r0) / self._accel
+
+
+class BurstRate:
+    """每 period 秒中前 duty 比例以 peak_mbps 發送，其餘時間以 base_mbps 發送"""
+
+    def __init__(self, peak_mbps, base_mbps, period, duty):
+        self._peak = peak_mbps * BYTES_PER_MB
+        self._base = base_mbps * BYTES_PER_MB
+        self._period = period
+        self._burst_time = period * duty
+        self._burst_bytes = self._peak * self._burst_time
+        self._period_bytes = self._burst_bytes + self._base * (period - self._burst_time)
+        self.mean_mbps = self._period_bytes / period / BYTES_PER_MB
+
+    def time_for(self, nbytes):
+        cycles, rest = divmod(nbytes, self._period_bytes)
+        if rest < self._burst_bytes:
+            return cycles * self._period + rest / self._peak
+        return cycles * self._period + self._burst_time + (rest - self._burst_bytes) / self._base
+
+
+def build_steps(profile, start_mbps, stop_mbps, step_mbps, duration, burst_base=0.2, burst_period=0.1, burst_duty=0.5):
+    """產生 [(步驟說明, 負載曲線), ...]；burst 的 start / stop 指峰值速率"""
+    rates = np.arange(start_mbps, stop_mbps + step_mbps / 2, step_mbps)
+    steps = []
+    for rate in rates:
+        rate = float(rate)
+        if profile == "ramp":
+            steps.append((f"{rate:g}→{rate + step_mbps:g}", LinearRamp(rate, rate + step_mbps, duration)))
+        elif profile == "burst":
+            steps.append((f"峰值 {rate:g}", BurstRate(rate, rate * burst_base, burst_period, burst_duty)))
+        else:
+            steps.append((f"{rate:g}", ConstantRate(rate)))
+    return steps
+
+
+def is_sustained(result, loss_threshold, min_ratio):
+    """遺失率不超過門檻且實際速率達到平均目標的 min_ratio 即視為可持續"""
+    return (result["loss_percent"] <= loss_threshold
+            and result["achieved_mbps"] >= result["target_mbps"] * min_ratio)
+
+
+def write_csv(path, rows):
+    """將每一步的結果寫成 CSV (失敗步驟沒有的量測欄位留空)"""
+    fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_sweep(corpus, profile, start_mbps, stop_mbps, step_mbps, duration, port, backend="sendmmsg",
+              batch_size=64, loss_threshold=0.1, min_ratio=0.95, output_dir="output", **burst):
+    """
+    執行飽和掃描，回傳 (每步結果, 最高可持續平均速率 或 None, CSV 路徑)。
+    第一次不可持續的步驟即為拐點，之後不再加壓；
+    步驟本身執行失敗 (如替身接收端無法啟動) 時以 status="failed" 與 error 記錄該步並中止掃描。
+    """
+    steps = build_steps(profile, start_mbps, stop_mbps, step_mbps, duration, **burst)
+    print(f"\n📈 飽和掃描: 模式 {profile}, {len(steps)} 步, 每步 {duration:.1f} 秒, "
+          f"遺失門檻 {loss_threshold:g}%, 後端 {backend}")
+    print_header()
+
+    rows = []
+    best = None
+    failed = None
+    for number, (label, pacing) in enumerate(steps):
+        try:
+            result = run_rate_step(corpus, pacing.mean_mbps, duration, port, backend, batch_size, pacing=pacing)
+        except LoopbackError as e:
+            print(f"❌ 步驟 {number} ({label} MB/s) 執行失敗: {e}")
+            rows.append({"profile": profile, "step": number, "load": label, "sustained": False,
+                         "status": "failed", "error": str(e), "target_mbps": pacing.mean_mbps})
+            failed = e
+            break
+        sustained = is_sustained(result, loss_threshold, min_ratio)
+        print_step(result)
+        rows.append({"profile": profile, "step": number, "load": label, "sustained": sustained,
+                     "status": "ok", "error": "", **result})
+        if not sustained:
+            print(f"🧱 拐點: {label} MB/s (遺失 {result['loss_percent']:.3f}%, "
+                  f"實際 {result['achieved_mbps']:.1f} / 目標 {result['target_mbps']:.1f} MB/s)")
+            break
+        best = result
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    csv_path = os.path.join(output_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_sweep_{profile}.csv")
+    write_csv(csv_path, rows)
+
+    if failed is not None:
+        print("⚠️ 掃描因步驟失敗而中止，拐點未確定" + (
+            f"；失敗前最高可持續速率 {best['target_mbps']:.1f} MB/s" if best else ""))
+    elif best is None:
+        print("⚠️ 第一步就無法維持，請降低起始速率")
+    else:
+        print(f"✅ 最高可持續速率: 平均 {best['target_mbps']:.1f} MB/s (實際 {best['achieved_mbps']:.1f} MB/s, "
+              f"遺失 {best['loss_percent']:.3f}%, p99 延遲 {best['latency_p99_us']:.0f} µs)")
+        if len(rows) == len(steps) and rows[-1]["sustained"]:
+            print("   (到達掃描上限仍未遺失，實際上限可能更高)")
+    print(f"💾 結果已寫入 {csv_path}")
+    return rows, (best["target_mbps"] if best else None), csv_path
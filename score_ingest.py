@@ -0,0 +1,170 @@
+"""
+summary_scores.csv 的平行讀取與快取
+
+遍歷資料夾找出所有 summary_scores.csv，以進程池分批讀取 (每個工作一次讀多個檔案，
+只取「問卷名稱」與「總分」兩欄，整批建表)，結果合併成一張長表。
+
+讀過的檔案以 (路徑, mtime_ns, 大小) 為鍵存入快取檔 (有 pyarrow / fastparquet 時為 Parquet，
+否則退回 pickle)，再次執行時只重新讀取新增或修改過的檔案。
+"""
+
+import csv
+import importlib.util
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+SCORE_FILE = "summary_scores.csv"
+QUIZ_COLUMN = "問卷名稱"
+SCORE_COLUMN = "總分"
+CACHE_COLUMNS = ["path", "mtime_ns", "size", QUIZ_COLUMN, SCORE_COLUMN]
+# 預設分析的問卷 (順序即圖表與統計表的順序)
+DEFAULT_QUIZZES = ["飛鳥前測", "飛鳥後測", "音樂後測"]
+
+# 檔案數少於此值時直接在主進程讀取 (啟動進程池的成本高於讀檔)
+PARALLEL_MIN_FILES = 64
+FILES_PER_TASK = 32
+
+
+def parquet_available():
+    """是否安裝了 pandas 可用的 Parquet 引擎"""
+    return any(importlib.util.find_spec(name) is not None for name in ("pyarrow", "fastparquet"))
+
+
+def default_cache_path(root_directory):
+    """快取檔預設放在資料夾內，格式依 Parquet 引擎是否可用而定"""
+    suffix = ".parquet" if parquet_available() else ".pkl"
+    return os.path.join(root_directory, ".score_cache" + suffix)
+
+
+def find_score_files(root_directory):
+    """回傳 [(路徑, mtime_ns, 大小)]，順序與 os.walk 相同"""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root_directory):
+        if SCORE_FILE in filenames:
+            path = os.path.join(dirpath, SCORE_FILE)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, st.st_mtime_ns, st.st_size))
+    return files
+
+
+def _read_chunk(files):
+    """
+    讀取一批檔案，回傳 (長表, 錯誤訊息列表)。
+    每個檔案只有幾列，逐檔呼叫 pd.read_csv 的固定成本遠大於解析本身，
+    因此以 csv 模組取出兩欄後整批建立一個 DataFrame，再一次轉換分數欄的型別。
+    沒有任何資料列的檔案仍留一列空值，讓快取記得它已經讀過。
+    """
+    columns = {name: [] for name in CACHE_COLUMNS}
+    errors = []
+    for path, mtime_ns, size in files:
+        try:
+            with open(path, encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                header = next(reader, [])
+                missing = [name for name in (QUIZ_COLUMN, SCORE_COLUMN) if name not in header]
+                if missing:
+                    raise ValueError(f"找不到欄位: {missing}")
+                quiz_col, score_col = header.index(QUIZ_COLUMN), header.index(SCORE_COLUMN)
+                rows = [(row[quiz_col], row[score_col]) for row in reader if row]
+        except Exception as e:
+            errors.append(f"處理檔案 {path} 時發生錯誤: {e}")
+            continue
+        if not rows:
+            rows = [(None, None)]
+        columns["path"].extend([path] * len(rows))
+        columns["mtime_ns"].extend([mtime_ns] * len(rows))
+        columns["size"].extend([size] * len(rows))
+        for quiz, score in rows:
+            columns[QUIZ_COLUMN].append(quiz or None)
+            columns[SCORE_COLUMN].append(score or None)
+
+    table = pd.DataFrame(columns)
+    # 與 pd.read_csv 相同: 能轉成數值就轉成數值，空白為 NaN
+    scores = pd.to_numeric(table[SCORE_COLUMN], errors="coerce")
+    if scores.notna().sum() == table[SCORE_COLUMN].notna().sum():
+        table[SCORE_COLUMN] = scores
+    return table, errors
+
+
+def read_score_files(files, processes=None):
+    """
+    讀取 [(路徑, mtime_ns, 大小)] 所列的檔案，回傳長表 (欄位為 CACHE_COLUMNS)。
+    檔案數達 PARALLEL_MIN_FILES 時以進程池分批讀取；無法讀取的檔案印出錯誤後略過。
+    """
+    if len(files) >= PARALLEL_MIN_FILES and processes != 1:
+        chunks = [files[i:i + FILES_PER_TASK] for i in range(0, len(files), FILES_PER_TASK)]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_read_chunk, chunks))
+    else:
+        results = [_read_chunk(files)]
+    for _, errors in results:
+        for message in errors:
+            print(message)
+    tables = [table for table, _ in results if len(table)]
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=CACHE_COLUMNS)
+
+
+def _read_cache(cache_path):
+    if cache_path is None or not os.path.exists(cache_path):
+        return None
+    try:
+        if cache_path.endswith(".parquet"):
+            return pd.read_parquet(cache_path)
+        return pd.read_pickle(cache_path)
+    except Exception as e:
+        print(f"快取檔 {cache_path} 無法讀取，將重新讀取所有檔案: {e}")
+        return None
+
+
+def _write_cache(cache_path, table):
+    tmp_path = cache_path + ".tmp"
+    if cache_path.endswith(".parquet"):
+        table.to_parquet(tmp_path, index=False)
+    else:
+        table.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+def load_scores(root_directory, cache_path=None, processes=None, use_cache=True):
+    """
+    讀取資料夾下所有 summary_scores.csv，回傳長表 (path, 問卷名稱, 總分)。
+    資料列依檔案的 os.walk 順序、檔案內原始順序排列；空檔案不會出現在結果中。
+
+    cache_path 為 None 時使用 default_cache_path()；use_cache=False 則不讀也不寫快取。
+    processes 為進程池大小 (None 表示 CPU 核心數)。
+    """
+    files = find_score_files(root_directory)
+    if use_cache and cache_path is None:
+        cache_path = default_cache_path(root_directory)
+
+    cached = _read_cache(cache_path) if use_cache else None
+    if cached is not None and len(cached):
+        current = pd.DataFrame(files, columns=["path", "mtime_ns", "size"])
+        keys = cached[["path", "mtime_ns", "size"]].drop_duplicates()
+        fresh = current.merge(keys, on=["path", "mtime_ns", "size"], how="left", indicator=True)
+        stale_mask = (fresh["_merge"] == "left_only").to_numpy()
+        valid = cached.merge(current, on=["path", "mtime_ns", "size"], how="inner")[CACHE_COLUMNS]
+    else:
+        stale_mask = np.ones(len(files), dtype=bool)
+        valid = pd.DataFrame(columns=CACHE_COLUMNS)
+    stale = [f for f, is_stale in zip(files, stale_mask) if is_stale]
+
+    # 只讀取新增或修改過的檔案
+    tables = [read_score_files(stale, processes)] if stale else []
+
+    parts = [t for t in [valid] + tables if len(t)]
+    table = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=CACHE_COLUMNS)
+    if use_cache and (stale or len(valid) != (0 if cached is None else len(cached))):
+        _write_cache(cache_path, table)
+
+    # 依 os.walk 順序排列 (穩定排序保留檔案內的列順序)，並去掉空檔案的佔位列
+    order = {path: i for i, (path, _, _) in enumerate(files)}
+    table = table.assign(_order=table["path"].map(order)).sort_values("_order", kind="stable")
+    table = table[table[QUIZ_COLUMN].notna()]
+    return table[["path", QUIZ_COLUMN, SCORE_COLUMN]].reset_index(drop=True)
@@ -0,0 +1,157 @@
+"""
+參與者 x 問卷 分數矩陣與配對 / 重複量數檢定
+
+長表 (每列一個分數) 在讀取後一次轉成 (參與者數, 問卷數) 的 float64 矩陣，缺少的分數為 NaN，
+另以字典記錄 參與者 ID → 列索引，查詢單一參與者為 O(1)。
+排除規則與配對檢定都是對整欄的向量運算，不需再逐一走訪參與者。
+
+- ScoreMatrix        : 矩陣本體 (from_long / to_long / row / column / paired / complete_rows / exclude_all_equal)
+- paired_tests       : 所有問卷兩兩的配對 t 檢定與 Wilcoxon 符號等級檢定
+- repeated_measures  : 多個問卷的單因子重複量數 ANOVA 與 Friedman 檢定 (只用完整作答的參與者)
+"""
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+
+class ScoreMatrix:
+    """
+    values[i, j] 為參與者 participants[i] 在問卷 questionnaires[j] 的分數 (缺少為 NaN)。
+    """
+
+    def __init__(self, participants, questionnaires, values):
+        self.participants = np.asarray(participants, dtype=object)
+        self.questionnaires = list(questionnaires)
+        self.values = np.asarray(values, dtype=np.float64)
+        self._rows = {pid: i for i, pid in enumerate(self.participants)}
+        self._cols = {name: j for j, name in enumerate(self.questionnaires)}
+
+    @classmethod
+    def from_long(cls, table, id_col, quiz_col, score_col, questionnaires=None):
+        """
+        由長表建立矩陣。參與者依首次出現的順序排列；questionnaires 未指定時為表中出現的所有問卷。
+        同一參與者重複出現的問卷以最後一筆為準。
+        """
+        if questionnaires is None:
+            questionnaires = pd.unique(table[quiz_col])
+        questionnaires = list(questionnaires)
+        cols = pd.Categorical(table[quiz_col], categories=questionnaires).codes
+        table = table[cols >= 0]
+        cols = cols[cols >= 0]
+        rows, participants = pd.factorize(table[id_col], sort=False)
+        values = np.full((len(participants), len(questionnaires)), np.nan)
+        # 以最後一筆為準: 反向後取每格第一次出現的位置
+        flat = rows.astype(np.int64) * len(questionnaires) + cols
+        _, last = np.unique(flat[::-1], return_index=True)
+        last = len(flat) - 1 - last
+        values.flat[flat[last]] = table[score_col].to_numpy(dtype=np.float64)[last]
+        return cls(np.asarray(participants, dtype=object), questionnaires, values)
+
+    def __len__(self):
+        return len(self.participants)
+
+    @property
+    def mask(self):
+        """有分數的格子"""
+        return ~np.isnan(self.values)
+
+    def row(self, participant):
+        """單一參與者各問卷的分數 (O(1) 查詢)"""
+        return self.values[self._rows[participant]]
+
+    def column(self, questionnaire):
+        return self.values[:, self._cols[questionnaire]]
+
+    def column_indices(self, questionnaires):
+        return [self._cols[q] for q in questionnaires]
+
+    def select(self, keep):
+        """依布林遮罩 (或列索引) 取出部分參與者，回傳新的矩陣"""
+        return ScoreMatrix(self.participants[keep], self.questionnaires, self.values[keep])
+
+    def complete_rows(self, questionnaires=None):
+        """指定問卷都有分數的參與者 (布林遮罩)"""
+        cols = self.column_indices(questionnaires or self.questionnaires)
+        return self.mask[:, cols].all(axis=1)
+
+    def exclude_all_equal(self, questionnaires=None):
+        """
+        捨棄指定問卷分數皆存在且全部相同的參與者 (例如作答無變化的無效資料)。
+        只有一個問卷時不捨棄任何人。
+        """
+        questionnaires = questionnaires or self.questionnaires
+        if len(questionnaires) < 2:
+            return self
+        sub = self.values[:, self.column_indices(questionnaires)]
+        all_equal = self.complete_rows(questionnaires) & (sub == sub[:, :1]).all(axis=1)
+        return self.select(~all_equal)
+
+    def paired(self, a, b):
+        """兩個問卷都有分數的參與者的 (a 分數, b 分數)"""
+        x, y = self.column(a), self.column(b)
+        both = ~np.isnan(x) & ~np.isnan(y)
+        return x[both], y[both]
+
+    def to_long(self, id_col, quiz_col, score_col):
+        """轉回長表 (依參與者順序，每位參與者的問卷依矩陣欄順序)；缺少的分數不列出"""
+        rows, cols = np.nonzero(self.mask)
+        return pd.DataFrame({
+            id_col: self.participants[rows],
+            quiz_col: np.asarray(self.questionnaires, dtype=object)[cols],
+            score_col: self.values[rows, cols],
+        })
+
+
+def paired_tests(matrix, questionnaires=None):
+    """
+    所有問卷兩兩的配對檢定 (只用兩者都有分數的參與者)，回傳每對一列的 DataFrame:
+    a, b (欄索引), name_a, name_b, n (配對數), mean_diff, t_stat, p_paired_t, w_stat, p_wilcoxon。
+    """
+    from scipy import stats  # scipy 載入耗時，只在實際做檢定時匯入
+
+    questionnaires = questionnaires or matrix.questionnaires
+    nan = float("nan")
+    rows = []
+    for i, j in combinations(range(len(questionnaires)), 2):
+        x, y = matrix.paired(questionnaires[i], questionnaires[j])
+        row = {"a": i, "b": j, "name_a": questionnaires[i], "name_b": questionnaires[j], "n": len(x),
+               "mean_diff": float(np.mean(x - y)) if len(x) else nan,
+               "t_stat": nan, "p_paired_t": nan, "w_stat": nan, "p_wilcoxon": nan}
+        if len(x) >= 2:
+            row["t_stat"], row["p_paired_t"] = (float(v) for v in stats.ttest_rel(x, y))
+        if np.any(x != y):
+            row["w_stat"], row["p_wilcoxon"] = (float(v) for v in stats.wilcoxon(x, y))
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["a", "b", "name_a", "name_b", "n", "mean_diff", "t_stat", "p_paired_t",
+                                       "w_stat", "p_wilcoxon"])
+
+
+def repeated_measures(matrix, questionnaires=None):
+    """
+    單因子重複量數 ANOVA 與 Friedman 檢定 (只用所有指定問卷都有分數的參與者)，
+    回傳字典: n, k, f_stat, df_conditions, df_error, p_anova, chi2, p_friedman。
+    """
+    from scipy import stats
+
+    questionnaires = questionnaires or matrix.questionnaires
+    x = matrix.values[matrix.complete_rows(questionnaires)][:, matrix.column_indices(questionnaires)]
+    n, k = x.shape
+    result = {"n": n, "k": k, "f_stat": np.nan, "df_conditions": k - 1, "df_error": (n - 1) * (k - 1),
+              "p_anova": np.nan, "chi2": np.nan, "p_friedman": np.nan}
+    if n < 2 or k < 2:
+        return result
+
+    grand_mean = x.mean()
+    ss_conditions = n * np.sum((x.mean(axis=0) - grand_mean) ** 2)
+    ss_subjects = k * np.sum((x.mean(axis=1) - grand_mean) ** 2)
+    ss_error = np.sum((x - grand_mean) ** 2) - ss_conditions - ss_subjects
+    if ss_error > 0:
+        f_stat = (ss_conditions / (k - 1)) / (ss_error / ((n - 1) * (k - 1)))
+        result["f_stat"] = float(f_stat)
+        result["p_anova"] = float(stats.f.sf(f_stat, k - 1, (n - 1) * (k - 1)))
+    if k >= 3:
+        chi2, p = stats.friedmanchisquare(*x.T)
+        result["chi2"], result["p_friedman"] = float(chi2), float(p)
+    return result
@@ -0,0 +1,120 @@
+"""
+重抽樣檢定 (置換檢定與 bootstrap 信賴區間)
+
+樣本小且偏態時，Welch t 檢定的常態假設不可靠，改以重抽樣求 p 值與信賴區間。
+每次 NumPy 呼叫處理一整批重抽樣 (批次 x 樣本數 的矩陣)，不在 Python 迴圈中逐次抽樣。
+
+- permutation_test : 兩組合併後隨機重新分組，統計量為平均數 (或中位數) 差，雙尾 p 值
+- bootstrap_ci     : 兩組各自重抽 (取後放回)，差值的百分位數信賴區間
+- pairwise_tests   : 任意數量組別的所有兩兩比較，可用進程池平行計算；
+                     每一對使用由 seed 衍生的獨立亂數流，結果與進程數無關
+
+p 值採 (超過次數 + 1) / (重抽次數 + 1)，不會得到 0。
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RESAMPLES = 10000
+CONFIDENCE_LEVEL = 0.95
+# 每批重抽樣矩陣的元素數上限 (控制記憶體用量)
+BATCH_ELEMENTS = 4 * 1024 * 1024
+STATISTICS = {
+    "mean": lambda x: x.mean(axis=-1),
+    "median": lambda x: np.median(x, axis=-1),
+}
+
+
+def _batches(n_resamples, sample_size):
+    batch = max(1, min(n_resamples, BATCH_ELEMENTS // max(sample_size, 1)))
+    for start in range(0, n_resamples, batch):
+        yield min(batch, n_resamples - start)
+
+
+def permutation_test(a, b, n_resamples=DEFAULT_RESAMPLES, statistic="mean", rng=None):
+    """
+    雙尾置換檢定，回傳 (觀察到的差值, p 值)。差值為 統計量(a) - 統計量(b)。
+    """
+    rng = np.random.default_rng(rng)
+    stat = STATISTICS[statistic]
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    observed = stat(a) - stat(b)
+    pooled = np.concatenate([a, b])
+    extreme = 0
+    for size in _batches(n_resamples, len(pooled)):
+        shuffled = rng.permuted(np.broadcast_to(pooled, (size, len(pooled))), axis=1)
+        diffs = stat(shuffled[:, :len(a)]) - stat(shuffled[:, len(a):])
+        # 容許浮點誤差，避免與觀察值相等的重排被誤判為較不極端
+        extreme += int(np.count_nonzero(np.abs(diffs) >= abs(observed) * (1 - 1e-9)))
+    return observed, (extreme + 1) / (n_resamples + 1)
+
+
+def bootstrap_ci(a, b, n_resamples=DEFAULT_RESAMPLES, statistic="mean", confidence=CONFIDENCE_LEVEL, rng=None):
+    """統計量(a) - 統計量(b) 的 bootstrap 百分位數信賴區間，回傳 (下界, 上界)"""
+    rng = np.random.default_rng(rng)
+    stat = STATISTICS[statistic]
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    diffs = []
+    for size in _batches(n_resamples, len(a) + len(b)):
+        resampled_a = a[rng.integers(0, len(a), size=(size, len(a)))]
+        resampled_b = b[rng.integers(0, len(b), size=(size, len(b)))]
+        diffs.append(stat(resampled_a) - stat(resampled_b))
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(np.concatenate(diffs), [alpha, 1 - alpha])
+    return float(low), float(high)
+
+
+def _compare_pair(args):
+    """單一對組別的 t 檢定、置換檢定與 bootstrap 信賴區間 (進程池工作函式)"""
+    from scipy.stats import ttest_ind  # scipy 載入耗時，只在實際做檢定時匯入
+
+    a, b, n_resamples, statistic, confidence, seed_seq = args
+    permutation_seed, bootstrap_seed = seed_seq.spawn(2)
+    if len(a) < 2 or len(b) < 2:
+        nan = float("nan")
+        return {"t_stat": nan, "p_ttest": nan, "diff": nan, "p_permutation": nan, "ci_low": nan, "ci_high": nan}
+    t_stat, p_ttest = ttest_ind(a, b, equal_var=False)
+    if n_resamples == 0:
+        nan = float("nan")
+        return {"t_stat": float(t_stat), "p_ttest": float(p_ttest), "diff": nan, "p_permutation": nan,
+                "ci_low": nan, "ci_high": nan}
+    diff, p_permutation = permutation_test(a, b, n_resamples, statistic, rng=np.random.default_rng(permutation_seed))
+    ci_low, ci_high = bootstrap_ci(a, b, n_resamples, statistic, confidence, rng=np.random.default_rng(bootstrap_seed))
+    return {"t_stat": float(t_stat), "p_ttest": float(p_ttest), "diff": float(diff), "p_permutation": p_permutation,
+            "ci_low": ci_low, "ci_high": ci_high}
+
+
+def pairwise_tests(groups, names=None, n_resamples=DEFAULT_RESAMPLES, statistic="mean", confidence=CONFIDENCE_LEVEL,
+                   seed=None, processes=1):
+    """
+    對所有組別兩兩比較，回傳每對一列的 DataFrame:
+    a, b (組別索引), name_a, name_b, n_a, n_b, t_stat, p_ttest (Welch t 檢定), diff (統計量差),
+    p_permutation (置換檢定), ci_low, ci_high (bootstrap 信賴區間)。
+
+    seed 相同則結果相同 (與 processes 無關)；processes > 1 時以進程池分配各對。
+    n_resamples 為 0 時只做 t 檢定 (重抽樣欄位為 NaN)。
+    """
+    groups = [np.asarray(g, dtype=np.float64) for g in groups]
+    if names is None:
+        names = [str(i) for i in range(len(groups))]
+    pairs = list(combinations(range(len(groups)), 2))
+    seeds = np.random.SeedSequence(seed).spawn(len(pairs))
+    jobs = [(groups[i], groups[j], n_resamples, statistic, confidence, s) for (i, j), s in zip(pairs, seeds)]
+
+    if processes is not None and processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_compare_pair, jobs))
+    else:
+        results = [_compare_pair(job) for job in jobs]
+
+    rows = []
+    for (i, j), result in zip(pairs, results):
+        rows.append({"a": i, "b": j, "name_a": names[i], "name_b": names[j], "n_a": len(groups[i]),
+                     "n_b": len(groups[j]), **result})
+    return pd.DataFrame(rows, columns=["a", "b", "name_a", "name_b", "n_a", "n_b", "t_stat", "p_ttest", "diff",
+                                       "p_permutation", "ci_low", "ci_high"])
@@ -0,0 +1,109 @@
+"""
+分組敘述統計 (向量化)
+
+輸入為長表 (每列一個分數，另有一欄為組別，例如問卷名稱)，任意數量的組別一次處理:
+依 (組別, 分數) 排序一次後，每組在排序陣列中是連續的一段，
+四分位數、IQR 離群值界線、剔除後的平均值 / 中位數 / 極值都以整批的 NumPy 索引運算求得，
+不需要對每組各自呼叫 np.percentile。
+
+四分位數採線性內插，與 np.percentile 的預設結果相同。
+"""
+
+import numpy as np
+import pandas as pd
+
+IQR_FACTOR = 1.5
+# 樣本數少於此值的組別不剔除離群值
+IQR_MIN_COUNT = 4
+STAT_COLUMNS = ["n", "mean", "median", "q1", "q3", "min", "max", "lower_bound", "upper_bound", "n_removed"]
+
+
+def _group_quantiles(values, starts, counts, qs):
+    """
+    values 已依組別與數值排序，第 g 組位於 values[starts[g]:starts[g] + counts[g]]。
+    回傳 (組數, len(qs)) 的分位數 (線性內插)；空組為 NaN。
+    """
+    qs = np.asarray(qs, dtype=np.float64)
+    padded = np.append(values, np.nan)  # 空組指向最後的 NaN
+    pos = starts[:, None] + qs[None, :] * np.maximum(counts - 1, 0)[:, None]
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, (starts + counts - 1)[:, None])
+    empty = (counts == 0)[:, None]
+    lo = np.where(empty, len(values), lo)
+    hi = np.where(empty, len(values), hi)
+    return padded[lo] + (pos - lo) * (padded[hi] - padded[lo])
+
+
+def _segments(codes, num_groups):
+    counts = np.bincount(codes, minlength=num_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return starts, counts
+
+
+def group_statistics(table, group_col, value_col, remove_outliers=True, groups=None):
+    """
+    計算每組的敘述統計，回傳 (統計表, 剔除離群值後的長表)。
+
+    統計表每組一列 (依 groups 的順序，未指定時依組別首次出現的順序)，欄位為 STAT_COLUMNS:
+    n / mean / median / q1 / q3 / min / max 為剔除後的結果，lower_bound / upper_bound 為 IQR 界線
+    (未剔除的組別為 NaN)，n_removed 為被剔除的筆數。
+    長表保留原始列順序，只留下未被剔除的資料列；數值為 NaN 的列一律捨棄。
+    """
+    table = table[table[value_col].notna()]
+    if groups is None:
+        groups = pd.unique(table[group_col])
+    groups = list(groups)
+    codes = pd.Categorical(table[group_col], categories=groups).codes.astype(np.int64)
+    table = table[codes >= 0]
+    codes = codes[codes >= 0]
+    values = table[value_col].to_numpy(dtype=np.float64)
+
+    # 排序一次: 組內依數值遞增 (先依數值排序，再以組別做穩定排序；
+    # 組別代碼轉成 uint16 時 NumPy 的穩定排序為基數排序，比 lexsort 快得多)
+    order = np.argsort(values)
+    code_keys = codes[order].astype(np.uint16 if len(groups) <= np.iinfo(np.uint16).max else np.int64)
+    order = order[np.argsort(code_keys, kind="stable")]
+    sorted_values = values[order]
+    sorted_codes = codes[order]
+    starts, counts = _segments(sorted_codes, len(groups))
+
+    q1, q3 = _group_quantiles(sorted_values, starts, counts, [0.25, 0.75]).T
+    iqr = q3 - q1
+    filtered = remove_outliers & (counts >= IQR_MIN_COUNT)
+    lower = np.where(filtered, q1 - IQR_FACTOR * iqr, np.nan)
+    upper = np.where(filtered, q3 + IQR_FACTOR * iqr, np.nan)
+
+    keep_sorted = ~filtered[sorted_codes] | ((sorted_values >= lower[sorted_codes]) & (sorted_values <= upper[sorted_codes]))
+    kept_values = sorted_values[keep_sorted]
+    kept_starts, kept_counts = _segments(sorted_codes[keep_sorted], len(groups))
+
+    quartiles = _group_quantiles(kept_values, kept_starts, kept_counts, [0.25, 0.5, 0.75])
+    sums = np.bincount(sorted_codes[keep_sorted], weights=kept_values, minlength=len(groups))
+    nonempty = kept_counts > 0
+    padded = np.append(kept_values, np.nan)
+    mins = padded[np.where(nonempty, kept_starts, len(kept_values))]
+    maxs = padded[np.where(nonempty, kept_starts + kept_counts - 1, len(kept_values))]
+
+    statistics = pd.DataFrame({
+        group_col: groups,
+        "n": kept_counts,
+        "mean": np.where(nonempty, sums / np.maximum(kept_counts, 1), np.nan),
+        "median": quartiles[:, 1],
+        "q1": quartiles[:, 0],
+        "q3": quartiles[:, 2],
+        "min": mins,
+        "max": maxs,
+        "lower_bound": lower,
+        "upper_bound": upper,
+        "n_removed": counts - kept_counts,
+    })
+
+    keep = np.empty(len(values), dtype=bool)
+    keep[order] = keep_sorted
+    return statistics, table[keep]
+
+
+def group_values(data, statistics, group_col, value_col):
+    """依統計表的組別順序取出每組的數值陣列 (繪圖、檢定用)"""
+    grouped = {name: values.to_numpy() for name, values in data.groupby(group_col, sort=False)[value_col]}
+    return [grouped.get(name, np.array([])) for name in statistics[group_col]]
@@ -0,0 +1,392 @@
+"""
+summary_scores.csv 的監看 / 增量統計模式
+
+研究進行中每天只會多出少數參與者資料夾，不必每次重新掃描、重新計算全部資料:
+定期比對資料夾內各檔案的 (mtime_ns, 大小)，只讀取新增或修改過的檔案，
+把它們的分數加進 (或先移出舊的再加進) 各問卷的累計統計量:
+
+- RunningMoments : 樣本數 / 平均值 / 變異數，以 Welford (Chan 的批次合併公式) 累加，也可反向移出
+- QuantileSketch : 對數分桶的分位數草圖 (DDSketch 形式)，各桶只是計數，
+                   因此可合併也可刪除，四分位數的相對誤差不超過 alpha
+
+累計狀態 (含每個檔案目前的貢獻) 存成 JSON (預設為 output/.score_watch_state.json)，下次執行直接接續；
+只有統計結果改變時才重新輸出統計表與箱形圖到 output/。
+
+用法: python score_watch.py --root merge --interval 5 (或 python 統計分析.py watch ...)
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from score_ingest import DEFAULT_QUIZZES, QUIZ_COLUMN, SCORE_COLUMN, find_score_files, read_score_files
+from score_matrix import ScoreMatrix
+from score_stats import IQR_FACTOR
+
+STATE_VERSION = 2
+STATE_FILENAME = ".score_watch_state.json"
+DEFAULT_OUTPUT_DIR = "output"
+SKETCH_ALPHA = 0.01
+# 絕對值小於此值視為 0 (對數分桶無法表示 0)
+SKETCH_MIN_VALUE = 1e-9
+
+
+class RunningMoments:
+    """以 Welford / Chan 公式累計的樣本數、平均值與離差平方和 (m2)"""
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    @staticmethod
+    def _moments(values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return 0, 0.0, 0.0
+        mean = float(values.mean())
+        return len(values), mean, float(((values - mean) ** 2).sum())
+
+    def add(self, values):
+        nb, mean_b, m2_b = self._moments(values)
+        if nb == 0:
+            return
+        n = self.n + nb
+        delta = mean_b - self.mean
+        self.mean += delta * nb / n
+        self.m2 += m2_b + delta * delta * self.n * nb / n
+        self.n = n
+
+    def remove(self, values):
+        """移出先前加入過的數值 (add 的反運算)"""
+        nb, mean_b, m2_b = self._moments(values)
+        if nb == 0:
+            return
+        n_a = self.n - nb
+        if n_a <= 0:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        mean_a = (self.n * self.mean - nb * mean_b) / n_a
+        delta = mean_b - mean_a
+        self.m2 = max(self.m2 - m2_b - delta * delta * n_a * nb / self.n, 0.0)
+        self.mean, self.n = mean_a, n_a
+
+    @property
+    def variance(self):
+        """樣本變異數 (ddof=1)"""
+        return self.m2 / (self.n - 1) if self.n > 1 else float("nan")
+
+    def to_dict(self):
+        return {"n": self.n, "mean": self.mean, "m2": self.m2}
+
+
+class QuantileSketch:
+    """
+    對數分桶的分位數草圖: 數值 x 落在桶 ceil(log_gamma(|x|))，gamma = (1 + alpha) / (1 - alpha)，
+    以桶的代表值回答分位數，相對誤差不超過 alpha。
+    """
+
+    def __init__(self, alpha=SKETCH_ALPHA, positive=None, negative=None, zero=0):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {int(k): int(v) for k, v in (positive or {}).items()}
+        self.negative = {int(k): int(v) for k, v in (negative or {}).items()}
+        self.zero = zero
+
+    def _update(self, values, sign):
+        values = np.asarray(values, dtype=np.float64)
+        small = np.abs(values) < SKETCH_MIN_VALUE
+        self.zero += sign * int(small.sum())
+        for buckets, part in ((self.positive, values[~small & (values > 0)]),
+                              (self.negative, -values[~small & (values < 0)])):
+            if len(part) == 0:
+                continue
+            keys, counts = np.unique(np.ceil(np.log(part) / self._log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                remaining = buckets.get(key, 0) + sign * count
+                if remaining > 0:
+                    buckets[key] = remaining
+                else:
+                    buckets.pop(key, None)
+
+    def add(self, values):
+        self._update(values, 1)
+
+    def remove(self, values):
+        """移出先前加入過的數值 (各桶計數遞減)"""
+        self._update(values, -1)
+
+    def merge(self, other):
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+        self.zero += other.zero
+
+    @property
+    def count(self):
+        return sum(self.positive.values()) + sum(self.negative.values()) + self.zero
+
+    def _sorted_buckets(self):
+        """由小到大的 (代表值, 計數) 陣列"""
+        represent = 2 * self.gamma / (self.gamma + 1)
+        neg_keys = sorted(self.negative, reverse=True)
+        pos_keys = sorted(self.positive)
+        values = ([-represent * self.gamma ** (k - 1) for k in neg_keys] + [0.0]
+                  + [represent * self.gamma ** (k - 1) for k in pos_keys])
+        counts = [self.negative[k] for k in neg_keys] + [self.zero] + [self.positive[k] for k in pos_keys]
+        return np.array(values), np.array(counts, dtype=np.int64)
+
+    def quantiles(self, qs):
+        """
+        各分位數的估計值；空草圖為 NaN。
+        與 np.percentile (linear) 相同，在排序後第 floor / ceil(q x (n - 1)) 筆所在的桶之間線性內插。
+        """
+        total = self.count
+        if total == 0:
+            return [float("nan")] * len(qs)
+        values, counts = self._sorted_buckets()
+        cumulative = np.cumsum(counts)
+        ranks = np.asarray(qs, dtype=np.float64) * (total - 1)
+        lower, upper = (values[np.minimum(np.searchsorted(cumulative, rank, side="right"), len(values) - 1)]
+                        for rank in (np.floor(ranks), np.ceil(ranks)))
+        return (lower + (ranks - np.floor(ranks)) * (upper - lower)).tolist()
+
+    def count_outside(self, low, high):
+        """估計值落在 [low, high] 之外的筆數"""
+        values, counts = self._sorted_buckets()
+        return int(counts[(values < low) | (values > high)].sum())
+
+    def to_dict(self):
+        return {"alpha": self.alpha, "positive": self.positive, "negative": self.negative, "zero": self.zero}
+
+
+def default_state_path(output_dir=DEFAULT_OUTPUT_DIR):
+    """狀態檔的預設位置: 輸出資料夾下 (不寫入參與者資料的根目錄)"""
+    return os.path.join(output_dir, STATE_FILENAME)
+
+
+class ScoreWatcher:
+    """
+    持有各問卷的累計統計量與每個檔案目前的貢獻，refresh() 只處理有變動的檔案。
+    檔案的貢獻為套用「指定問卷分數皆相同則捨棄」規則後，該參與者各問卷的分數。
+    """
+
+    def __init__(self, root_directory, quizzes=DEFAULT_QUIZZES, state_path=None, processes=None):
+        self.root_directory = root_directory
+        self.quizzes = list(quizzes)
+        self.state_path = state_path or default_state_path()
+        self.processes = processes
+        self.files = {}  # 路徑 -> {"mtime_ns", "size", "scores": [各問卷分數或 None]}
+        self.moments = {q: RunningMoments() for q in self.quizzes}
+        self.sketches = {q: QuantileSketch() for q in self.quizzes}
+        self.restored = self._load()
+
+    def _load(self):
+        """載入先前的狀態，成功時回傳 True"""
+        if not os.path.exists(self.state_path):
+            return False
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 無法讀取監看狀態 {self.state_path}，將重新計算: {e}")
+            return False
+        if (state.get("version") != STATE_VERSION or state.get("quizzes") != self.quizzes
+                or state.get("root") != os.path.abspath(self.root_directory)):
+            print("⚠️ 監看狀態的版本、根目錄或問卷設定不同，將重新計算")
+            return False
+        self.files = state["files"]
+        self.moments = {q: RunningMoments(**state["moments"][q]) for q in self.quizzes}
+        self.sketches = {q: QuantileSketch(**state["sketches"][q]) for q in self.quizzes}
+        return True
+
+    def save(self):
+        state = {
+            "version": STATE_VERSION,
+            "root": os.path.abspath(self.root_directory),
+            "quizzes": self.quizzes,
+            "files": self.files,
+            "moments": {q: m.to_dict() for q, m in self.moments.items()},
+            "sketches": {q: s.to_dict() for q, s in self.sketches.items()},
+        }
+        state_dir = os.path.dirname(self.state_path)
+        if state_dir and not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def _apply(self, contributions, sign):
+        """把 [各問卷分數列表] 整批加入 (sign=1) 或移出 (sign=-1) 累計統計量"""
+        if not contributions:
+            return
+        matrix = np.array(contributions, dtype=np.float64)
+        for j, quiz in enumerate(self.quizzes):
+            column = matrix[:, j]
+            column = column[~np.isnan(column)]
+            if sign > 0:
+                self.moments[quiz].add(column)
+                self.sketches[quiz].add(column)
+            else:
+                self.moments[quiz].remove(column)
+                self.sketches[quiz].remove(column)
+
+    def refresh(self):
+        """處理新增、修改與刪除的檔案，回傳 (變動的檔案數, 統計結果是否改變)"""
+        before = self.summary()
+        current = {path: (mtime_ns, size) for path, mtime_ns, size in find_score_files(self.root_directory)}
+        stale = [(path, mtime_ns, size) for path, (mtime_ns, size) in current.items()
+                 if path not in self.files or (self.files[path]["mtime_ns"], self.files[path]["size"]) != (mtime_ns, size)]
+        removed = [path for path in self.files if path not in current]
+
+        # 先移出舊的貢獻
+        outdated = [path for path, _, _ in stale if path in self.files] + removed
+        self._apply([self.files[path]["scores"] for path in outdated], -1)
+        for path in outdated:
+            del self.files[path]
+
+        if stale:
+            table = read_score_files(stale, self.processes)
+            table = table[table[QUIZ_COLUMN].notna()]
+            matrix = ScoreMatrix.from_long(table, "path", QUIZ_COLUMN, SCORE_COLUMN, self.quizzes).exclude_all_equal()
+            rows = {pid: i for i, pid in enumerate(matrix.participants)}
+            contributions = []
+            for path, mtime_ns, size in stale:
+                if path in rows:
+                    scores = [None if np.isnan(v) else float(v) for v in matrix.values[rows[path]]]
+                else:
+                    # 沒有指定問卷的分數、被排除規則捨棄，或讀取失敗 (檔案再次修改時才重試)
+                    scores = [None] * len(self.quizzes)
+                self.files[path] = {"mtime_ns": mtime_ns, "size": size, "scores": scores}
+                contributions.append(scores)
+            self._apply(contributions, 1)
+
+        return len(stale) + len(removed), not self.summary().equals(before)
+
+    def summary(self):
+        """各問卷一列的統計表 (平均值 / 標準差來自 Welford，分位數與 IQR 界線來自草圖)"""
+        rows = []
+        for quiz in self.quizzes:
+            moments, sketch = self.moments[quiz], self.sketches[quiz]
+            q0, q1, median, q3, q100 = sketch.quantiles([0, 0.25, 0.5, 0.75, 1])
+            lower, upper = q1 - IQR_FACTOR * (q3 - q1), q3 + IQR_FACTOR * (q3 - q1)
+            rows.append({
+                QUIZ_COLUMN: quiz,
+                "n": moments.n,
+                "mean": moments.mean if moments.n else float("nan"),
+                "std": math.sqrt(moments.variance) if moments.n > 1 else float("nan"),
+                "median": median,
+                "q1": q1,
+                "q3": q3,
+                "min": q0,
+                "max": q100,
+                "lower_bound": lower,
+                "upper_bound": upper,
+                "n_outside": sketch.count_outside(lower, upper) if moments.n else 0,
+            })
+        return pd.DataFrame(rows)
+
+
+def render_outputs(summary, output_dir="output", title="即時統計"):
+    """輸出統計表 (CSV) 與以累計統計量繪製的箱形圖 (PNG)，回傳兩個路徑"""
+    import matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    csv_path = os.path.join(output_dir, f"{timestamp}_watch_stats.csv")
+    png_path = os.path.join(output_dir, f"{timestamp}_watch_boxplot.png")
+    summary.to_csv(csv_path, index=False, encoding="utf-8-sig")
+
+    shown = summary[summary["n"] > 0]
+    boxes = [{
+        "label": row[QUIZ_COLUMN], "med": row["median"], "q1": row["q1"], "q3": row["q3"], "mean": row["mean"],
+        "whislo": max(row["min"], row["lower_bound"]), "whishi": min(row["max"], row["upper_bound"]), "fliers": [],
+    } for _, row in shown.iterrows()]
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    with matplotlib.rc_context({"font.sans-serif": ["Microsoft JhengHei"], "axes.unicode_minus": False}):
+        _draw_summary(fig, shown, boxes, title)
+        fig.savefig(png_path, dpi=150)
+    return csv_path, png_path
+
+
+def _draw_summary(fig, shown, boxes, title):
+    ax = fig.add_subplot()
+    if boxes:
+        ax.bxp(boxes, showmeans=True, patch_artist=True,
+               medianprops={"color": "black", "linewidth": 1.5}, boxprops={"facecolor": "lightblue", "alpha": 0.5})
+        for i, row in enumerate(shown.itertuples(index=False)):
+            ax.text(i + 1, row.mean, f"平均: {row.mean:.2f}\nn={row.n}", ha="center", va="bottom")
+    ax.set_title(title, fontsize=14)
+    ax.set_xlabel("階段", fontsize=12)
+    ax.set_ylabel("分數", fontsize=12)
+    ax.grid(True, linestyle="--", alpha=0.7)
+    fig.tight_layout()
+
+
+def add_watch_arguments(parser):
+    """監看模式的命令列參數 (score_watch.py 與 統計分析.py watch 共用)"""
+    parser.add_argument("--quizzes", nargs="+", default=DEFAULT_QUIZZES, help="要統計的問卷名稱")
+    parser.add_argument("--interval", type=float, default=5.0, help="檢查間隔 (秒)")
+    parser.add_argument("--once", action="store_true", help="只更新一次後結束")
+    parser.add_argument("--state", type=str, default=None,
+                        help=f"狀態檔路徑 (預設: <output-dir>/{STATE_FILENAME})")
+    parser.add_argument("--rebuild", action="store_true", help="捨棄既有狀態，重新計算全部資料")
+    parser.add_argument("--output-dir", type=str, default=DEFAULT_OUTPUT_DIR, help="輸出資料夾")
+    parser.add_argument("--processes", type=int, default=None, help="初次讀取大量檔案時的進程數")
+
+
+def watch(args):
+    """依 add_watch_arguments() 的參數 (加上 --root) 監看並輸出統計，回傳結束碼"""
+    if not os.path.isdir(args.root):
+        print(f"錯誤：找不到資料夾 {args.root}")
+        return 1
+    state_path = args.state or default_state_path(args.output_dir)
+    if args.rebuild and os.path.exists(state_path):
+        os.remove(state_path)
+
+    watcher = ScoreWatcher(args.root, args.quizzes, state_path, processes=args.processes)
+    print(f"👀 監看 {args.root} (已記錄 {len(watcher.files)} 個檔案)")
+    # 接續既有狀態時，統計結果有變動才重新輸出
+    rendered = watcher.restored
+    try:
+        while True:
+            start = time.perf_counter()
+            changed_files, changed = watcher.refresh()
+            if changed_files:
+                watcher.save()
+            if changed or not rendered:
+                summary = watcher.summary()
+                csv_path, png_path = render_outputs(summary, args.output_dir)
+                rendered = True
+                print(f"📊 {changed_files} 個檔案有變動，更新統計 ({time.perf_counter() - start:.3f} 秒) → {csv_path}")
+                print(summary.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\n🛑 停止監看")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="監看 summary_scores.csv 並增量更新各問卷的統計結果")
+    parser.add_argument("--root", type=str, default="merge", help="參與者資料夾的根目錄")
+    add_watch_arguments(parser)
+    return watch(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
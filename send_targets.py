@@ -0,0 +1,252 @@
+"""
+多目標分送 (fan-out)
+
+一個發送進程可同時餵給多個接收端 (不同主機或同一主機的不同埠)，
+每個目標有自己的速率、回波 / 封包類型過濾與 socket。所有目標共用同一份
+封包語料 (只另存被選中封包的 offsets / lengths 索引，不複製負載)，
+由單一排程器依各目標的絕對時間表輪流送出，不增加進程數。
+
+目標格式: IP:PORT[@MB/s][,echo=1st|2nd][,type=upper|lower]
+例如 192.168.48.20:7000@100,echo=1st
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from lidar_packet import (ECHO_1ST, ECHO_2ND, PACKET_LOWER, PACKET_UPPER, RETURN_SEQ_OFFSET,
+                          aligned_count, gather_header_byte, partition_corpus)
+from replay_timing import wait_until
+from udp_send_engine import RETRYABLE_ERRNOS, create_sender, create_socket
+
+BYTES_PER_MB = 1024 * 1024
+# 發送緩衝區已滿 (ENOBUFS / EAGAIN) 時該目標延後重試的時間 (秒)
+RETRY_BACKOFF_S = 100e-6
+
+ECHO_FILTERS = {"all": None, "1st": ECHO_1ST, "2nd": ECHO_2ND}
+TYPE_FILTERS = {"all": None, "upper": PACKET_UPPER, "lower": PACKET_LOWER}
+
+
+class SendTarget:
+    """單一接收端的設定 (速率為 None 時沿用 --mbps)"""
+
+    def __init__(self, ip, port, mbps=None, echo="all", packet_type="all"):
+        self.ip = ip
+        self.port = port
+        self.mbps = mbps
+        self.echo = echo
+        self.packet_type = packet_type
+
+    @property
+    def address(self):
+        return (self.ip, self.port)
+
+    @property
+    def label(self):
+        """監測輸出用的簡短名稱"""
+        filters = [f"{name}={value}" for name, value in (("echo", self.echo), ("type", self.packet_type))
+                   if value != "all"]
+        return f"{self.ip}:{self.port}" + (f" ({', '.join(filters)})" if filters else "")
+
+    @property
+    def filtered(self):
+        return self.echo != "all" or self.packet_type != "all"
+
+    def select(self, return_seq):
+        """依回波 / 類型過濾，回傳布林遮罩 (return_seq 為每個封包的回波序號字節)"""
+        mask = np.ones(len(return_seq), dtype=bool)
+        if ECHO_FILTERS[self.echo] is not None:
+            mask &= (return_seq & 0x0F) == ECHO_FILTERS[self.echo]
+        if TYPE_FILTERS[self.packet_type] is not None:
+            mask &= (return_seq & 0xF0) == TYPE_FILTERS[self.packet_type]
+        return mask
+
+
+def parse_target(text):
+    """解析 --target 參數，格式見模組說明"""
+    spec, *options = [part.strip() for part in text.split(",")]
+    address, _, rate = spec.partition("@")
+    ip, _, port = address.rpartition(":")
+    try:
+        target = SendTarget(ip, int(port), float(rate) if rate else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的目標 '{text}' (格式: IP:PORT[@MB/s][,echo=..][,type=..])")
+    if not ip or not 0 < target.port < 65536 or (target.mbps is not None and target.mbps <= 0):
+        raise argparse.ArgumentTypeError(f"無效的目標 '{text}' (格式: IP:PORT[@MB/s][,echo=..][,type=..])")
+
+    for option in options:
+        key, _, value = option.partition("=")
+        if key == "echo" and value in ECHO_FILTERS:
+            target.echo = value
+        elif key == "type" and value in TYPE_FILTERS:
+            target.packet_type = value
+        else:
+            raise argparse.ArgumentTypeError(
+                f"無效的目標選項 '{option}' (可用: echo={'|'.join(ECHO_FILTERS)}, type={'|'.join(TYPE_FILTERS)})")
+    return target
+
+
+class CorpusSubset:
+    """
+    語料中部分封包的視圖，介面與封包語料相同，可直接交給發送後端。
+    只複製被選中封包的 offsets / lengths，負載仍指向原本的緩衝區。
+    """
+
+    def __init__(self, corpus, indices):
+        self.corpus = corpus
+        self.indices = indices
+        self.offsets = np.asarray(corpus.offsets)[indices]
+        self.lengths = np.asarray(corpus.lengths)[indices]
+        self.data = corpus.data
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        return self.corpus[int(self.indices[i])]
+
+    @property
+    def base_address(self):
+        return self.corpus.base_address
+
+
+class _TargetLane:
+    """排程器內單一目標的發送狀態"""
+
+    def __init__(self, corpus, target, partition, rate_bps, backend, batch_size):
+        self.target = target
+        self.source = corpus
+        # 串流來源 (合成封包 / 串流 PCAP) 在送完一批後呼叫 refill() 換下一批
+        self.refill = getattr(corpus, "refill", None)
+        self.rate_bps = rate_bps
+        self.sent_bytes = 0
+        self.backend = backend
+        self.batch_size = batch_size
+        self.sock = create_socket(sndbuf=4 * 1024 * 1024)
+        self._align = partition is None or partition[2] is not None
+        self._bind(*(partition or partition_corpus(corpus, 1, "lines")[0]))
+
+    def _bind(self, first_packet, end_packet, line_ends):
+        """依目前的來源內容建立 (過濾後的) 發送視圖與發送器"""
+        if self.target.filtered:
+            return_seq = gather_header_byte(self.source, RETURN_SEQ_OFFSET)
+            indices = first_packet + np.flatnonzero(self.target.select(return_seq[first_packet:end_packet]))
+            self.corpus = CorpusSubset(self.source, indices)
+            self.first, self.end = 0, len(indices)
+            # 過濾後不再有完整的掃描線，不做對齊
+            self.line_ends = None
+        else:
+            self.corpus = self.source
+            self.first, self.end = first_packet, end_packet
+            self.line_ends = line_ends
+        self.position = self.first
+        self.sender = create_sender(self.backend, self.sock, self.corpus, self.target.address, self.batch_size)
+
+    def advance(self):
+        """
+        換下一批封包 (串流來源)；來源已沒有資料時回傳 False。
+        每批的封包數與內容都可能不同，因此重新建立過濾索引與發送器。
+        """
+        if self.refill() is False:
+            return False
+        lines = partition_corpus(self.source, 1, "lines" if self._align else "none")[0]
+        self._bind(*lines)
+        return not self.empty
+
+    @property
+    def empty(self):
+        return self.end <= self.first
+
+
+class FanoutScheduler:
+    """
+    以單一迴圈驅動多個目標: 每次挑出下一個到期的目標，等到它的時刻後送出一批。
+    各目標的時刻依 已送出字節數 / 目標速率 計算 (絕對時間表，不會累積誤差)；
+    指定 governor (rate_governor.RateGovernor) 時改為每批送出後向所有進程共用的令牌桶扣款，
+    由令牌餘額決定下一批的時刻。
+    """
+
+    def __init__(self, corpus, targets, partition, rates_bps, backend="sendto", batch_size=64, governor=None):
+        """
+        corpus 可為共用的單一語料，或每個目標各自一個 (如各自獨立的串流來源)。
+        partition 為 (起點, 終點, 掃描線終點)；None 表示每個來源整批發送並對齊掃描線。
+        governor 的第 t 個桶對應 targets[t]。
+        """
+        corpora = corpus if isinstance(corpus, (list, tuple)) else [corpus] * len(targets)
+        self.lanes = [_TargetLane(source, target, partition, rate, backend, batch_size)
+                      for source, target, rate in zip(corpora, targets, rates_bps)]
+        for bucket, lane in enumerate(self.lanes):
+            lane.bucket = bucket
+        self.governor = governor
+
+    def describe(self):
+        """每個目標一行的說明文字"""
+        if self.governor is not None:
+            return [f"{lane.target.label}: 共用令牌桶 {self.governor.target_rate(lane.bucket) / BYTES_PER_MB:.2f} MB/s, "
+                    f"{lane.end - lane.first} 個封包, 後端 {lane.sender.name}" for lane in self.lanes]
+        return [f"{lane.target.label}: {lane.rate_bps / BYTES_PER_MB:.2f} MB/s, "
+                f"{lane.end - lane.first} 個封包, 後端 {lane.sender.name}" for lane in self.lanes]
+
+    def run(self, running, slots, on_wrap=None, lag_histograms=None, worker_id=0):
+        """
+        發送直到 running.value 為 False。
+        slots 為各目標的計數器槽位；每個目標送完一輪時呼叫 on_wrap(target)。
+        指定 lag_histograms 時，每批的實際發送時刻相對預定時刻的延遲記錄在 worker_id 列。
+        """
+        lanes = [lane for lane in self.lanes if not lane.empty]
+        slots = [slot for lane, slot in zip(self.lanes, slots) if not lane.empty]
+        if not lanes:
+            return
+        governor = self.governor
+        start_time = time.perf_counter()
+        due = np.full(len(lanes), start_time)  # 各目標下一批的發送時刻
+        retrying = np.zeros(len(lanes), dtype=bool)  # 該目標的這一批是否為重試
+        while running.value:
+            i = int(np.argmin(due))
+            if np.isinf(due[i]):
+                break  # 所有串流來源都已送完
+            lane, stats = lanes[i], slots[i]
+            deadline = due[i]
+            on_time = wait_until(deadline)
+            # 延遲與 pacing overrun 只在每批第一次嘗試時記錄，重試不重複計入
+            if not retrying[i]:
+                if not on_time:
+                    stats.add_pacing_overrun()
+                if lag_histograms is not None:
+                    lag_histograms.record_one(worker_id, time.perf_counter() - deadline)
+
+            count = aligned_count(lane.line_ends, lane.position, min(lane.sender.batch_size, lane.end - lane.position))
+            try:
+                sent_packets, packet_size = lane.sender.send(lane.position, count)
+            except OSError as e:
+                if e.errno not in RETRYABLE_ERRNOS:
+                    raise
+                stats.add_send_error()
+                # 延後此目標的時刻再重試: 不會忙等，其他目標也能在這段時間內輪到
+                retrying[i] = True
+                due[i] = time.perf_counter() + RETRY_BACKOFF_S
+                continue
+
+            retrying[i] = False
+            stats.add_sent(sent_packets, packet_size)
+            lane.sent_bytes += packet_size
+            if governor is None:
+                due[i] = start_time + lane.sent_bytes / lane.rate_bps
+            else:
+                # 送出後從共用令牌桶扣款，等到令牌餘額恢復才送下一批
+                due[i] = governor.consume(lane.bucket, packet_size)
+
+            lane.position += sent_packets
+            if lane.position >= lane.end:
+                if lane.refill is not None:
+                    if not lane.advance():
+                        due[i] = np.inf
+                else:
+                    lane.position = lane.first
+                    if on_wrap is not None:
+                        on_wrap(lane.target)
+
+    def close(self):
+        for lane in self.lanes:
+            lane.sock.close()
@@ -0,0 +1,173 @@
+"""
+發送端的無鎖統計計數器
+
+每個發送進程在共享記憶體中擁有一個獨立、以快取行 (64 字節) 對齊的槽位，
+只有該進程會寫入自己的槽位，因此熱路徑上完全不需要鎖。
+監測端直接讀取並加總所有槽位 (64 位元對齊存取在 x86-64 / ARM64 上不會撕裂)。
+節拍延遲直方圖 (PacingHistograms) 採用相同的單一寫入者配置。
+"""
+
+import bisect
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# 每個槽位的欄位 (其餘空間為填充，避免不同進程寫入同一快取行)
+COUNTER_FIELDS = ("bytes", "packets", "send_errors", "pacing_overruns")
+BYTES, PACKETS, SEND_ERRORS, PACING_OVERRUNS = range(len(COUNTER_FIELDS))
+CACHE_LINE_SIZE = 64
+SLOT_WORDS = CACHE_LINE_SIZE // 8
+
+
+class WorkerSlot:
+    """單一進程的計數器槽位 (僅供擁有者進程寫入)"""
+
+    __slots__ = ("_words", "_base", "bytes", "packets", "send_errors", "pacing_overruns")
+
+    def __init__(self, words, worker_id):
+        self._words = words
+        self._base = worker_id * SLOT_WORDS
+        self.bytes = words[self._base + BYTES]
+        self.packets = words[self._base + PACKETS]
+        self.send_errors = words[self._base + SEND_ERRORS]
+        self.pacing_overruns = words[self._base + PACING_OVERRUNS]
+
+    def add_sent(self, packets, nbytes):
+        """記錄成功送出的封包數與字節數"""
+        self.packets += packets
+        self.bytes += nbytes
+        self._words[self._base + PACKETS] = self.packets
+        self._words[self._base + BYTES] = self.bytes
+
+    def add_send_error(self):
+        """記錄一次暫時性發送錯誤 (ENOBUFS / EAGAIN)"""
+        self.send_errors += 1
+        self._words[self._base + SEND_ERRORS] = self.send_errors
+
+    def add_pacing_overrun(self):
+        """記錄一次節拍落後 (本批耗時已超過預定間隔)"""
+        self.pacing_overruns += 1
+        self._words[self._base + PACING_OVERRUNS] = self.pacing_overruns
+
+
+class WorkerCounters:
+    """
+    位於 multiprocessing.shared_memory 的每進程計數器陣列。
+
+    主進程以 WorkerCounters(num_workers) 建立，傳給子進程時只會
+    pickle 共享記憶體名稱，子進程重新附加到同一塊記憶體。
+    """
+
+    def __init__(self, num_workers, name=None):
+        self.num_workers = num_workers
+        size = num_workers * CACHE_LINE_SIZE
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._shm.buf[:size] = bytes(size)
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+        self._words = self._shm.buf[:size].cast("Q")
+        self._table = np.frombuffer(self._shm.buf, dtype=np.uint64, count=num_workers * SLOT_WORDS)
+        self._table = self._table.reshape(num_workers, SLOT_WORDS)
+
+    def __reduce__(self):
+        return (self.__class__, (self.num_workers, self._shm.name))
+
+    def slot(self, worker_id):
+        """取得指定進程的計數器槽位"""
+        return WorkerSlot(self._words, worker_id)
+
+    def snapshot(self):
+        """不加鎖地複製所有槽位，回傳 (num_workers, 欄位數) 陣列"""
+        return self._table[:, :len(COUNTER_FIELDS)].copy()
+
+    def totals(self):
+        """所有進程的加總，回傳 {欄位名稱: 數值}"""
+        sums = self.snapshot().sum(axis=0)
+        return {field: int(sums[i]) for i, field in enumerate(COUNTER_FIELDS)}
+
+    def close(self):
+        """解除對共享記憶體的附加；建立者同時將其刪除"""
+        self._table = None
+        self._words.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+# 節拍延遲直方圖的區間邊界 (µs): 0-100 以 1µs、100-1000 以 10µs、
+# 1-10ms 以 100µs、10-100ms 以 1ms 為間隔，最後一格收集所有更大的值
+LAG_BUCKET_EDGES_US = np.concatenate([
+    np.arange(0, 100, 1),
+    np.arange(100, 1000, 10),
+    np.arange(1000, 10000, 100),
+    np.arange(10000, 100001, 1000),
+]).astype(np.float64)
+LAG_BUCKETS = len(LAG_BUCKET_EDGES_US)
+_LAG_EDGES_LIST = LAG_BUCKET_EDGES_US.tolist()
+
+
+class PacingHistograms:
+    """
+    每進程一列的節拍延遲 (lateness) 直方圖，同樣位於共享記憶體中。
+    每列只由對應的進程寫入，讀取端不加鎖地取快照。
+    """
+
+    def __init__(self, num_workers, name=None):
+        self.num_workers = num_workers
+        row_bytes = -(-LAG_BUCKETS * 8 // CACHE_LINE_SIZE) * CACHE_LINE_SIZE
+        self._row_words = row_bytes // 8
+        size = num_workers * row_bytes
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._shm.buf[:size] = bytes(size)
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+        table = np.frombuffer(self._shm.buf, dtype=np.uint64, count=num_workers * self._row_words)
+        self._table = table.reshape(num_workers, self._row_words)
+
+    def __reduce__(self):
+        return (self.__class__, (self.num_workers, self._shm.name))
+
+    def record(self, worker_id, lateness_s):
+        """記錄一批封包的延遲 (秒，可為 NumPy 陣列)"""
+        lateness_us = np.asarray(lateness_s, dtype=np.float64) * 1e6
+        buckets = np.searchsorted(LAG_BUCKET_EDGES_US, lateness_us, side="right") - 1
+        np.clip(buckets, 0, LAG_BUCKETS - 1, out=buckets)
+        row = self._table[worker_id, :LAG_BUCKETS]
+        row += np.bincount(buckets, minlength=LAG_BUCKETS).astype(np.uint64)
+
+    def record_one(self, worker_id, lateness_s):
+        """記錄單一延遲值 (秒)；純 Python 的區間搜尋，適合每批呼叫一次的熱路徑"""
+        bucket = bisect.bisect_right(_LAG_EDGES_LIST, lateness_s * 1e6) - 1
+        self._table[worker_id, bucket if bucket > 0 else 0] += 1
+
+    def counts(self, worker_id=None):
+        """取得單一進程或全部進程加總的直方圖快照"""
+        if worker_id is None:
+            return self._table[:, :LAG_BUCKETS].sum(axis=0)
+        return self._table[worker_id, :LAG_BUCKETS].copy()
+
+    def percentiles(self, qs, worker_id=None):
+        """
+        由直方圖估計百分位數 (µs，取區間下界)。
+        沒有樣本時回傳 None。
+        """
+        counts = self.counts(worker_id)
+        total = int(counts.sum())
+        if total == 0:
+            return None
+        cumulative = np.cumsum(counts)
+        ranks = np.ceil(np.asarray(qs, dtype=np.float64) / 100 * total).clip(1, total)
+        return LAG_BUCKET_EDGES_US[np.searchsorted(cumulative, ranks)]
+
+    def close(self):
+        """解除對共享記憶體的附加；建立者同時將其刪除"""
+        self._table = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -0,0 +1,123 @@
+"""
+共享記憶體封包語料
+
+將封包負載一次性複製到單一 multiprocessing.shared_memory 區塊中，
+配置為: [連續的負載緩衝區][offsets][lengths][timestamps]。
+所有發送進程以名稱附加到同一區塊，不經過 pickle 也不複製負載，
+直接以 memoryview 切片送出。介面與 PcapCorpus 相同，可互相替換。
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _align8(n):
+    return (n + 7) & ~7
+
+
+def _layout(count, payload_bytes):
+    """計算各區段在共享記憶體中的位移，回傳 (offsets 位移, lengths 位移, ts 位移, 總大小)"""
+    offsets_at = _align8(payload_bytes)
+    lengths_at = offsets_at + count * 8
+    ts_at = _align8(lengths_at + count * 4)
+    return offsets_at, lengths_at, ts_at, max(1, ts_at + count * 8)
+
+
+class SharedPacketCorpus:
+    """
+    位於共享記憶體中的封包語料。
+
+    主進程以 SharedPacketCorpus.from_corpus() 建立；傳給子進程時
+    只 pickle 區塊名稱與大小，子進程重新附加到同一塊記憶體。
+    """
+
+    def __init__(self, count, payload_bytes, name=None):
+        self._count = count
+        self._payload_bytes = payload_bytes
+        offsets_at, lengths_at, ts_at, size = _layout(count, payload_bytes)
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+
+        buf = self._shm.buf
+        self._view = buf[:payload_bytes]
+        self.data = np.frombuffer(buf, dtype=np.uint8, count=payload_bytes)
+        self.offsets = np.frombuffer(buf, dtype=np.uint64, count=count, offset=offsets_at)
+        self.lengths = np.frombuffer(buf, dtype=np.uint32, count=count, offset=lengths_at)
+        self.timestamps_ns = np.frombuffer(buf, dtype=np.int64, count=count, offset=ts_at)
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """將既有語料 (如 PcapCorpus) 的負載壓緊複製到新的共享記憶體區塊"""
+        lengths = np.asarray(corpus.lengths, dtype=np.uint64)
+        dst_offsets = np.zeros(len(lengths), dtype=np.uint64)
+        if len(lengths):
+            np.cumsum(lengths[:-1], out=dst_offsets[1:])
+        payload_bytes = int(lengths.sum())
+
+        shared = cls(len(lengths), payload_bytes)
+        shared.offsets[:] = dst_offsets
+        shared.lengths[:] = lengths
+        shared.timestamps_ns[:] = corpus.timestamps_ns
+        shared._copy_payloads(corpus)
+        return shared
+
+    def _copy_payloads(self, corpus):
+        """複製負載；來源若是等長等距 (固定記錄長度的 PCAP)，以單次跨步複製完成"""
+        count = self._count
+        if count == 0:
+            return
+
+        src_offsets = np.asarray(corpus.offsets, dtype=np.uint64)
+        length = int(self.lengths[0])
+        strides = np.diff(src_offsets)
+        if (np.all(self.lengths == length)
+                and (count == 1 or np.all(strides == strides[0]))):
+            stride = int(strides[0]) if count > 1 else length
+            src = np.lib.stride_tricks.as_strided(
+                corpus.data[int(src_offsets[0]):], shape=(count, length), strides=(stride, 1))
+            self.data.reshape(count, length)[:] = src
+            return
+
+        view = self._view
+        for i in range(count):
+            packet = corpus[i]
+            dst = int(self.offsets[i])
+            view[dst:dst + len(packet)] = packet
+
+    def __reduce__(self):
+        return (self.__class__, (self._count, self._payload_bytes, self._shm.name))
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        offset = int(self.offsets[i])
+        return self._view[offset:offset + int(self.lengths[i])]
+
+    @property
+    def base_address(self):
+        """負載緩衝區起始位址 (供 sendmmsg 等需要原始指標的呼叫使用)"""
+        return self.data.ctypes.data
+
+    @property
+    def total_bytes(self):
+        """所有負載的總字節數"""
+        return self._payload_bytes
+
+    @property
+    def avg_packet_size(self):
+        """負載的平均大小"""
+        return self._payload_bytes / self._count if self._count else 0.0
+
+    def close(self):
+        """解除對共享記憶體的附加；建立者同時將其刪除"""
+        self.data = self.offsets = self.lengths = self.timestamps_ns = None
+        self._view.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -0,0 +1,119 @@
+"""
+命令列工具的啟動時間量測
+
+以子進程重複執行指定的命令 (每次都是全新的直譯器，包含所有 import 的成本)，
+回傳牆鐘時間的中位數 / 最小 / 最大值，並另外以 `python -X importtime` 執行一次，
+解析 stderr 取得各模組的 import 時間 (自身與累計)，列出累計時間最長的套件。
+
+用於確認只需要數值的路徑 (例如 `統計分析.py stats --format json`) 沒有載入
+matplotlib / scipy 等重量級模組，且整體啟動時間在預算之內。
+"""
+
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_REPEAT = 5
+DEFAULT_TOP = 10
+# import time:  自身 [us] |  累計 [us] | 模組名稱 (前置空白表示巢狀深度)
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$")
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的輸出，回傳 [(模組, 自身 µs, 累計 µs, 深度)]，順序與輸出相同"""
+    records = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return records
+
+
+def loaded_forbidden(records, forbidden):
+    """records 中屬於 forbidden 套件 (含子模組) 的頂層套件名稱"""
+    found = set()
+    for module, *_ in records:
+        for name in forbidden:
+            if module == name or module.startswith(name + "."):
+                found.add(name)
+    return sorted(found)
+
+
+def _run(command, cwd=None, env=None):
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True)
+    return time.perf_counter() - start, result
+
+
+def measure_startup(command, repeat=DEFAULT_REPEAT, budget=None, forbidden=(), top=DEFAULT_TOP, cwd=None, env=None):
+    """
+    執行 command (argv 列表，第一個元素須為 Python 直譯器) repeat 次並量測，回傳報告字典:
+    wall_median_s / wall_min_s / wall_max_s、budget_s、returncode (任一次失敗即為該次的結束碼)、
+    imports (累計時間最長的 top 個套件: module, self_ms, cumulative_ms)、
+    import_total_ms (最外層 import 的累計時間總和)、forbidden_loaded (載入了的禁止套件)、
+    passed (全部成功、中位數不超過預算且未載入禁止套件)。
+    """
+    times = []
+    returncode = 0
+    error = ""
+    for _ in range(repeat):
+        elapsed, result = _run(command, cwd, env)
+        times.append(elapsed)
+        if result.returncode != 0 and returncode == 0:
+            returncode, error = result.returncode, result.stderr.strip()
+
+    # 另外執行一次取得 import 明細 (-X importtime 本身會拖慢執行，不計入牆鐘時間)
+    _, result = _run([command[0], "-X", "importtime"] + list(command[1:]), cwd, env)
+    records = parse_importtime(result.stderr)
+    top_level = [r for r in records if r[3] == 0]
+    # 依套件 (名稱不含 '.' 的模組) 的累計時間排序，pandas 等被間接匯入的套件也會列出
+    packages = sorted((r for r in records if "." not in r[0]), key=lambda r: r[2], reverse=True)
+
+    wall_median = statistics.median(times)
+    forbidden_found = loaded_forbidden(records, forbidden)
+    return {
+        "command": list(command),
+        "repeat": repeat,
+        "wall_median_s": wall_median,
+        "wall_min_s": min(times),
+        "wall_max_s": max(times),
+        "budget_s": budget,
+        "returncode": returncode,
+        "error": error,
+        "import_total_ms": sum(r[2] for r in top_level) / 1000,
+        "imports": [{"module": m, "self_ms": s / 1000, "cumulative_ms": c / 1000} for m, s, c, _ in packages[:top]],
+        "forbidden_loaded": forbidden_found,
+        "passed": returncode == 0 and not forbidden_found and (budget is None or wall_median <= budget),
+    }
+
+
+def print_report(report):
+    """以表格輸出 measure_startup() 的報告"""
+    print(f"命令: {' '.join(report['command'])}")
+    print(f"執行 {report['repeat']} 次: 中位數 {report['wall_median_s'] * 1000:.1f} ms "
+          f"(最小 {report['wall_min_s'] * 1000:.1f} ms, 最大 {report['wall_max_s'] * 1000:.1f} ms)")
+    if report["returncode"] != 0:
+        print(f"❌ 命令失敗 (結束碼 {report['returncode']}): {report['error'][-500:]}")
+
+    print(f"\n套件 import 時間 (全部 import 合計 {report['import_total_ms']:.1f} ms):")
+    print("{:<32} | {:>10} | {:>10}".format("模組", "自身(ms)", "累計(ms)"))
+    print("-" * 58)
+    for item in report["imports"]:
+        print("{:<32} | {:>10.1f} | {:>10.1f}".format(item["module"], item["self_ms"], item["cumulative_ms"]))
+
+    if report["forbidden_loaded"]:
+        print(f"\n❌ 載入了不應載入的模組: {', '.join(report['forbidden_loaded'])}")
+    if report["budget_s"] is not None:
+        within = report["wall_median_s"] <= report["budget_s"]
+        mark = "✅" if within else "❌"
+        print(f"\n{mark} 啟動時間 {report['wall_median_s'] * 1000:.1f} ms / 預算 {report['budget_s'] * 1000:.0f} ms")
+    print("✅ 通過" if report["passed"] else "❌ 未通過")
+
+
+def python_command(script, *args):
+    """以目前的直譯器執行 script 的 argv"""
+    return [sys.executable, script, *args]
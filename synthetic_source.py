@@ -0,0 +1,178 @@
+"""
+合成 LiDAR 封包產生器
+
+以 NumPy 整批產生合法的 816 字節封包，作為不受擷取檔長度限制的串流來源:
+
+- 標頭魔數正確，每條掃描線依回波依序送出上半部、下半部
+- 方位角原始值在一幀 (LINES_PER_FRAME 條線) 內掃過整個 lookup_table，之後循環
+- 距離 / 強度來自參數化場景 (sphere 等距球面、room 長方體房間、random 隨機)，
+  可再加上高斯雜訊與遺失點 (距離 0)
+- 可混入一定比例的無效封包 (魔數錯誤)，測試接收端的過濾
+
+SyntheticLidarSource 的介面與封包語料相同 (固定跨步)，可直接交給發送後端；
+送完目前的批次後呼叫 refill() 就地產生下一批，緩衝區位址不變。
+"""
+
+import numpy as np
+
+from lidar_decoder import LidarDecoder, load_lookup_table
+from lidar_packet import (AZIMUTH_OFFSET, ECHO_1ST, ECHO_2ND, HEADER_MAGIC, LINES_PER_FRAME,
+                          PACKET_LOWER, PACKET_SIZE, PACKET_UPPER, POINT_START_OFFSET,
+                          POINTS_PER_PACKET, RETURN_SEQ_OFFSET)
+
+SYNTHETIC_SCENES = ("sphere", "room", "random")
+SYNTHETIC_ECHOES = {"1st": (ECHO_1ST,), "2nd": (ECHO_2ND,), "dual": (ECHO_1ST, ECHO_2ND)}
+MAX_RANGE = 65535
+
+
+def scene_ranges(scene, azimuth_deg, elevation_deg, scale, seed=0):
+    """
+    計算一整圈 (每條線 x 上下半部 x 260 點) 的距離原始值。
+    azimuth_deg 為每條線的方位角，elevation_deg 為 (2, 260) 的仰角表 (第 0 列下半部)。
+    scale 為場景的特徵距離 (球面半徑 / 房間半深度，單位與封包中的距離原始值相同)。
+    """
+    az = np.deg2rad(azimuth_deg.astype(np.float64))[:, None, None]
+    el = np.deg2rad(elevation_deg.astype(np.float64))[None, :, :]
+    shape = (len(azimuth_deg),) + elevation_deg.shape
+
+    if scene == "sphere":
+        ranges = np.full(shape, float(scale))
+    elif scene == "room":
+        # 感測器位於長方體房間內: 左右牆 ±0.6 倍、前後牆 ±1 倍、地板 -0.15 倍、天花板 +0.25 倍
+        direction = (np.cos(el) * np.sin(az), np.cos(el) * np.cos(az), np.sin(el) * np.ones_like(az))
+        bounds = ((0.6 * scale, 0.6 * scale), (scale, scale), (0.15 * scale, 0.25 * scale))
+        ranges = np.full(shape, np.inf)
+        with np.errstate(divide="ignore"):
+            for d, (negative, positive) in zip(direction, bounds):
+                d = np.broadcast_to(d, shape)
+                hit = np.where(d > 0, positive / d, np.where(d < 0, -negative / d, np.inf))
+                np.minimum(ranges, hit, out=ranges)
+    elif scene == "random":
+        ranges = np.random.default_rng(seed).uniform(0.05 * scale, scale, shape)
+    else:
+        raise ValueError(f"未知的場景: {scene}")
+    return np.clip(np.rint(ranges), 0, MAX_RANGE).astype(np.uint16)
+
+
+class SyntheticLidarSource:
+    """
+    固定大小的合成封包批次 (batch_lines 條掃描線)，介面與封包語料相同。
+
+    封包依 [線][回波][上半部, 下半部] 排列；每次 refill() 前進 batch_lines 條線。
+    first_line 可讓不同進程從不同的方位角開始。
+    """
+
+    def __init__(self, scene="room", echo="dual", batch_lines=1024, scale=2000, noise=0.0, dropout=0.0,
+                 invalid=0.0, frame_rate=10.0, first_line=0, seed=0, lookup_table=None):
+        if lookup_table is None:
+            lookup_table = load_lookup_table()
+        self.echoes = SYNTHETIC_ECHOES[echo]
+        self.packets_per_line = 2 * len(self.echoes)
+        self.batch_lines = batch_lines
+        self.invalid = invalid
+        self.line = first_line
+        self._rng = np.random.default_rng(seed)
+        self._line_period_ns = 1e9 / (frame_rate * LINES_PER_FRAME)
+
+        # 一幀內每條線的方位角原始值，均勻掃過整個 lookup_table
+        table_size = len(lookup_table)
+        self._azimuth_raw = (np.arange(LINES_PER_FRAME) * table_size // LINES_PER_FRAME).astype("<u2")
+
+        # 預先計算整圈的距離與強度 (第 1 維: 0 = 上半部, 1 = 下半部，與封包順序相同)
+        decoder = LidarDecoder(lookup_table)
+        elevation = decoder.elevation[::-1]  # decoder 的第 0 列為下半部
+        ranges = scene_ranges(scene, decoder.azimuth_table[self._azimuth_raw], elevation, scale, seed)
+        self._ranges = ranges
+        with np.errstate(divide="ignore"):
+            self._intensity = np.clip(255.0 * scale / np.maximum(ranges, 1), 0, 255).astype(np.uint8)
+
+        # 批次緩衝區與固定的標頭欄位
+        count = batch_lines * self.packets_per_line
+        self.packet_stride = PACKET_SIZE
+        self.data = np.zeros(count * PACKET_SIZE, dtype=np.uint8)
+        self.packets = self.data.reshape(batch_lines, len(self.echoes), 2, PACKET_SIZE)
+        self.packets[..., :len(HEADER_MAGIC)] = np.frombuffer(HEADER_MAGIC, dtype=np.uint8)
+        echo_bits = np.asarray(self.echoes, dtype=np.uint8)[:, None]
+        self.packets[..., RETURN_SEQ_OFFSET] = echo_bits | np.array([PACKET_UPPER, PACKET_LOWER], dtype=np.uint8)
+        self._points = self.packets[..., POINT_START_OFFSET:POINT_START_OFFSET + POINTS_PER_PACKET * 3]
+        self._points = self._points.reshape(batch_lines, len(self.echoes), 2, POINTS_PER_PACKET, 3)
+
+        self.offsets = np.arange(count, dtype=np.uint64) * np.uint64(PACKET_SIZE)
+        self.lengths = np.full(count, PACKET_SIZE, dtype=np.uint32)
+        self.timestamps_ns = np.zeros(count, dtype=np.int64)
+        self._view = memoryview(self.data)
+
+        # 雜訊與遺失點預先產生成 4 倍批次大小的循環池，每批只取一段隨機位置的切片，
+        # 避免每批都呼叫亂數產生器
+        points = batch_lines * len(self.echoes) * 2 * POINTS_PER_PACKET
+        self._pool_size = 4 * points
+        self._noise_pool = self._dropout_pool = None
+        if noise > 0:
+            pool = np.rint(self._rng.standard_normal(self._pool_size + points) * noise)
+            self._noise_pool = np.clip(pool, -MAX_RANGE, MAX_RANGE).astype(np.int32)
+        if dropout > 0:
+            self._dropout_pool = self._rng.random(self._pool_size + points) < dropout
+        self._fill()
+
+    def _fill(self):
+        """依目前的線號產生整批封包 (就地覆寫)"""
+        lines = self.line + np.arange(self.batch_lines)
+        in_frame = lines % LINES_PER_FRAME
+
+        azimuth = self._azimuth_raw[in_frame]
+        self.packets[..., AZIMUTH_OFFSET] = (azimuth & 0xFF).astype(np.uint8)[:, None, None]
+        self.packets[..., AZIMUTH_OFFSET + 1] = (azimuth >> 8).astype(np.uint8)[:, None, None]
+
+        ranges = self._ranges[in_frame][:, None]  # (線, 1, 2, 260)，各回波共用
+        intensity = self._intensity[in_frame][:, None]
+        if self._noise_pool is not None or self._dropout_pool is not None:
+            shape = (self.batch_lines, len(self.echoes), 2, POINTS_PER_PACKET)
+            points = int(np.prod(shape))
+            ranges = np.broadcast_to(ranges, shape).astype(np.int32)
+            if self._noise_pool is not None:
+                start = int(self._rng.integers(self._pool_size))
+                ranges += self._noise_pool[start:start + points].reshape(shape)
+            if self._dropout_pool is not None:
+                start = int(self._rng.integers(self._pool_size))
+                ranges[self._dropout_pool[start:start + points].reshape(shape)] = 0
+            ranges = np.clip(ranges, 0, MAX_RANGE).astype(np.uint16)
+
+        self._points[..., 0] = intensity
+        self._points[..., 1] = (ranges & 0xFF).astype(np.uint8)
+        self._points[..., 2] = (ranges >> 8).astype(np.uint8)
+
+        # 無效封包: 破壞魔數 (其他欄位維持原樣)
+        self.packets[..., 0] = HEADER_MAGIC[0]
+        if self.invalid > 0:
+            flat = self.packets.reshape(-1, PACKET_SIZE)
+            flat[self._rng.random(len(flat)) < self.invalid, 0] = 0
+
+        packet_time = np.repeat(lines * self._line_period_ns, self.packets_per_line)
+        self.timestamps_ns[:] = packet_time.astype(np.int64)
+
+    def refill(self):
+        """前進到下一批並就地重新產生"""
+        self.line += self.batch_lines
+        self._fill()
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, i):
+        offset = int(i) * PACKET_SIZE
+        return self._view[offset:offset + PACKET_SIZE]
+
+    @property
+    def base_address(self):
+        return self.data.ctypes.data
+
+    @property
+    def total_bytes(self):
+        return len(self.data)
+
+    @property
+    def avg_packet_size(self):
+        return float(PACKET_SIZE)
+
+    def close(self):
+        self._view.release()
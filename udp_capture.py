@@ -0,0 +1,463 @@
+"""
+線速 UDP 擷取 (寫成 PCAP)
+
+綁定 LiDAR 的 UDP 埠，以 recvmmsg() 批次接收 datagram，直接寫成奈秒時間戳的
+PCAP 檔 (補上乙太網路 / IPv4 / UDP 標頭)，同時寫出 pcap_index 使用的 .idx 索引，
+之後 UDP_test.py / PcapCorpus 可直接載入，不需要 tcpdump 或 root 權限。
+
+- 每個 datagram 直接收進寫入緩衝區中預留好標頭空間的位置 (等長封包不需再複製)，
+  標頭以 NumPy 整批填入
+- 時間戳來自核心的 SO_TIMESTAMPNS，丟棄數來自 SO_RXQ_OVFL，
+  IPv4 標頭的目的位址來自 IP_PKTINFO (綁定 0.0.0.0 時仍為封包實際的目的位址)
+- 寫滿的緩衝區交給背景執行緒寫檔，接收迴圈不會被磁碟 I/O 卡住
+
+用法: python udp_capture.py --port 7000 --duration 60
+"""
+
+import argparse
+import ctypes
+import errno
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from lidar_packet import PACKET_SIZE
+from pcap_index import (ETH_HEADER_SIZE, ETH_TYPE_IPV4, INDEX_DTYPE, INDEX_HEADER, INDEX_MAGIC, IP_PROTO_UDP,
+                        LINKTYPE_ETHERNET, PCAP_MAGIC_NSEC, PCAP_RECORD_HEADER_SIZE, UDP_HEADER_SIZE,
+                        index_path_for)
+from udp_send_engine import IOVEC_DTYPE, MMSGHDR_DTYPE
+
+# Linux socket 常數 (socket 模組不一定提供)
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40)
+IP_PKTINFO = getattr(socket, "IP_PKTINFO", 8)
+SO_RCVBUFFORCE = getattr(socket, "SO_RCVBUFFORCE", 33)
+MSG_WAITFORONE = 0x10000
+MSG_TRUNC = getattr(socket, "MSG_TRUNC", 0x20)
+
+IPV4_HEADER_SIZE = 20
+FRAME_HEADER_SIZE = ETH_HEADER_SIZE + IPV4_HEADER_SIZE + UDP_HEADER_SIZE  # 42
+RECORD_OVERHEAD = PCAP_RECORD_HEADER_SIZE + FRAME_HEADER_SIZE  # 每筆記錄在負載前的 58 字節
+PCAP_GLOBAL_HEADER = struct.Struct("<IHHiIII")
+MAX_DATAGRAM = 65507
+
+# 每則訊息的控制緩衝區: 時間戳 cmsg (CMSG_SPACE(16) = 32) + 丟棄數 cmsg (CMSG_SPACE(4) = 24)
+# + in_pktinfo cmsg (CMSG_SPACE(12) = 32)
+CONTROL_SIZE = 88
+CMSG_HEADER_SIZE = 16  # cmsg_len (size_t) + cmsg_level + cmsg_type
+MAX_CMSGS = 3
+BLOCK_BYTES = 32 * 1024 * 1024  # 至少要能容納一整批最大長度的 datagram
+BLOCK_COUNT = 4
+BATCH_SIZE = 256
+
+
+def _load_recvmmsg():
+    """取得 libc 的 recvmmsg()，不支援的平台回傳 None"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    func.restype = ctypes.c_int
+    return func
+
+
+def create_capture_socket(host, port, rcvbuf=64 * 1024 * 1024, timeout=0.2):
+    """建立並綁定接收 socket (大接收緩衝區、核心時間戳、丟棄計數、逾時以便檢查停止條件)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, rcvbuf)  # 需要 CAP_NET_ADMIN
+    except OSError:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+    sock.setsockopt(socket.IPPROTO_IP, IP_PKTINFO, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO,
+                    struct.pack("ll", int(timeout), int((timeout % 1) * 1e6)))
+    sock.bind((host, port))
+    return sock
+
+
+def frame_headers(src_addr, dst_addr, dst_port, lengths):
+    """
+    以 NumPy 整批產生乙太網路 / IPv4 / UDP 標頭 (n, 42)。
+    src_addr 為 recvmmsg 回傳的 sockaddr_in (n, 16)；dst_addr 為每個封包的目的 IPv4 位址 (n, 4)
+    或所有封包共用的位址字串。IPv4 標頭檢查碼一併計算，UDP 檢查碼為 0。
+    """
+    n = len(lengths)
+    hdr = np.zeros((n, FRAME_HEADER_SIZE), dtype=np.uint8)
+    hdr[:, 12] = ETH_TYPE_IPV4 >> 8
+    hdr[:, 13] = ETH_TYPE_IPV4 & 0xFF
+
+    ip = hdr[:, ETH_HEADER_SIZE:ETH_HEADER_SIZE + IPV4_HEADER_SIZE]
+    total = lengths.astype(np.uint32) + IPV4_HEADER_SIZE + UDP_HEADER_SIZE
+    ip[:, 0] = 0x45
+    ip[:, 2] = total >> 8
+    ip[:, 3] = total & 0xFF
+    ip[:, 6] = 0x40  # DF
+    ip[:, 8] = 64    # TTL
+    ip[:, 9] = IP_PROTO_UDP
+    ip[:, 12:16] = src_addr[:, 4:8]
+    if isinstance(dst_addr, str):
+        dst_addr = np.frombuffer(socket.inet_aton(dst_addr), dtype=np.uint8)
+    ip[:, 16:20] = dst_addr
+    words = (ip[:, 0::2].astype(np.uint32) << 8) | ip[:, 1::2]
+    csum = words.sum(axis=1)
+    csum = (csum & 0xFFFF) + (csum >> 16)
+    csum = (csum & 0xFFFF) + (csum >> 16)
+    csum = ~csum & 0xFFFF
+    ip[:, 10] = csum >> 8
+    ip[:, 11] = csum & 0xFF
+
+    udp = hdr[:, ETH_HEADER_SIZE + IPV4_HEADER_SIZE:]
+    udp_len = lengths.astype(np.uint32) + UDP_HEADER_SIZE
+    udp[:, 0:2] = src_addr[:, 2:4]
+    udp[:, 2] = dst_port >> 8
+    udp[:, 3] = dst_port & 0xFF
+    udp[:, 4] = udp_len >> 8
+    udp[:, 5] = udp_len & 0xFF
+    return hdr
+
+
+class _Block:
+    """一塊寫入緩衝區與對應的索引記錄"""
+
+    def __init__(self, size):
+        self.data = np.empty(size, dtype=np.uint8)
+        self.index = np.empty(size // (RECORD_OVERHEAD + 1), dtype=INDEX_DTYPE)
+        self.address = self.data.ctypes.data
+        self.reset(0)
+
+    def reset(self, file_offset):
+        self.file_offset = file_offset  # 本區塊第一個字節在 PCAP 檔中的位移
+        self.used = 0
+        self.count = 0
+
+    def add_index(self, positions, lengths, ts_ns):
+        n = len(lengths)
+        entries = self.index[self.count:self.count + n]
+        entries["offset"] = self.file_offset + positions + RECORD_OVERHEAD
+        entries["length"] = lengths
+        entries["ts_ns"] = ts_ns
+        self.count += n
+
+
+class PcapCaptureWriter:
+    """
+    接收迴圈與背景寫檔執行緒。
+
+    recvmmsg 的第一個 iovec 指向目前區塊中預留好 58 字節標頭空間的位置 (長度 expected_size)，
+    第二個 iovec 指向溢位區，收下比預期長的 datagram；等長的一批直接就是連續的 PCAP 記錄。
+    """
+
+    def __init__(self, sock, pcap_path, dst_ip, dst_port, expected_size=PACKET_SIZE, max_size=MAX_DATAGRAM,
+                 batch_size=BATCH_SIZE, block_bytes=BLOCK_BYTES, block_count=BLOCK_COUNT):
+        self._recvmmsg = _load_recvmmsg()
+        if self._recvmmsg is None:
+            raise OSError("此平台不支援 recvmmsg()")
+        self.sock = sock
+        self.pcap_path = pcap_path
+        self.index_path = index_path_for(pcap_path)
+        self.dst_ip = dst_ip
+        self.dst_port = dst_port
+        self.expected = expected_size
+        self.stride = RECORD_OVERHEAD + expected_size
+        self.batch_size = batch_size
+        self.block_bytes = block_bytes
+        if batch_size * (RECORD_OVERHEAD + max_size) > block_bytes:
+            raise ValueError("寫入緩衝區太小，無法容納一整批最大長度的 datagram")
+
+        self.packets = 0
+        self.bytes = 0
+        self.kernel_drops = 0
+        self.truncated = 0
+        self.writer_stalls = 0
+
+        # recvmmsg 的訊息、位址、控制與溢位緩衝區 (固定配置，每批只更新 iov_base 與長度欄位)
+        n = batch_size
+        self._names = np.zeros((n, 16), dtype=np.uint8)
+        self._control = np.zeros((n, CONTROL_SIZE), dtype=np.uint8)
+        self._overflow_size = max(max_size - expected_size, 0)
+        self._overflow = np.empty((n, max(self._overflow_size, 1)), dtype=np.uint8)
+        self._iov = np.zeros((n, 2), dtype=IOVEC_DTYPE)
+        self._iov["iov_len"][:, 0] = expected_size
+        self._iov["iov_base"][:, 1] = self._overflow.ctypes.data + np.arange(n, dtype=np.uint64) * self._overflow.shape[1]
+        self._iov["iov_len"][:, 1] = self._overflow_size
+        self._msgs = np.zeros(n, dtype=MMSGHDR_DTYPE)
+        hdr = self._msgs["msg_hdr"]
+        hdr["msg_name"] = self._names.ctypes.data + np.arange(n, dtype=np.uint64) * 16
+        hdr["msg_iov"] = self._iov.ctypes.data + np.arange(n, dtype=np.uint64) * 2 * IOVEC_DTYPE.itemsize
+        hdr["msg_iovlen"] = 2
+        hdr["msg_control"] = self._control.ctypes.data + np.arange(n, dtype=np.uint64) * CONTROL_SIZE
+        self._hdr = hdr
+        self._slot_offsets = RECORD_OVERHEAD + np.arange(n, dtype=np.uint64) * np.uint64(self.stride)
+        self._fd = sock.fileno()
+
+        # 區塊池: free 佇列裝空區塊，pending 佇列裝待寫入的區塊
+        self._free = queue.Queue()
+        self._pending = queue.Queue()
+        for _ in range(block_count):
+            self._free.put(_Block(block_bytes))
+        self._pcap = open(pcap_path, "wb", buffering=0)
+        self._pcap.write(PCAP_GLOBAL_HEADER.pack(PCAP_MAGIC_NSEC, 2, 4, 0, 0, MAX_DATAGRAM + FRAME_HEADER_SIZE,
+                                                 LINKTYPE_ETHERNET))
+        self._index_tmp = self.index_path + ".tmp"
+        self._index = open(self._index_tmp, "wb")
+        self._index.write(bytes(INDEX_HEADER.size))  # 結束時再寫入真正的標頭
+        self._writer_error = None
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        self._block = self._free.get()
+        self._block.reset(PCAP_GLOBAL_HEADER.size)
+
+    # ------------------------------------------------------------------
+    # 寫檔執行緒
+
+    def _write_loop(self):
+        while True:
+            block = self._pending.get()
+            if block is None:
+                return
+            try:
+                self._pcap.write(memoryview(block.data)[:block.used])
+                self._index.write(memoryview(block.index[:block.count]).cast("B"))
+            except OSError as e:
+                self._writer_error = e
+                return
+            self._free.put(block)
+
+    def _flush_block(self):
+        """把目前區塊交給寫檔執行緒並換一個空區塊 (寫檔跟不上時會在這裡等待)"""
+        block = self._block
+        if block.used == 0:
+            return
+        if self._writer_error is not None:
+            raise self._writer_error
+        self._pending.put(block)
+        try:
+            self._block = self._free.get_nowait()
+        except queue.Empty:
+            self.writer_stalls += 1
+            self._block = self._free.get()
+        self._block.reset(block.file_offset + block.used)
+
+    # ------------------------------------------------------------------
+    # 接收
+
+    def receive_batch(self):
+        """接收一批 datagram 並寫入緩衝區，回傳收到的封包數 (逾時為 0)"""
+        if self._block.used + self.batch_size * self.stride > self.block_bytes:
+            self._flush_block()
+        block = self._block
+        self._iov["iov_base"][:, 0] = self._slot_offsets + np.uint64(block.address + block.used)
+        self._hdr["msg_namelen"] = 16
+        self._hdr["msg_controllen"] = CONTROL_SIZE
+
+        n = self._recvmmsg(self._fd, self._msgs.ctypes.data, self.batch_size, MSG_WAITFORONE, None)
+        if n <= 0:
+            err = ctypes.get_errno()
+            if n < 0 and err not in (errno.EAGAIN, errno.EINTR):
+                raise OSError(err, f"recvmmsg: {errno.errorcode.get(err, err)}")
+            return 0
+
+        lengths = self._msgs["msg_len"][:n].astype(np.int64)
+        ts_ns, dst_addr = self._parse_control(n)
+        self.truncated += int(np.count_nonzero(self._hdr["msg_flags"][:n] & MSG_TRUNC))
+        frames = frame_headers(self._names[:n], dst_addr, self.dst_port, lengths)
+        records = np.empty((n, 4), dtype="<u4")
+        records[:, 0] = ts_ns // 1_000_000_000
+        records[:, 1] = ts_ns % 1_000_000_000
+        records[:, 2] = records[:, 3] = lengths + FRAME_HEADER_SIZE
+        records = records.view(np.uint8)
+
+        if np.all(lengths == self.expected):
+            # 快速路徑: 負載已在定位，只需填入標頭
+            rows = block.data[block.used:block.used + n * self.stride].reshape(n, self.stride)
+            rows[:, :PCAP_RECORD_HEADER_SIZE] = records
+            rows[:, PCAP_RECORD_HEADER_SIZE:RECORD_OVERHEAD] = frames
+            positions = block.used + np.arange(n, dtype=np.int64) * self.stride
+            block.used += n * self.stride
+        else:
+            positions = self._compact(n, lengths, records, frames)
+            block = self._block
+        block.add_index(positions, lengths, ts_ns)
+
+        self.packets += n
+        self.bytes += int(lengths.sum())
+        return n
+
+    def _compact(self, n, lengths, records, frames):
+        """不等長的一批: 先取出負載，再依序寫成緊密的記錄"""
+        block = self._block
+        base = block.used
+        payloads = []
+        for i, length in enumerate(lengths.tolist()):
+            slot = base + RECORD_OVERHEAD + i * self.stride
+            head = block.data[slot:slot + min(length, self.expected)].tobytes()
+            payloads.append(head + self._overflow[i, :max(length - self.expected, 0)].tobytes())
+
+        if base + int(lengths.sum()) + n * RECORD_OVERHEAD > self.block_bytes:
+            self._flush_block()
+            block = self._block
+        positions = np.empty(n, dtype=np.int64)
+        pos = block.used
+        for i, payload in enumerate(payloads):
+            positions[i] = pos
+            block.data[pos:pos + PCAP_RECORD_HEADER_SIZE] = records[i]
+            block.data[pos + PCAP_RECORD_HEADER_SIZE:pos + RECORD_OVERHEAD] = frames[i]
+            end = pos + RECORD_OVERHEAD + len(payload)
+            block.data[pos + RECORD_OVERHEAD:end] = np.frombuffer(payload, dtype=np.uint8)
+            pos = end
+        block.used = pos
+        return positions
+
+    def _parse_control(self, n):
+        """
+        由控制訊息取出核心時間戳 (奈秒) 與封包的目的位址 (n, 4)，並更新丟棄計數。
+        cmsg 的順序為 時間戳、丟棄數 (只在非零時附帶)、in_pktinfo，因此逐一走訪而非固定位移；
+        缺少時間戳的封包以目前時間補上，缺少 in_pktinfo 的封包以 dst_ip 補上。
+        """
+        control = self._control[:n]
+        words = control.view("<u8")  # (n, CONTROL_SIZE / 8)
+        controllen = self._hdr["msg_controllen"][:n].astype(np.int64)
+        rows = np.arange(n)
+        last_word = words.shape[1] - 1
+        ts_ns = np.full(n, -1, dtype=np.int64)
+        dst_addr = np.empty((n, 4), dtype=np.uint8)
+        dst_addr[:] = np.frombuffer(socket.inet_aton(self.dst_ip), dtype=np.uint8)
+
+        def word(k):
+            """每則訊息目前 cmsg 的第 k 個 8 字節字組"""
+            return words[rows, np.minimum(w + k, last_word)]
+
+        offset = np.zeros(n, dtype=np.int64)
+        for _ in range(MAX_CMSGS):
+            cmsg_len = np.zeros(n, dtype=np.int64)
+            valid = offset + CMSG_HEADER_SIZE <= controllen
+            w = np.where(valid, offset // 8, 0)
+            cmsg_len[valid] = word(0)[valid].astype(np.int64)
+            valid &= (cmsg_len >= CMSG_HEADER_SIZE) & (offset + cmsg_len <= controllen)
+            if not valid.any():
+                break
+            level_type = word(1)
+            level = level_type & np.uint64(0xFFFFFFFF)
+            kind = level_type >> np.uint64(32)
+
+            is_ts = valid & (level == socket.SOL_SOCKET) & (kind == SO_TIMESTAMPNS)
+            if is_ts.any():
+                ts_ns[is_ts] = (word(2)[is_ts].astype(np.int64) * 1_000_000_000
+                                + word(3)[is_ts].astype(np.int64))
+            is_drops = valid & (level == socket.SOL_SOCKET) & (kind == SO_RXQ_OVFL)
+            if is_drops.any():
+                drops = (word(2)[is_drops] & np.uint64(0xFFFFFFFF)).max()
+                self.kernel_drops = max(self.kernel_drops, int(drops))
+            # in_pktinfo: ipi_ifindex, ipi_spec_dst (本機位址), ipi_addr (IPv4 標頭的目的位址)
+            is_pktinfo = valid & (level == socket.IPPROTO_IP) & (kind == IP_PKTINFO)
+            if is_pktinfo.any():
+                addr_start = offset[is_pktinfo] + CMSG_HEADER_SIZE + 8
+                dst_addr[is_pktinfo] = control[rows[is_pktinfo][:, None], addr_start[:, None] + np.arange(4)]
+            # CMSG_ALIGN: 下一個 cmsg 對齊到 8 字節
+            offset = np.where(valid, offset + ((cmsg_len + 7) & ~7), controllen)
+
+        missing = ts_ns < 0
+        if missing.any():
+            ts_ns[missing] = time.time_ns()
+        return ts_ns, dst_addr
+
+    # ------------------------------------------------------------------
+
+    def close(self):
+        """寫出剩餘資料，補上索引標頭並原子替換成正式的 .idx 檔，回傳索引記錄數"""
+        self._flush_block()
+        self._pending.put(None)
+        self._writer.join()
+        self._pcap.close()
+        if self._writer_error is not None:
+            self._index.close()
+            os.remove(self._index_tmp)
+            raise self._writer_error
+
+        count = self.packets
+        source_stat = os.stat(self.pcap_path)
+        self._index.seek(0)
+        self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, source_stat.st_size, source_stat.st_mtime_ns, count))
+        self._index.close()
+        os.replace(self._index_tmp, self.index_path)
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以 recvmmsg 批次接收 UDP 封包並寫成 PCAP (含封包索引)")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="綁定的本機位址")
+    parser.add_argument("--port", type=int, default=7000, help="LiDAR 封包的 UDP 埠")
+    parser.add_argument("--output", type=str, default=None,
+                        help="輸出 PCAP 路徑 (預設: output/<時間戳>_capture.pcap)")
+    parser.add_argument("--duration", type=float, default=0.0, help="擷取秒數 (0 表示直到 Ctrl+C)")
+    parser.add_argument("--count", type=int, default=0, help="擷取封包數上限 (0 表示不限)")
+    parser.add_argument("--packet-size", type=int, default=PACKET_SIZE, help="預期的負載大小 (等長時走零複製路徑)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每次 recvmmsg 最多接收的封包數")
+    parser.add_argument("--rcvbuf", type=int, default=64, help="socket 接收緩衝區大小 (MB)")
+    args = parser.parse_args()
+
+    output = args.output
+    if output is None:
+        if not os.path.exists("output"):
+            os.makedirs("output")
+        output = os.path.join("output", f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_capture.pcap")
+
+    try:
+        sock = create_capture_socket(args.host, args.port, rcvbuf=args.rcvbuf * 1024 * 1024)
+        writer = PcapCaptureWriter(sock, output, args.host, args.port, expected_size=args.packet_size,
+                                   batch_size=args.batch_size)
+    except (OSError, ValueError) as e:
+        print(f"錯誤：無法開始擷取: {e}")
+        return 1
+    rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    print(f"🎧 在 {args.host}:{args.port} 擷取 UDP 封包 → {output} (接收緩衝區 {rcvbuf / 1024 / 1024:.1f} MB)")
+
+    start_time = time.perf_counter()
+    next_print = start_time + 1
+    last_bytes = last_packets = 0
+    try:
+        while True:
+            writer.receive_batch()
+            now = time.perf_counter()
+            if now >= next_print:
+                print(f"📥 已擷取 {writer.packets} 個封包 ({writer.bytes / 1024 / 1024:.2f} MB), "
+                      f"{(writer.bytes - last_bytes) / 1024 / 1024 / (now - next_print + 1):.2f} MB/s, "
+                      f"{writer.packets - last_packets} pkt/s, 核心丟棄: {writer.kernel_drops}")
+                last_bytes, last_packets = writer.bytes, writer.packets
+                next_print += 1
+            if args.duration and now - start_time >= args.duration:
+                break
+            if args.count and writer.packets >= args.count:
+                break
+    except KeyboardInterrupt:
+        print("\n🛑 停止擷取")
+    finally:
+        elapsed = time.perf_counter() - start_time
+        count = writer.close()
+        sock.close()
+
+    print(f"✅ 共擷取 {count} 個封包, {writer.bytes / 1024 / 1024:.2f} MB, 平均 "
+          f"{writer.bytes / 1024 / 1024 / max(elapsed, 1e-9):.2f} MB/s")
+    print(f"   PCAP: {output}")
+    print(f"   索引: {writer.index_path}")
+    if writer.kernel_drops or writer.truncated or writer.writer_stalls:
+        print(f"⚠️ 核心丟棄 {writer.kernel_drops} 個封包, 截斷 {writer.truncated} 個, 寫檔跟不上 {writer.writer_stalls} 次")
+    else:
+        print("   沒有偵測到丟棄")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
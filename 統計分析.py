@@ -1,90 +1,76 @@
+"""
+問卷分數統計與箱形圖
+
+子命令:
+- stats     : 只輸出數值統計 (text 或 --format json)，不載入 matplotlib；加 --tests 才載入 scipy 做檢定
+- plot      : 統計並繪製箱形圖 (--batch 為各組別平行輸出，Agg 後端)；未指定子命令時即為此模式
+- benchmark : 量測 stats --format json 的啟動時間與 -X importtime 明細，檢查是否在預算之內
+- watch     : 監看 summary_scores.csv，只重新讀取變動的檔案並增量更新統計 (見 score_watch.py)
+
+matplotlib 與 scipy 只在需要繪圖或檢定的函式內匯入，只要數字時不必付出載入它們的時間。
+"""
+
+import argparse
+import contextlib
+import json
+import math
 import os
-import pandas as pd
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.stats import ttest_ind  # 引入 t 檢定
+from score_ingest import DEFAULT_QUIZZES, QUIZ_COLUMN, SCORE_COLUMN, find_score_files, load_scores
+from score_matrix import ScoreMatrix, paired_tests, repeated_measures
+from score_resampling import DEFAULT_RESAMPLES, pairwise_tests
+from score_stats import group_statistics, group_values
 
-def remove_outliers_iqr(data):
+COMMANDS = ('stats', 'plot', 'benchmark', 'watch')
+# stats --format json 的啟動時間預算 (秒) 與不應載入的套件
+STARTUP_BUDGET_S = 1.0
+STATS_FORBIDDEN_MODULES = ('matplotlib', 'scipy')
+TEST_METHODS = ('ttest', 'permutation', 'paired_t', 'wilcoxon')
+
+def boxplot_labels_arg():
+    """matplotlib 3.9 起 boxplot 的 labels 參數改名為 tick_labels"""
+    import matplotlib
+    return 'tick_labels' if tuple(int(v) for v in matplotlib.__version__.split('.')[:2]) >= (3, 9) else 'labels'
+
+def load_score_matrix(root_directory, quizzes=DEFAULT_QUIZZES, cache_path=None, processes=None):
     """
-    利用 IQR 方法移除離群值。
-    當資料量不足（小於 4 筆）時，直接回傳原資料。
+    讀取資料夾下所有 summary_scores.csv，建立 參與者 x 問卷 的分數矩陣 (參與者 ID 為檔案路徑)。
+    
+    檔案以進程池平行讀取，並依 (路徑, 修改時間) 快取於 cache_path
+    (預設為資料夾內的 .score_cache.parquet)，重新執行時只讀取有變動的檔案。
+    quizzes 為要分析的問卷名稱 (任意數量)，None 表示資料中出現的所有問卷。
+    
+    若單一參與者的所有指定問卷分數皆存在且數值均相同
+    (預設即「飛鳥前測」、「飛鳥後測」與「音樂後測」三者相同)，則捨棄該參與者的所有資料。
     """
-    if len(data) < 4:
-        return data
-    q1 = np.percentile(data, 25)
-    q3 = np.percentile(data, 75)
-    iqr = q3 - q1
-    lower_bound = q1 - 1.5 * iqr
-    upper_bound = q3 + 1.5 * iqr
-    filtered = [x for x in data if lower_bound <= x <= upper_bound]
-    return filtered
-
-def analyze_scores(root_directory, remove_outliers=True):
+    table = load_scores(root_directory, cache_path=cache_path, processes=processes)
+    matrix = ScoreMatrix.from_long(table, 'path', QUIZ_COLUMN, SCORE_COLUMN, questionnaires=quizzes)
+    return matrix.exclude_all_equal()
+
+def analyze_scores(root_directory, remove_outliers=True, cache_path=None, processes=None, quizzes=DEFAULT_QUIZZES):
     """
     遍歷指定資料夾，讀取 summary_scores.csv，
-    並依據問卷名稱收集各測驗分數。
+    並依據問卷名稱收集各測驗分數 (讀取與排除規則見 load_score_matrix())。
     
     若 remove_outliers 為 True，則利用 IQR 方法剔除離群值。
     
-    同時，若單一參與者的「飛鳥前測」、「飛鳥後測」與「音樂後測」
-    分數皆存在且三者數值均相同，則捨棄該參與者的所有資料。
+    回傳 (statistics, data):
+    statistics 為每個問卷一列的統計表 (欄位見 score_stats.STAT_COLUMNS)，
+    data 為剔除離群值後的長表 (path, 問卷名稱, 總分)，可再以 ScoreMatrix.from_long() 轉成矩陣做配對檢定。
     """
-    # 用於存儲各測驗的所有分數
-    scores = {
-        '飛鳥前測': [],
-        '飛鳥後測': [],
-        '音樂後測': []
-    }
-    
-    # 遍歷所有資料夾
-    for dirpath, dirnames, filenames in os.walk(root_directory):
-        if 'summary_scores.csv' in filenames:
-            file_path = os.path.join(dirpath, 'summary_scores.csv')
-            try:
-                df = pd.read_csv(file_path, encoding='utf-8')
-                participant_scores = {}
-                # 收集單一參與者的各測驗分數
-                for index, row in df.iterrows():
-                    if row['問卷名稱'] in scores:
-                        participant_scores[row['問卷名稱']] = row['總分']
-                        
-                # 若該參與者擁有三項測驗且三者分數均相同，則跳過該參與者的所有資料
-                if len(participant_scores) == 3 and len(set(participant_scores.values())) == 1:
-                    continue
-                else:
-                    for quiz, score in participant_scores.items():
-                        scores[quiz].append(score)
-            except Exception as e:
-                print(f"處理檔案 {file_path} 時發生錯誤: {e}")
-    
-    # 計算統計數據
-    statistics = {
-        'names': [],
-        'means': [],
-        'medians': [],
-        'q1': [],
-        'q3': [],
-        'mins': [],
-        'maxs': [],
-        'counts': [],
-        'data': []
-    }
-    
-    # 對每一個問卷類別進行統計，並依需求進行離群值剔除
-    for name, values in scores.items():
-        if values:
-            filtered_values = remove_outliers_iqr(values) if remove_outliers else values
-            statistics['names'].append(name)
-            statistics['means'].append(np.mean(filtered_values))
-            statistics['medians'].append(np.median(filtered_values))
-            statistics['q1'].append(np.percentile(filtered_values, 25))
-            statistics['q3'].append(np.percentile(filtered_values, 75))
-            statistics['mins'].append(np.min(filtered_values))
-            statistics['maxs'].append(np.max(filtered_values))
-            statistics['counts'].append(len(filtered_values))
-            statistics['data'].append(filtered_values)
-    
-    return statistics
+    matrix = load_score_matrix(root_directory, quizzes=quizzes, cache_path=cache_path, processes=processes)
+    table = matrix.to_long('path', QUIZ_COLUMN, SCORE_COLUMN)
+
+    # 所有問卷一次完成離群值剔除與統計；沒有任何分數的問卷不列出
+    statistics, data = group_statistics(table, QUIZ_COLUMN, SCORE_COLUMN, remove_outliers=remove_outliers,
+                                        groups=matrix.questionnaires)
+    statistics = statistics[statistics['n'] + statistics['n_removed'] > 0].reset_index(drop=True)
+    return statistics, data
 
 def get_significance_marker(p_val):
     """根據 p 值返回對應的顯著性標記"""
@@ -97,119 +83,354 @@ def get_significance_marker(p_val):
     else:
         return ''
 
-def plot_scores_with_boxplot(statistics, custom_labels=None):
+def compare_groups(statistics, data, method='ttest', n_resamples=DEFAULT_RESAMPLES, seed=None, processes=1):
+    """
+    對所有問卷兩兩比較，回傳每對一列的 DataFrame，含 a, b (組別索引)、method、
+    p_value (依 method 選用的 p 值) 與 marker (顯著性標記)，以及各方法的統計量欄位。
+
+    method:
+    - 'ttest'       : Welch t 檢定 (獨立樣本)
+    - 'permutation' : 置換檢定 p 值，並附 bootstrap 信賴區間 (獨立樣本)；以 seed 固定亂數，
+                      processes > 1 時各對以進程池平行計算
+    - 'paired_t'    : 配對 t 檢定 (同一參與者的前後測，只用兩者都有分數的參與者)
+    - 'wilcoxon'    : Wilcoxon 符號等級檢定 (配對)
+    """
+    names = list(statistics[QUIZ_COLUMN])
+    if method in ('paired_t', 'wilcoxon'):
+        matrix = ScoreMatrix.from_long(data, 'path', QUIZ_COLUMN, SCORE_COLUMN, questionnaires=names)
+        tests = paired_tests(matrix)
+        tests['p_value'] = tests['p_paired_t'] if method == 'paired_t' else tests['p_wilcoxon']
+    else:
+        group_data = group_values(data, statistics, QUIZ_COLUMN, SCORE_COLUMN)
+        tests = pairwise_tests(group_data, names, n_resamples=0 if method == 'ttest' else n_resamples, seed=seed,
+                               processes=processes)
+        tests['p_value'] = tests['p_ttest'] if method == 'ttest' else tests['p_permutation']
+    tests['method'] = method
+    tests['marker'] = [get_significance_marker(p) for p in tests['p_value']]
+    return tests
+
+def plot_scores_with_boxplot(statistics, data, custom_labels=None, tests=None, fig=None, title='合併'):
     """
-    利用 matplotlib 繪製箱形圖，並標示原始數據與 t 檢定結果。
-    這裡對 1-2、1-3 及 2-3 三組都做 t 檢定。
+    利用 matplotlib 繪製箱形圖，並標示原始數據與檢定結果，回傳 Figure。
+    statistics 與 data 為 analyze_scores() 的回傳值。
+    tests 為 compare_groups() 的結果；未提供時對所有組別兩兩做 t 檢定
+    (三組時即 1-2、1-3 及 2-3)。
+    fig 為要重複使用的 Figure (會先清空)；未提供時以 pyplot 建立新的圖。
     """
-    plt.figure(figsize=(10, 6))
+    import matplotlib.pyplot as plt
+
+    names = list(statistics[QUIZ_COLUMN])
+    group_data = group_values(data, statistics, QUIZ_COLUMN, SCORE_COLUMN)
+    if fig is None:
+        fig = plt.figure(figsize=(10, 6))
+    else:
+        fig.clear()
+    ax = fig.add_subplot()
     
     # 設置中文字體
     plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']
     plt.rcParams['axes.unicode_minus'] = False
 
     # 若 custom_labels 不為 None 且數量正確，則使用自定義標籤
-    if custom_labels is not None and len(custom_labels) == len(statistics['names']):
+    if custom_labels is not None and len(custom_labels) == len(names):
         x_labels = custom_labels
     else:
-        x_labels = statistics['names']
+        x_labels = names
     
     # 繪製箱形圖
-    box_plot = plt.boxplot(statistics['data'], 
-                           labels=x_labels,
-                           patch_artist=True,
-                           medianprops={'color': 'black', 'linewidth': 1.5},
-                           flierprops={'marker': 'o', 'markerfacecolor': 'gray'},
-                           boxprops={'facecolor': 'lightblue', 'alpha': 0.5},
-                           showfliers=False)  # 不顯示離群點（另以散點顯示）
+    box_plot = ax.boxplot(group_data, 
+                          patch_artist=True,
+                          medianprops={'color': 'black', 'linewidth': 1.5},
+                          flierprops={'marker': 'o', 'markerfacecolor': 'gray'},
+                          boxprops={'facecolor': 'lightblue', 'alpha': 0.5},
+                          showfliers=False,  # 不顯示離群點（另以散點顯示）
+                          **{boxplot_labels_arg(): x_labels})
     
     # 添加散點圖顯示原始數據（並加上隨機偏移避免重疊）
-    for i, data in enumerate(statistics['data']):
-        x = np.random.normal(i+1, 0.04, size=len(data))
-        plt.scatter(x, data, alpha=0.6, c='red', s=30)
+    for i, values in enumerate(group_data):
+        x = np.random.normal(i+1, 0.04, size=len(values))
+        ax.scatter(x, values, alpha=0.6, c='red', s=30)
     
     # 在箱形圖上標註平均值
-    for i, mean in enumerate(statistics['means']):
-        plt.text(i+1, mean, f'平均: {mean:.2f}', ha='center', va='bottom')
+    for i, mean in enumerate(statistics['mean']):
+        ax.text(i+1, mean, f'平均: {mean:.2f}', ha='center', va='bottom')
     
     # ---------------------------
-    # 進行 t 檢定
+    # 進行檢定 (所有組別兩兩比較)
     # 組別索引：0 = 飛鳥前測 (base), 1 = 飛鳥後測 (stress), 2 = 音樂後測 (music)
-    # 1 vs 2
-    t_stat_1_2, p_val_1_2 = ttest_ind(statistics['data'][0], statistics['data'][1], equal_var=False)
-    sig_marker_1_2 = get_significance_marker(p_val_1_2)
-    # 1 vs 3
-    t_stat_1_3, p_val_1_3 = ttest_ind(statistics['data'][0], statistics['data'][2], equal_var=False)
-    sig_marker_1_3 = get_significance_marker(p_val_1_3)
-    # 2 vs 3
-    t_stat_2_3, p_val_2_3 = ttest_ind(statistics['data'][1], statistics['data'][2], equal_var=False)
-    sig_marker_2_3 = get_significance_marker(p_val_2_3)
+    if tests is None:
+        tests = compare_groups(statistics, data)
     
     # ---------------------------
     # 設置圖表標題、座標軸標籤及網格
-    plt.title('合併', fontsize=14)
-    plt.xlabel('階段', fontsize=12)
-    plt.ylabel('分數', fontsize=12)
-    plt.grid(True, linestyle='--', alpha=0.7)
+    ax.set_title(title, fontsize=14)
+    ax.set_xlabel('階段', fontsize=12)
+    ax.set_ylabel('分數', fontsize=12)
+    ax.grid(True, linestyle='--', alpha=0.7)
     
-    # 設定固定的縱軸範圍，並增加空間以便標示統計檢定結果
-    plt.ylim(0, 15)
+    # 設定固定的縱軸範圍，並增加空間以便標示統計檢定結果 (比較數超過三對時往上延伸)
+    ax.set_ylim(0, max(15, 11.5 + len(tests) + 0.5))
     
     # ---------------------------
-    # 標示 t 檢定結果（利用水平線與文字標示）
-    # 組別 1 vs 組別 2 (x=1 與 x=2)
-    y0 = 11.5  # 調整位置
-    plt.plot([1, 1, 2, 2], [y0, y0+0.5, y0+0.5, y0], lw=1.5, c='black')
-    plt.text(1.5, y0+0.5, f"p={p_val_1_2:.3f}, t={t_stat_1_2:.2f}{sig_marker_1_2}", 
-             ha='center', va='bottom')
-    
-    # 組別 1 vs 組別 3 (x=1 與 x=3)
-    y1 = 12.5  # 調整位置
-    plt.plot([1, 1, 3, 3], [y1, y1+0.5, y1+0.5, y1], lw=1.5, c='black')
-    plt.text(2, y1+0.5, f"p={p_val_1_3:.3f}, t={t_stat_1_3:.2f}{sig_marker_1_3}", 
-             ha='center', va='bottom')
-    
-    # 組別 2 vs 組別 3 (x=2 與 x=3)
-    y2 = 13.5  # 調整位置
-    plt.plot([2, 2, 3, 3], [y2, y2+0.5, y2+0.5, y2], lw=1.5, c='black')
-    plt.text(2.5, y2+0.5, f"p={p_val_2_3:.3f}, t={t_stat_2_3:.2f}{sig_marker_2_3}", 
-             ha='center', va='bottom')
+    # 標示檢定結果（利用水平線與文字標示），每對比較往上一層
+    for k, row in enumerate(tests.itertuples(index=False)):
+        i, j = row.a, row.b
+        y = 11.5 + k  # 調整位置
+        ax.plot([i+1, i+1, j+1, j+1], [y, y+0.5, y+0.5, y], lw=1.5, c='black')
+        if row.method in ('ttest', 'paired_t'):
+            label = f"p={row.p_value:.3f}, t={row.t_stat:.2f}{row.marker}"
+        elif row.method == 'wilcoxon':
+            label = f"p={row.p_value:.3f}, W={row.w_stat:.1f}{row.marker}"
+        else:
+            label = f"p={row.p_value:.3f}, Δ={row.diff:.2f} [{row.ci_low:.2f}, {row.ci_high:.2f}]{row.marker}"
+        ax.text((i+j)/2 + 1, y+0.5, label, ha='center', va='bottom')
     
     # 調整整體布局
-    plt.tight_layout()
+    fig.tight_layout()
     
-    return plt
+    return fig
 
-def main():
-    root_directory = "merge"  # 資料夾路徑
-    
-    # 分析數據時啟用離群值剔除 (remove_outliers=True)
-    statistics = analyze_scores(root_directory, remove_outliers=True)
+def find_cohorts(root_directory):
+    """
+    找出各組別 (cohort) 資料夾: root 下每個含有 summary_scores.csv 的子資料夾為一組；
+    root 本身直接含有參與者資料 (沒有分組) 時整個 root 為一組。回傳 [(名稱, 路徑)]。
+    """
+    cohorts = []
+    for entry in sorted(os.scandir(root_directory), key=lambda e: e.name):
+        if entry.is_dir() and not entry.name.startswith('.') and find_score_files(entry.path):
+            cohorts.append((entry.name, entry.path))
+    if not cohorts and find_score_files(root_directory):
+        cohorts.append((os.path.basename(os.path.normpath(root_directory)), root_directory))
+    return cohorts
+
+# 批次繪圖的工作進程各自持有一個 Figure，處理每個組別時清空後重複使用
+_batch_figure = None
+
+def _render_cohort(args):
+    """分析並繪製單一組別，輸出箱形圖與統計表 (進程池工作函式)，回傳 (名稱, 圖檔, 統計表, 錯誤)"""
+    global _batch_figure
+    name, path, output_dir, timestamp, options = args
+    try:
+        statistics, data = analyze_scores(path, remove_outliers=options['remove_outliers'], processes=1,
+                                          quizzes=options['quizzes'])
+        if statistics.empty:
+            return name, None, None, '沒有可分析的分數'
+        tests = compare_groups(statistics, data, method=options['method'], seed=options['seed'])
+        if _batch_figure is None:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            _batch_figure = Figure(figsize=(10, 6))
+            FigureCanvasAgg(_batch_figure)
+        plot_scores_with_boxplot(statistics, data, custom_labels=options['custom_labels'], tests=tests,
+                                 fig=_batch_figure, title=name)
+        safe_name = name.replace(os.sep, '_')
+        image_path = os.path.join(output_dir, f"{timestamp}_{safe_name}_boxplot.png")
+        table_path = os.path.join(output_dir, f"{timestamp}_{safe_name}_stats.csv")
+        _batch_figure.savefig(image_path, dpi=300, bbox_inches='tight')
+        statistics.to_csv(table_path, index=False, encoding='utf-8-sig')
+        tests.to_csv(table_path.replace('_stats.csv', '_tests.csv'), index=False, encoding='utf-8-sig')
+        return name, image_path, table_path, None
+    except Exception as e:
+        return name, None, None, str(e)
+
+def _init_batch_worker():
+    # 無顯示器的伺服器上使用非互動的 Agg 後端
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+def render_cohorts(root_directory, output_dir='output', processes=None, quizzes=DEFAULT_QUIZZES, remove_outliers=True,
+                   method='ttest', seed=None, custom_labels=None):
+    """
+    對 root 下每個組別分別分析與繪圖 (以進程池平行處理，Agg 後端，不開視窗)，
+    輸出 <時間戳>_<組別>_boxplot.png、_stats.csv 與 _tests.csv 到 output_dir，回傳各組結果列表。
+    """
+    cohorts = find_cohorts(root_directory)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    options = {'quizzes': quizzes, 'remove_outliers': remove_outliers, 'method': method, 'seed': seed,
+               'custom_labels': custom_labels}
+    jobs = [(name, path, output_dir, timestamp, options) for name, path in cohorts]
+    if processes == 1 or len(jobs) <= 1:
+        _init_batch_worker()
+        return [_render_cohort(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_batch_worker) as pool:
+        return list(pool.map(_render_cohort, jobs))
+
+def print_statistics(statistics, data, repeated=True):
+    """輸出數值統計結果；repeated 為 True 時另做重複量數分析 (需要 scipy)"""
+    print("\n數值統計結果：")
+    for row in statistics.itertuples(index=False):
+        print(f"{getattr(row, QUIZ_COLUMN)}:")
+        print(f"  樣本數(n): {row.n}")
+        print(f"  平均值: {row.mean:.2f}")
+        print(f"  中位數: {row.median:.2f}")
+        print(f"  第一四分位數(Q1): {row.q1:.2f}")
+        print(f"  第三四分位數(Q3): {row.q3:.2f}")
+        print(f"  最小值: {row.min:.2f}")
+        print(f"  最大值: {row.max:.2f}")
+        print()
     
+    if not repeated:
+        return
+    # 重複量數分析 (只用所有問卷都有分數的參與者)
+    rm = repeated_measures_summary(statistics, data)
+    print(f"重複量數分析 (完整作答 n={rm['n']}):")
+    print(f"  重複量數 ANOVA: F({rm['df_conditions']}, {rm['df_error']}) = {rm['f_stat']:.2f}, p = {rm['p_anova']:.3f}")
+    print(f"  Friedman 檢定: χ² = {rm['chi2']:.2f}, p = {rm['p_friedman']:.3f}")
+
+def repeated_measures_summary(statistics, data):
+    """統計表所列問卷的重複量數 ANOVA 與 Friedman 檢定 (見 score_matrix.repeated_measures)"""
+    matrix = ScoreMatrix.from_long(data, 'path', QUIZ_COLUMN, SCORE_COLUMN, questionnaires=list(statistics[QUIZ_COLUMN]))
+    return repeated_measures(matrix)
+
+def print_tests(tests):
+    """輸出兩兩比較的檢定結果"""
+    print(f"\n兩兩比較 ({tests['method'].iloc[0] if len(tests) else ''}):")
+    for row in tests.itertuples(index=False):
+        print(f"  {row.name_a} vs {row.name_b}: p = {row.p_value:.3f}{row.marker}")
+
+def _json_value(value):
+    """NumPy 純量轉成 Python 型別，NaN 轉成 null (JSON 不允許 NaN)"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def _json_records(table):
+    return [{key: _json_value(value) for key, value in row.items()} for row in table.to_dict('records')]
+
+def statistics_to_json(root_directory, statistics, tests=None, repeated=None):
+    """stats --format json 的輸出內容 (字典)"""
+    result = {'root': root_directory, 'statistics': _json_records(statistics)}
+    if tests is not None:
+        result['tests'] = _json_records(tests)
+    if repeated is not None:
+        result['repeated_measures'] = {key: _json_value(value) for key, value in repeated.items()}
+    return result
+
+def run_stats(args):
+    """stats 子命令: 只輸出數值，不載入 matplotlib；--tests 時才載入 scipy"""
+    # json 模式下讀檔錯誤等訊息改印到 stderr，stdout 只留 JSON
+    with contextlib.redirect_stdout(sys.stderr if args.format == 'json' else sys.stdout):
+        statistics, data = analyze_scores(args.root, remove_outliers=not args.keep_outliers)
+        tests = repeated = None
+        if args.tests:
+            tests = compare_groups(statistics, data, method=args.method, seed=args.seed)
+            repeated = repeated_measures_summary(statistics, data)
+
+    if args.format == 'json':
+        json.dump(statistics_to_json(args.root, statistics, tests, repeated), sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return 0
+    print_statistics(statistics, data, repeated=False)
+    if args.tests:
+        print_tests(tests)
+        print(f"\n重複量數分析 (完整作答 n={repeated['n']}):")
+        print(f"  重複量數 ANOVA: F({repeated['df_conditions']}, {repeated['df_error']}) = {repeated['f_stat']:.2f}, "
+              f"p = {repeated['p_anova']:.3f}")
+        print(f"  Friedman 檢定: χ² = {repeated['chi2']:.2f}, p = {repeated['p_friedman']:.3f}")
+    return 0
+
+def run_plot(args):
+    """plot 子命令 (原本的預設行為): 繪製箱形圖；--batch 時各組別平行輸出"""
     # 自定義 x 軸標籤（順序需與統計資料一致）
     custom_labels = ['base', 'stress', 'music']
     
+    if args.batch:
+        start = time.perf_counter()
+        results = render_cohorts(args.root, args.output, processes=args.processes, method=args.method,
+                                 seed=args.seed, custom_labels=custom_labels)
+        for name, image_path, table_path, error in results:
+            if error:
+                print(f"❌ {name}: {error}")
+            else:
+                print(f"✅ {name}: {image_path}, {table_path}")
+        print(f"共處理 {len(results)} 個組別，耗時 {time.perf_counter() - start:.2f} 秒")
+        return 0 if all(error is None for *_, error in results) else 1
+    
+    import matplotlib.pyplot as plt
+
+    # 分析數據時啟用離群值剔除 (remove_outliers=True)
+    statistics, data = analyze_scores(args.root, remove_outliers=True)
+    
     # 繪製圖表並傳入自定義標籤
-    plt_obj = plot_scores_with_boxplot(statistics, custom_labels=custom_labels)
+    tests = compare_groups(statistics, data, method=args.method, seed=args.seed)
+    fig = plot_scores_with_boxplot(statistics, data, custom_labels=custom_labels, tests=tests)
     
     # 儲存圖表
-    plt_obj.savefig('合併.png', dpi=300, bbox_inches='tight')
+    fig.savefig('合併.png', dpi=300, bbox_inches='tight')
     
     # 顯示圖表
-    plt_obj.show()
+    if not args.no_show:
+        plt.show()
     
-    # 輸出數值統計結果
-    print("\n數值統計結果：")
-    for i, name in enumerate(statistics['names']):
-        print(f"{name}:")
-        print(f"  樣本數(n): {statistics['counts'][i]}")
-        print(f"  平均值: {statistics['means'][i]:.2f}")
-        print(f"  中位數: {statistics['medians'][i]:.2f}")
-        print(f"  第一四分位數(Q1): {statistics['q1'][i]:.2f}")
-        print(f"  第三四分位數(Q3): {statistics['q3'][i]:.2f}")
-        print(f"  最小值: {statistics['mins'][i]:.2f}")
-        print(f"  最大值: {statistics['maxs'][i]:.2f}")
+    print_statistics(statistics, data)
+    return 0
+
+def run_benchmark(args):
+    """benchmark 子命令: 量測 stats --format json 的啟動時間，超過預算或載入了繪圖 / 檢定套件即失敗"""
+    from startup_benchmark import measure_startup, print_report, python_command
+
+    command = python_command(os.path.abspath(__file__), 'stats', '--format', 'json', '--root', args.root)
+    report = measure_startup(command, repeat=args.repeat, budget=args.budget, forbidden=STATS_FORBIDDEN_MODULES,
+                             top=args.top)
+    if args.format == 'json':
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
         print()
+    else:
+        print_report(report)
+    return 0 if report['passed'] else 1
+
+def run_watch(args):
+    """watch 子命令: 交給 score_watch.watch() 做增量監看"""
+    from score_watch import watch
+    return watch(args)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='問卷分數統計與箱形圖')
+    subparsers = parser.add_subparsers(dest='command', metavar='{stats,plot,benchmark,watch}')
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--root', type=str, default='merge', help='參與者資料夾的根目錄')
+
+    stats_parser = subparsers.add_parser('stats', parents=[common], help='只輸出數值統計 (不載入 matplotlib)')
+    stats_parser.add_argument('--format', choices=['text', 'json'], default='text', help='輸出格式')
+    stats_parser.add_argument('--keep-outliers', action='store_true', help='不以 IQR 方法剔除離群值')
+    stats_parser.add_argument('--tests', action='store_true', help='加上兩兩比較與重複量數分析 (會載入 scipy)')
+    stats_parser.add_argument('--method', choices=TEST_METHODS, default='ttest', help='兩兩比較的檢定方法')
+    stats_parser.add_argument('--seed', type=int, default=None, help='置換檢定的亂數種子')
+
+    plot_parser = subparsers.add_parser('plot', parents=[common], help='繪製箱形圖 (預設)')
+    plot_parser.add_argument('--batch', action='store_true',
+                             help='對 root 下每個組別資料夾分別分析，以 Agg 後端平行輸出圖表與統計表 (不開視窗)')
+    plot_parser.add_argument('--output', type=str, default='output', help='批次模式的輸出資料夾')
+    plot_parser.add_argument('--processes', type=int, default=None, help='批次模式的進程數 (預設為 CPU 核心數)')
+    plot_parser.add_argument('--method', choices=TEST_METHODS, default='ttest', help='兩兩比較的檢定方法')
+    plot_parser.add_argument('--seed', type=int, default=None, help='置換檢定的亂數種子')
+    plot_parser.add_argument('--no-show', action='store_true', help='只儲存圖檔，不開啟視窗')
+
+    bench_parser = subparsers.add_parser('benchmark', parents=[common], help='量測 stats 路徑的啟動時間')
+    bench_parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_S, help='啟動時間預算 (秒)')
+    bench_parser.add_argument('--repeat', type=int, default=5, help='重複執行次數')
+    bench_parser.add_argument('--top', type=int, default=10, help='列出 import 最耗時的前幾個模組')
+    bench_parser.add_argument('--format', choices=['text', 'json'], default='text', help='輸出格式')
+
+    # score_watch 只多匯入本檔已載入的套件 (matplotlib 在輸出圖表時才載入)，不影響 stats 的啟動時間
+    from score_watch import add_watch_arguments
+    watch_parser = subparsers.add_parser('watch', parents=[common], help='監看資料夾並增量更新統計')
+    add_watch_arguments(watch_parser)
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # 相容舊的用法 (無子命令，例如 `統計分析.py --batch`): 視為 plot
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ('-h', '--help')):
+        argv = ['plot'] + argv
+    args = build_parser().parse_args(argv)
+    handlers = {'stats': run_stats, 'plot': run_plot, 'benchmark': run_benchmark, 'watch': run_watch}
+    return handlers[args.command](args)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())